@@ -0,0 +1,13 @@
+# Accès au cœur de calcul (matrice_core, à la racine du dépôt) depuis les scripts de benchmarks/
+import os
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_MATRICE = os.path.join(RACINE, "Moderne matrice GEMINI_gui_finale_v8 ligne 59 TOP_06 juillet.py")
+MODELE_LIVRE = os.path.join(RACINE, "moderne--matrice_remplie_lignes 59 gemini ___niv 2.xlsm")
+
+
+def charger_matrice():
+    if RACINE not in sys.path: sys.path.insert(0, RACINE)
+    import matrice_core
+    return matrice_core
@@ -0,0 +1,67 @@
+"""Vérification et benchmark du solveur de budget cible (solve_budget).
+
+Pour des études et des budgets tirés au hasard, la valeur renvoyée (nombre de patients ou de visites)
+est comparée à une recherche exhaustive par compute_matrix : c'est la plus grande valeur dont le total
+général, arrondi au centime, ne dépasse pas le budget. La durée d'une résolution est ensuite comparée
+à celle de cette recherche « par essais » (une génération en mémoire par valeur essayée).
+
+    python benchmarks/bench_budget.py [--etudes 300] [--graine 0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+
+matrice = charger_matrice()
+
+def etude_aleatoire(aleatoire):
+    return {"niveau": aleatoire.choice(matrice.NIVEAUX), "patients": aleatoire.randint(1, 50), "visites": aleatoire.randint(2, 16),
+            "centre": aleatoire.choice(matrice.TYPES_CENTRE), "duree": aleatoire.randint(1, 5), "pages_crf": aleatoire.randint(0, 60),
+            "avenants": aleatoire.randint(0, 3), "monitoring": aleatoire.randint(0, 8), "auto_q_count": aleatoire.choice(["", 3, 8]),
+            "auto_q_format": aleatoire.choice(matrice.FORMATS_AUTO_Q), "personnel": aleatoire.random() < 0.5,
+            "prelevements_sang": aleatoire.choice(["", 4])}
+
+def par_essais(modele, params, budget, champ):
+    # Ancienne méthode : on augmente la valeur jusqu'à dépasser le budget
+    valeur = None
+    for essai in range(matrice.BUDGET_FIELDS[champ], 100000):
+        if round(matrice.compute_matrix(modele, {**params, champ: essai})[1], 2) > budget: break
+        valeur = essai
+    return valeur
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--etudes", type=int, default=300)
+    parser.add_argument("--graine", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    modele = matrice.load_template_model(MODELE_LIVRE)
+    aleatoire, ecarts = random.Random(args.graine), 0
+    durees = {champ: [0.0, 0.0, 0] for champ in matrice.BUDGET_FIELDS}
+    for _ in range(args.etudes):
+        champ = aleatoire.choice(list(matrice.BUDGET_FIELDS))
+        params = matrice.parse_budget_params(etude_aleatoire(aleatoire), champ)
+        budget = round(aleatoire.uniform(1000, 500000), 2)
+        debut = time.perf_counter()
+        solution = matrice.solve_budget(modele, params, budget, champ)
+        milieu = time.perf_counter()
+        attendu = par_essais(modele, params, budget, champ)
+        fin = time.perf_counter()
+        durees[champ][0] += milieu - debut
+        durees[champ][1] += fin - milieu
+        durees[champ][2] += 1
+        if solution["valeur"] != attendu:
+            ecarts += 1
+            print(f"  ÉCART {champ} budget {budget} : {solution['valeur']} au lieu de {attendu}")
+    for champ, (solveur, essais, nombre) in durees.items():
+        if nombre:
+            print(f"{champ:<9} {nombre:>5} résolution(s) | solveur {solveur / nombre * 1000:8.3f} ms | par essais {essais / nombre * 1000:8.3f} ms")
+    print(f"Comparaison avec la recherche exhaustive : {ecarts} écart(s).")
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Benchmark du démarrage : durée d'import et délai jusqu'à la première fenêtre.
+
+Chaque mesure est faite dans un nouveau processus Python (interpréteur démarré à froid, fichiers
+.pyc déjà compilés par une première exécution non comptée) :
+- import_coeur : import de matrice_core seul (usage sans interface), avec les modules lourds
+  (tkinter, openpyxl, numpy) qu'il a chargés ;
+- import_script : import du script principal, sans lancer l'interface ;
+- premiere_fenetre : délai entre le lancement du processus et le premier affichage de la fenêtre
+  principale (événement <Map>), mesuré seulement si un affichage graphique est disponible.
+--reference mesure aussi une version antérieure du dépôt (extraite avec git archive), pour
+comparer avant / après.
+
+    python benchmarks/bench_demarrage.py [--repetitions 10] [--reference COMMIT] [--sortie bench_demarrage.json]
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import RACINE, SCRIPT_MATRICE
+
+MODULE_COEUR = "matrice_core.py"
+MODULES_LOURDS = ["tkinter", "openpyxl", "numpy"]
+
+# Processus de mesure de l'import : argv = [fichier, nom du module, instant du lancement]
+CODE_IMPORT = """
+import importlib.util, json, sys, time
+debut = time.perf_counter()
+spec = importlib.util.spec_from_file_location(sys.argv[2], sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+duree = time.perf_counter() - debut
+print(json.dumps({"secondes": duree, "modules": [nom for nom in %r if nom in sys.modules]}))
+""" % (MODULES_LOURDS,)
+
+# Processus de mesure de la première fenêtre : argv = [script, instant du lancement (time.time())].
+# Le script est exécuté comme depuis la ligne de commande ; la fenêtre principale est fermée dès
+# son premier affichage.
+CODE_FENETRE = """
+import runpy, sys, time, tkinter
+lancement = float(sys.argv[2])
+tk_init = tkinter.Tk.__init__
+def init(self, *args, **kwargs):
+    tk_init(self, *args, **kwargs)
+    def affichee(event):
+        if event.widget is not self or getattr(self, "_premier_affichage", False): return
+        self._premier_affichage = True
+        print(time.time() - lancement, flush=True)
+        self.after_idle(self.destroy)
+    self.bind("<Map>", affichee, add="+")
+tkinter.Tk.__init__ = init
+sys.argv = [sys.argv[1]]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def executer(code, arguments, dossier):
+    # Renvoie (sortie standard, erreur) ; l'instant du lancement est passé en dernier argument
+    resultat = subprocess.run([sys.executable, "-c", code, *arguments, str(time.time())], cwd=dossier, capture_output=True, text=True, timeout=120)
+    if resultat.returncode != 0:
+        return None, (resultat.stderr.strip().splitlines() or [f"code de sortie {resultat.returncode}"])[-1]
+    return resultat.stdout.strip(), None
+
+def mesurer_import(fichier, nom, dossier, repetitions):
+    executer(CODE_IMPORT, [fichier, nom], dossier)  # compilation des .pyc, non comptée
+    durees, modules = [], []
+    for _ in range(repetitions):
+        sortie, erreur = executer(CODE_IMPORT, [fichier, nom], dossier)
+        if erreur: return {"erreur": erreur}
+        mesure = json.loads(sortie)
+        durees.append(mesure["secondes"])
+        modules = mesure["modules"]
+    return {"secondes": statistics.median(durees), "min": min(durees), "modules_lourds": modules}
+
+def mesurer_fenetre(script, dossier, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        sortie, erreur = executer(CODE_FENETRE, [script], dossier)
+        if erreur: return {"erreur": erreur}
+        durees.append(float(sortie))
+    return {"secondes": statistics.median(durees), "min": min(durees)}
+
+def mesurer_version(dossier, repetitions):
+    script = os.path.join(dossier, os.path.basename(SCRIPT_MATRICE))
+    resultat = {}
+    coeur = os.path.join(dossier, MODULE_COEUR)
+    if os.path.exists(coeur): resultat["import_coeur"] = mesurer_import(coeur, "matrice_core", dossier, repetitions)
+    resultat["import_script"] = mesurer_import(script, "matrice", dossier, repetitions)
+    resultat["premiere_fenetre"] = mesurer_fenetre(script, dossier, repetitions)
+    return resultat
+
+def extraire_version(revision, dossier):
+    archive = subprocess.run(["git", "-C", RACINE, "archive", "--format=tar", revision], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dossier)
+
+def version_code(revision="HEAD"):
+    try:
+        return subprocess.run(["git", "-C", RACINE, "rev-parse", "--short", revision], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def afficher(nom, resultat):
+    print(f"\n{nom}")
+    for mesure, valeurs in resultat.items():
+        if "erreur" in valeurs:
+            print(f"  {mesure:<18} non mesuré ({valeurs['erreur']})")
+            continue
+        modules = f"  modules lourds : {', '.join(valeurs['modules_lourds']) or 'aucun'}" if "modules_lourds" in valeurs else ""
+        print(f"  {mesure:<18} {valeurs['secondes'] * 1000:8.1f} ms (min {valeurs['min'] * 1000:.1f} ms){modules}")
+
+def comparer(reference, actuel):
+    print("\nComparaison (référence -> version de travail) :")
+    for mesure, valeurs in actuel.items():
+        avant = reference.get(mesure)
+        if not avant or "secondes" not in avant or "secondes" not in valeurs: continue
+        print(f"  {mesure:<18} {avant['secondes'] * 1000:8.1f} -> {valeurs['secondes'] * 1000:8.1f} ms (x{avant['secondes'] / valeurs['secondes']:.2f})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--reference", metavar="REVISION", help="Version git à mesurer aussi pour comparaison (ex. un commit ou une étiquette).")
+    parser.add_argument("--sortie", default="bench_demarrage.json", help="Fichier JSON des résultats (défaut : %(default)s).")
+    args = parser.parse_args(argv)
+
+    resultats = {"travail": mesurer_version(RACINE, args.repetitions)}
+    afficher(f"Version de travail ({version_code()})", resultats["travail"])
+    if args.reference:
+        dossier = tempfile.mkdtemp(prefix="bench_demarrage_")
+        try:
+            extraire_version(args.reference, dossier)
+            resultats["reference"] = mesurer_version(dossier, args.repetitions)
+        finally:
+            shutil.rmtree(dossier, ignore_errors=True)
+        afficher(f"Référence {args.reference} ({version_code(args.reference)})", resultats["reference"])
+        comparer(resultats["reference"], resultats["travail"])
+
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "version": version_code(),
+            "reference": args.reference and version_code(args.reference),
+            "python": platform.python_version(),
+            "plateforme": platform.platform(),
+            "repetitions": args.repetitions,
+            "resultats": resultats,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nRésultats : {args.sortie}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Vérification et benchmark de l'échéancier patient × visite × acte (write_schedule).
+
+Pour des études de taille croissante (matrice livrée), l'échéancier est écrit en CSV (et en .xlsx
+avec --xlsx) en mesurant la durée puis le pic mémoire (tracemalloc) : le pic doit rester le même
+quel que soit le nombre de patients. Le fichier écrit est ensuite relu et ses sous-totaux par
+ligne de la matrice, recalculés en décimal exact, comparés aux colonnes E et G de compute_matrix.
+
+    python benchmarks/bench_echeancier.py [--patients 10 100 1000 5000] [--visites 12] [--xlsx]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+
+matrice = charger_matrice()
+
+ETUDE = {"niveau": "2", "visites": 12, "centre": "Associé", "duree": 3, "pages_crf": 12, "avenants": 1, "monitoring": 6,
+         "auto_q_count": 7, "auto_q_format": "papier", "personnel": True, "prelevements_sang": 5, "pk_pd": 20}
+
+def sous_totaux_csv(fichier):
+    # {ligne: [quantité, montant]} relus dans l'échéancier CSV
+    totaux = {}
+    with open(fichier, newline="", encoding="utf-8-sig") as f:
+        for ligne in csv.DictReader(f, delimiter=";"):
+            total = totaux.setdefault(int(ligne["ligne"]), [Decimal(0), Decimal(0)])
+            total[0] += Decimal(ligne["quantite"])
+            total[1] += Decimal(ligne["montant"])
+    return totaux
+
+def sous_totaux_xlsx(fichier):
+    totaux = {}
+    classeur = matrice.load_workbook(fichier, read_only=True)
+    try:
+        for feuille in classeur.worksheets:
+            if not feuille.title.startswith("Échéancier"): continue
+            for ligne in feuille.iter_rows(min_row=2, values_only=True):
+                total = totaux.setdefault(ligne[3], [Decimal(0), Decimal(0)])
+                total[0] += Decimal(repr(ligne[6]))
+                total[1] += Decimal(repr(ligne[8]))
+    finally:
+        classeur.close()
+    return totaux
+
+def verifier(modele, params, fichier, relire):
+    # Nombre de lignes de la matrice dont la quantité ou le total ne se retrouve pas dans le fichier
+    resultats, _ = matrice.compute_matrix(modele, params)
+    lignes = {ligne["row"]: ligne for ligne in modele["lines"]}
+    totaux, ecarts = relire(fichier), 0
+    for row, quantite, _, total_centre, _ in resultats:
+        fixe = matrice.LINE_RULE_FUNCTIONS[lignes[row]["rule"]](lignes[row], params)[4]
+        quantite_attendue = Decimal(repr(quantite)) * (1 if fixe else params["patients"])
+        quantite_lue, total_lu = totaux.get(row, [Decimal(0), Decimal(0)])
+        if quantite_lue != quantite_attendue or abs(total_lu - Decimal(repr(total_centre))) >= Decimal("0.000001"):
+            ecarts += 1
+            print(f"  ÉCART ligne {row}: {quantite_lue} / {quantite_attendue}, {total_lu} / {total_centre}")
+    return ecarts
+
+def mesurer(modele, params, fichier):
+    # Durée mesurée sans tracemalloc (qui ralentit nettement l'écriture), pic mémoire sur une seconde écriture
+    debut = time.perf_counter()
+    matrice.write_schedule(modele, params, fichier)
+    duree = time.perf_counter() - debut
+    tracemalloc.start()
+    resume = matrice.write_schedule(modele, params, fichier)
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return resume, duree, pic
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--visites", type=int, default=ETUDE["visites"])
+    parser.add_argument("--xlsx", action="store_true", help="Mesure aussi l'écriture .xlsx (openpyxl en mode write_only, nettement plus lente).")
+    args = parser.parse_args(argv)
+
+    modele = matrice.load_template_model(MODELE_LIVRE)
+    formats = [(".csv", sous_totaux_csv)] + ([(".xlsx", sous_totaux_xlsx)] if args.xlsx else [])
+    ecarts = 0
+    with tempfile.TemporaryDirectory() as dossier:
+        for patients in args.patients:
+            params = matrice.parse_study_params(dict(ETUDE, patients=patients, visites=args.visites))
+            for extension, relire in formats:
+                fichier = os.path.join(dossier, "etude" + matrice.SCHEDULE_SUFFIX + extension)
+                resume, duree, pic = mesurer(modele, params, fichier)
+                ecarts += len(resume["ecarts"]) + verifier(modele, params, fichier, relire)
+                print(f"{patients:>7} patients {extension:<5} | {resume['lignes']:>9} lignes en {duree:7.3f} s | pic {pic / 1e6:6.2f} Mo"
+                      f" | total {matrice.format_euros(resume['total_matrice'])} €")
+    print(f"Rapprochement avec la matrice : {ecarts} écart(s).")
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Benchmark de la génération et de l'effacement sur des matrices synthétiques de 60 à 50 000 lignes.
+
+Les modèles synthétiques reprennent la matrice livrée (feuille SHEET_NAME, macros, styles) :
+les lignes de données de la matrice livrée sont répétées à partir de START_ROW jusqu'à la taille
+voulue, suivies de la ligne END_ROW_MARKER. Chaque opération est chronométrée phase par phase
+(phases signalées par le paramètre progress de generate_matrix_logic / clear_matrix) ; un second
+passage, sous tracemalloc, relève le pic mémoire de chaque phase. Sans interface graphique.
+
+    python benchmarks/bench_generation.py [--lignes 60 500 5000 50000] [--repetitions 3]
+                                          [--sortie bench_generation.json] [--comparer ancien.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import copy
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, RACINE, charger_matrice
+
+matrice = charger_matrice()
+
+OPERATIONS = [
+    # (nom, fonction, cache d'analyse présent)
+    ("generation", "generer", False),
+    ("generation_cache", "generer", True),
+    ("generation_rapide", "generer_rapide", False),
+    ("generation_rapide_cache", "generer_rapide", True),
+    ("effacement", "effacer", True),
+    ("effacement_rapide", "effacer_rapide", True),
+]
+PARAMETRES = {"niveau": "2", "patients": "25", "visites": "8", "centre": "Associé", "duree": "3", "pages_crf": "40",
+              "avenants": "1", "monitoring": "6", "auto_q_count": "4", "auto_q_format": "électronique", "personnel": "1"}
+
+
+def construire_modele(chemin, nombre):
+    # Copie de la matrice livrée dont les lignes de données sont répétées jusqu'à "nombre" lignes
+    workbook = openpyxl.load_workbook(MODELE_LIVRE, keep_vba=True)
+    sheet = workbook[matrice.SHEET_NAME]
+    premiere, derniere, _ = matrice.find_data_rows(sheet)
+    while derniere > premiere and not sheet.cell(row=derniere, column=matrice.COL_DESIGNATION).value: derniere -= 1
+    lignes = [[(cell.value, copy(cell._style)) for cell in row[:matrice.COL_CONSIGNES]]
+              for row in sheet.iter_rows(min_row=premiere, max_row=derniere)]
+    for merged in list(sheet.merged_cells.ranges):
+        if merged.min_row >= matrice.START_ROW: sheet.unmerge_cells(str(merged))
+    sheet.print_area = None
+    sheet.delete_rows(matrice.START_ROW, sheet.max_row)
+    for i in range(nombre):
+        for c, (value, style) in enumerate(lignes[i % len(lignes)], 1):
+            cell = sheet.cell(row=matrice.START_ROW + i, column=c, value=value)
+            cell._style = copy(style)
+    sheet.cell(row=matrice.START_ROW + nombre, column=matrice.COL_DESIGNATION, value=matrice.END_ROW_MARKER)
+    workbook.save(chemin)
+
+
+class Phases:
+    # Rappel progress : mesure la durée (et, si memoire, le pic tracemalloc) de chaque phase
+    def __init__(self, memoire=False):
+        self.memoire, self.phase, self.resultats = memoire, None, {}
+        self.debut = time.perf_counter()
+
+    def __call__(self, phase, fait=0, total=0):
+        if phase != self.phase: self._cloturer(phase)
+
+    def _cloturer(self, suivante=None):
+        maintenant = time.perf_counter()
+        if self.phase is not None:
+            mesure = self.resultats.setdefault(self.phase, {"secondes": 0.0})
+            mesure["secondes"] += maintenant - self.debut
+            if self.memoire: mesure["pic_memoire_mo"] = max(mesure.get("pic_memoire_mo", 0.0), tracemalloc.get_traced_memory()[1] / 2**20)
+        if self.memoire: tracemalloc.reset_peak()
+        self.phase, self.debut = suivante, time.perf_counter()
+
+    def terminer(self):
+        self._cloturer()
+        return self.resultats
+
+
+def executer(operation, modele, sortie, phases):
+    params = matrice.parse_study_params(PARAMETRES)
+    if operation == "generer": matrice.generate_matrix_logic(modele, sortie, params, progress=phases)
+    elif operation == "generer_rapide": matrice.generate_matrix_logic(modele, sortie, params, fast_save=True, progress=phases)
+    elif operation == "effacer": matrice.clear_matrix(sortie, progress=phases)
+    elif operation == "effacer_rapide": matrice.clear_matrix(sortie, fast_save=True, progress=phases)
+
+def preparer(operation, avec_cache, modele, rempli, sortie):
+    # Non chronométré : état du cache d'analyse et fichier à effacer
+    cache = matrice.template_cache_path(modele)
+    if avec_cache: matrice.load_template_model(modele)
+    elif os.path.exists(cache): os.remove(cache)
+    if operation.startswith("effacer"): shutil.copyfile(rempli, sortie)
+
+def mesurer_operation(nom, operation, avec_cache, modele, rempli, dossier, repetitions):
+    sortie = os.path.join(dossier, f"{nom}.xlsm")
+    meilleur = None
+    for _ in range(repetitions):
+        preparer(operation, avec_cache, modele, rempli, sortie)
+        phases = Phases()
+        debut = time.perf_counter()
+        executer(operation, modele, sortie, phases)
+        total = time.perf_counter() - debut
+        resultats = phases.terminer()
+        if meilleur is None or total < meilleur["secondes"]: meilleur = {"secondes": total, "phases": resultats}
+
+    preparer(operation, avec_cache, modele, rempli, sortie)
+    tracemalloc.start()
+    try:
+        phases = Phases(memoire=True)
+        executer(operation, modele, sortie, phases)
+        memoire = phases.terminer()
+    finally:
+        tracemalloc.stop()
+    for phase, mesure in memoire.items():
+        if phase in meilleur["phases"]: meilleur["phases"][phase]["pic_memoire_mo"] = round(mesure["pic_memoire_mo"], 2)
+    meilleur["pic_memoire_mo"] = round(max((mesure["pic_memoire_mo"] for mesure in memoire.values()), default=0.0), 2)
+    return meilleur
+
+def mesurer_detail(modele):
+    # Étapes internes sur le classeur déjà chargé (hors rappel progress)
+    workbook = openpyxl.load_workbook(modele, keep_vba=True)
+    sheet = workbook[matrice.SHEET_NAME]
+    detail = {}
+    debut = time.perf_counter()
+    matrice.find_data_rows(sheet)
+    detail["find_data_rows"] = time.perf_counter() - debut
+    matrice.classify_designation.cache_clear()
+    debut = time.perf_counter()
+    model = matrice.analyse_template(sheet)
+    detail["analyse_template"] = time.perf_counter() - debut
+    debut = time.perf_counter()
+    matrice.compute_matrix(model, matrice.parse_study_params(PARAMETRES))
+    detail["compute_matrix"] = time.perf_counter() - debut
+    return {etape: round(secondes, 6) for etape, secondes in detail.items()}, len(model["lines"])
+
+def version_code():
+    try:
+        return subprocess.run(["git", "-C", RACINE, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def afficher(resultat):
+    print(f"\n{resultat['lignes']} lignes ({resultat['lignes_calculees']} calculées), modèle {resultat['taille_modele_ko']} Ko")
+    for nom, mesure in resultat["operations"].items():
+        phases = ", ".join(f"{phase} {m['secondes']:.3f}s/{m.get('pic_memoire_mo', 0):.1f}Mo" for phase, m in mesure["phases"].items())
+        print(f"  {nom:<24} {mesure['secondes']:8.3f} s  pic {mesure['pic_memoire_mo']:8.1f} Mo  [{phases}]")
+    print("  détail : " + ", ".join(f"{etape} {secondes:.4f}s" for etape, secondes in resultat["detail"].items()))
+
+def comparer(resultats, ancien_fichier):
+    with open(ancien_fichier, encoding="utf-8") as f:
+        ancien = {r["lignes"]: r for r in json.load(f)["resultats"]}
+    print(f"\nComparaison avec {ancien_fichier} (ancien -> nouveau) :")
+    for resultat in resultats:
+        reference = ancien.get(resultat["lignes"])
+        if not reference: continue
+        for nom, mesure in resultat["operations"].items():
+            avant = reference["operations"].get(nom)
+            if avant: print(f"  {resultat['lignes']:>6} {nom:<24} {avant['secondes']:8.3f} -> {mesure['secondes']:8.3f} s (x{avant['secondes'] / mesure['secondes']:.2f})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, nargs="+", default=[60, 500, 5000, 50000])
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--operations", nargs="+", choices=[nom for nom, _, _ in OPERATIONS], default=[nom for nom, _, _ in OPERATIONS])
+    parser.add_argument("--sortie", default="bench_generation.json", help="Fichier JSON des résultats (défaut : %(default)s).")
+    parser.add_argument("--comparer", metavar="JSON", help="Résultats d'une version précédente à comparer.")
+    parser.add_argument("--dossier", help="Dossier de travail conservé (défaut : dossier temporaire supprimé).")
+    args = parser.parse_args(argv)
+
+    dossier = args.dossier or tempfile.mkdtemp(prefix="bench_matrice_")
+    os.makedirs(dossier, exist_ok=True)
+    resultats = []
+    try:
+        for nombre in args.lignes:
+            modele = os.path.join(dossier, f"modele_{nombre}.xlsm")
+            rempli = os.path.join(dossier, f"rempli_{nombre}.xlsm")
+            construire_modele(modele, nombre)
+            matrice.generate_matrix_logic(modele, rempli, matrice.parse_study_params(PARAMETRES))
+            detail, calculees = mesurer_detail(modele)
+            resultat = {"lignes": nombre, "lignes_calculees": calculees, "taille_modele_ko": os.path.getsize(modele) // 1024,
+                        "detail": detail, "operations": {}}
+            for nom, operation, avec_cache in OPERATIONS:
+                if nom in args.operations:
+                    resultat["operations"][nom] = mesurer_operation(nom, operation, avec_cache, modele, rempli, dossier, args.repetitions)
+            afficher(resultat)
+            resultats.append(resultat)
+    finally:
+        if not args.dossier: shutil.rmtree(dossier, ignore_errors=True)
+
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "version": version_code(),
+            "python": platform.python_version(),
+            "openpyxl": openpyxl.__version__,
+            "plateforme": platform.platform(),
+            "processeurs": os.cpu_count(),
+            "repetitions": args.repetitions,
+            "resultats": resultats,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nRésultats : {args.sortie}")
+    if args.comparer: comparer(resultats, args.comparer)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
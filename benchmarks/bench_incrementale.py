@@ -0,0 +1,84 @@
+"""Vérification et benchmark de la mise à jour incrémentale d'une matrice déjà remplie (update_matrix).
+
+Une matrice est d'abord générée complètement, puis un seul paramètre de l'étude est modifié à chaque
+étape et la même matrice est mise à jour (enregistrement rapide, puis openpyxl une étape sur trois).
+Après chaque étape, la feuille obtenue (valeurs et remplissages) doit être identique à celle d'une
+génération complète avec les mêmes paramètres. Avec --lignes, la durée d'une mise à jour est comparée
+à celle d'une génération complète sur des modèles synthétiques (même mise en page que la matrice livrée).
+
+    python benchmarks/bench_incrementale.py [--etapes 12] [--graine 0] [--lignes 500 5000 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+from bench_generation import construire_modele
+
+matrice = charger_matrice()
+
+ETUDE = {"niveau": "2", "patients": 10, "visites": 6, "centre": "Associé", "duree": 2, "pages_crf": 12, "avenants": 0, "monitoring": 3}
+MODIFICATIONS = {"avenants": [0, 1, 2, 3], "patients": [1, 10, 25, 120], "visites": [2, 6, 12], "monitoring": [0, 3, 8],
+                 "niveau": matrice.NIVEAUX, "auto_q_count": ["", 3, 8], "personnel": [False, True]}
+
+def contenu_feuille(fichier):
+    sheet = openpyxl.load_workbook(fichier)[matrice.SHEET_NAME]
+    return [(cell.coordinate, cell.value, cell.fill.fgColor.rgb) for row in sheet.iter_rows(max_col=matrice.COL_CONSIGNES) for cell in row]
+
+def verifier(etapes, graine):
+    aleatoire, etude, ecarts = random.Random(graine), dict(ETUDE), 0
+    with tempfile.TemporaryDirectory() as dossier:
+        sortie, reference = os.path.join(dossier, "matrice.xlsm"), os.path.join(dossier, "reference.xlsm")
+        for etape in range(etapes):
+            if etape:
+                champ = aleatoire.choice(sorted(MODIFICATIONS))
+                etude[champ] = aleatoire.choice(MODIFICATIONS[champ])
+            rapide = etape % 3 != 2
+            params = matrice.parse_study_params(etude)
+            debut = time.perf_counter()
+            rapport = matrice.update_matrix(MODELE_LIVRE, sortie, params, fast_save=rapide)
+            duree = time.perf_counter() - debut
+            matrice.generate_matrix_logic(MODELE_LIVRE, reference, params)
+            identique = contenu_feuille(sortie) == contenu_feuille(reference)
+            ecarts += not identique
+            print(f"  étape {etape:>2} {'rapide' if rapide else 'openpyxl':<8} | {rapport['mode']:<12} | {len(rapport['lignes']):>3} ligne(s), "
+                  f"{rapport['cellules']:>4} cellule(s) en {duree * 1000:7.1f} ms" + ("" if identique else " | ÉCART avec la génération complète"))
+    return ecarts
+
+def mesurer(nombre_lignes, dossier):
+    modele, sortie = os.path.join(dossier, f"modele_{nombre_lignes}.xlsm"), os.path.join(dossier, f"matrice_{nombre_lignes}.xlsm")
+    construire_modele(modele, nombre_lignes)
+    params, modifie = matrice.parse_study_params(ETUDE), matrice.parse_study_params(dict(ETUDE, avenants=ETUDE["avenants"] + 1))
+    matrice.load_template_model(modele)  # analyse mise en cache, comme après une première génération
+    for rapide in (True, False):
+        debut = time.perf_counter()
+        matrice.generate_matrix_logic(modele, sortie, params, fast_save=rapide)
+        complete = time.perf_counter() - debut
+        matrice.update_matrix(modele, sortie, params, fast_save=rapide)
+        debut = time.perf_counter()
+        rapport = matrice.update_matrix(modele, sortie, modifie, fast_save=rapide)
+        incrementale = time.perf_counter() - debut
+        print(f"{nombre_lignes:>7} lignes {'rapide' if rapide else 'openpyxl':<8} | génération complète {complete:7.3f} s"
+              f" | mise à jour ({len(rapport['lignes'])} ligne(s), {rapport['cellules']} cellule(s)) {incrementale:7.3f} s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--etapes", type=int, default=12)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--lignes", type=int, nargs="*", default=[])
+    args = parser.parse_args(argv)
+
+    ecarts = verifier(args.etapes, args.graine)
+    print(f"Mises à jour successives sur la matrice livrée : {ecarts} écart(s).")
+    with tempfile.TemporaryDirectory() as dossier:
+        for nombre_lignes in args.lignes: mesurer(nombre_lignes, dossier)
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
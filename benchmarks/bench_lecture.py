@@ -0,0 +1,103 @@
+"""Vérification et benchmark de la lecture en flux de la feuille de la matrice (read_matrix_rows).
+
+Pour la matrice livrée, des matrices remplies (openpyxl et enregistrement rapide) et des modèles
+synthétiques de taille croissante, éventuellement accompagnés d'annexes (feuilles supplémentaires
+de --annexes lignes) :
+- les lignes lues en flux doivent être celles d'openpyxl en lecture seule (valeurs et formules, puis
+  valeurs en cache) jusqu'à la ligne "TOTAL GÉNÉRAL" ;
+- l'analyse du modèle et les totaux de compute_matrix doivent être identiques ;
+puis la durée et le pic mémoire (tracemalloc) de l'analyse sont comparés pour les deux lectures.
+
+    python benchmarks/bench_lecture.py [--lignes 500 5000 50000] [--annexes 20000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+from bench_generation import PARAMETRES, construire_modele
+
+matrice = charger_matrice()
+
+def lignes_openpyxl(fichier, data_only=False):
+    classeur = openpyxl.load_workbook(fichier, read_only=True, data_only=data_only)
+    try: return list(classeur[matrice.SHEET_NAME].iter_rows(min_row=1, max_col=matrice.COL_CONSIGNES, values_only=True))
+    finally: classeur.close()
+
+def analyse_openpyxl(fichier):
+    # Chemin précédent de load_template_model (cache d'analyse absent) : feuille entière lue en liste
+    return matrice.analyse_template_rows(lignes_openpyxl(fichier))
+
+def analyse_flux(fichier):
+    return matrice.analyse_template_rows(matrice.iter_matrix_rows(fichier))
+
+def ajouter_annexes(fichier, nombre_lignes):
+    # Deux feuilles d'annexe volumineuses (texte et nombres) avant et après la feuille de la matrice
+    classeur = openpyxl.load_workbook(fichier, keep_vba=True)
+    for position, titre in ((0, "Annexe 1"), (None, "Annexe 3")):
+        feuille = classeur.create_sheet(titre, position)
+        for r in range(1, nombre_lignes + 1): feuille.append([f"Acte {r}", r * 1.5, f"Commentaire {r % 97}", r])
+    classeur.save(fichier)
+
+def verifier(fichier):
+    ecarts = []
+    for data_only in (False, True):
+        attendu, lu = lignes_openpyxl(fichier, data_only), matrice.read_matrix_rows(fichier, data_only=data_only)
+        if attendu[:len(lu)] != lu: ecarts.append(f"lignes lues (data_only={data_only})")
+    modele_attendu, modele_lu = analyse_openpyxl(fichier), analyse_flux(fichier)
+    if modele_attendu != modele_lu: ecarts.append("analyse du modèle")
+    params = matrice.parse_study_params(PARAMETRES)
+    if matrice.compute_matrix(modele_attendu, params) != matrice.compute_matrix(modele_lu, params): ecarts.append("totaux")
+    return ecarts
+
+def mesurer(analyse, fichier):
+    debut = time.perf_counter()
+    analyse(fichier)
+    duree = time.perf_counter() - debut
+    tracemalloc.start()
+    analyse(fichier)
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duree, pic
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, nargs="*", default=[500, 5000, 50000])
+    parser.add_argument("--annexes", type=int, default=20000, help="Lignes de chaque feuille d'annexe ajoutée au plus grand modèle (0 : aucune).")
+    args = parser.parse_args(argv)
+
+    ecarts = 0
+    with tempfile.TemporaryDirectory() as dossier:
+        params = matrice.parse_study_params(PARAMETRES)
+        fichiers = [("matrice livrée", MODELE_LIVRE)]
+        for nom, rapide in (("remplie", False), ("remplie_rapide", True)):
+            fichier = os.path.join(dossier, nom + ".xlsm")
+            matrice.generate_matrix_logic(MODELE_LIVRE, fichier, params, fast_save=rapide)
+            fichiers.append((f"matrice {nom}", fichier))
+        for nombre in args.lignes:
+            fichier = os.path.join(dossier, f"modele_{nombre}.xlsm")
+            construire_modele(fichier, nombre)
+            fichiers.append((f"{nombre} lignes", fichier))
+        if args.lignes and args.annexes:
+            fichier = os.path.join(dossier, "modele_annexes.xlsm")
+            construire_modele(fichier, max(args.lignes))
+            ajouter_annexes(fichier, args.annexes)
+            fichiers.append((f"{max(args.lignes)} lignes + annexes", fichier))
+
+        for nom, fichier in fichiers:
+            erreurs = verifier(fichier)
+            ecarts += len(erreurs)
+            (duree_openpyxl, pic_openpyxl), (duree_flux, pic_flux) = mesurer(analyse_openpyxl, fichier), mesurer(analyse_flux, fichier)
+            print(f"{nom:<28} | openpyxl {duree_openpyxl:7.3f} s {pic_openpyxl / 1e6:7.1f} Mo | flux {duree_flux:7.3f} s {pic_flux / 1e6:7.1f} Mo"
+                  + (f" | ÉCART : {', '.join(erreurs)}" if erreurs else ""))
+    print(f"Comparaison avec openpyxl (lecture seule) : {ecarts} écart(s).")
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Vérification et benchmark des accès groupés aux fichiers sur un partage réseau simulé.
+
+Le partage est simulé localement, sans FUSE : dans ce processus, les fichiers d'un dossier « partage »
+sont ouverts à travers une enveloppe qui ajoute --latence millisecondes à chaque lecture, écriture,
+repositionnement ou vidage (et à chaque os.stat, os.replace ou os.remove), comme un aller-retour SMB.
+- les matrices générées, mises à jour (update_matrix) et effacées sur le partage (openpyxl et
+  enregistrement rapide) doivent être identiques à celles produites en local ;
+- un enregistrement interrompu (écriture refusée au milieu de la copie) doit laisser la destination
+  intacte, sans fichier temporaire ;
+puis la durée et le nombre d'appels au partage sont comparés à ceux du chemin précédent, où openpyxl
+et zipfile lisent et écrivent directement les fichiers du partage.
+
+    python benchmarks/bench_partage.py [--latence 2] [--repetitions 3] [--lignes 5000]
+"""
+import argparse
+import builtins
+import hashlib
+import io
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+from bench_generation import construire_modele
+from bench_incrementale import ETUDE, contenu_feuille
+
+matrice = charger_matrice()
+
+class FichierLent:
+    # Fichier du partage : chaque appel qui traverserait le réseau attend la latence et est compté
+    def __init__(self, fichier, partage):
+        self._fichier, self._partage = fichier, partage
+
+    def _attendre(self):
+        self._partage.attendre()
+
+    def read(self, *args):
+        self._attendre()
+        return self._fichier.read(*args)
+
+    def read1(self, *args):
+        self._attendre()
+        return self._fichier.read1(*args)
+
+    def readinto(self, tampon):
+        self._attendre()
+        return self._fichier.readinto(tampon)
+
+    def write(self, donnees):
+        self._attendre()
+        if self._partage.panne is not None:
+            self._partage.panne -= len(donnees)
+            if self._partage.panne < 0: raise OSError("Connexion au partage perdue (panne simulée).")
+        return self._fichier.write(donnees)
+
+    def seek(self, *args):
+        self._attendre()
+        return self._fichier.seek(*args)
+
+    def flush(self):
+        self._attendre()
+        return self._fichier.flush()
+
+    def __getattr__(self, nom):
+        return getattr(self._fichier, nom)
+
+    def __iter__(self):
+        return iter(self._fichier)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._fichier.close()
+
+class PartageLent:
+    def __init__(self, dossier, latence):
+        self.dossier, self.latence, self.appels, self.panne = os.path.abspath(dossier) + os.sep, latence, 0, None
+
+    def attendre(self):
+        self.appels += 1
+        time.sleep(self.latence)
+
+    def concerne(self, chemin):
+        return isinstance(chemin, (str, os.PathLike)) and os.path.abspath(os.fspath(chemin)).startswith(self.dossier)
+
+    @contextmanager
+    def actif(self):
+        # open / io.open (zipfile, openpyxl) et les appels os sur les chemins du partage passent par l'enveloppe
+        originaux = builtins.open, io.open, os.stat, os.replace, os.remove
+        ouvrir, stat, remplacer, supprimer = originaux[0], originaux[2], originaux[3], originaux[4]
+        def ouvrir_lent(fichier, *args, **kwargs):
+            if not self.concerne(fichier): return ouvrir(fichier, *args, **kwargs)
+            self.attendre()
+            return FichierLent(ouvrir(fichier, *args, **kwargs), self)
+        def appel_lent(fonction):
+            def appel(chemin, *args, **kwargs):
+                if self.concerne(chemin): self.attendre()
+                return fonction(chemin, *args, **kwargs)
+            return appel
+        builtins.open = io.open = ouvrir_lent
+        os.stat, os.replace, os.remove = appel_lent(stat), appel_lent(remplacer), appel_lent(supprimer)
+        try: yield self
+        finally: builtins.open, io.open, os.stat, os.replace, os.remove = originaux
+
+@contextmanager
+def acces_directs(partage):
+    # Chemin précédent : openpyxl et zipfile travaillent directement sur les fichiers du partage
+    originaux = matrice.bulk_source, matrice.open_template, matrice.template_sha256, matrice.output_spool, matrice.publish_spool
+    numeros = itertools.count()
+    def fichier_direct():
+        return open(os.path.join(partage.dossier, f".~direct.{next(numeros)}.tmp"), "w+b")
+    def publication_directe(fichier, output_file):
+        fichier.close()
+        os.replace(fichier.name, output_file)
+    def empreinte_directe(chemin):
+        empreinte = hashlib.sha256()
+        with open(chemin, "rb") as f:
+            for bloc in iter(lambda: f.read(1024 * 1024), b""): empreinte.update(bloc)
+        return empreinte.hexdigest()
+    matrice.bulk_source = matrice.open_template = lambda source: source
+    matrice.template_sha256, matrice.output_spool, matrice.publish_spool = empreinte_directe, fichier_direct, publication_directe
+    try: yield
+    finally: matrice.bulk_source, matrice.open_template, matrice.template_sha256, matrice.output_spool, matrice.publish_spool = originaux
+
+def verifier(partage, modele, local):
+    ecarts, params = [], matrice.parse_study_params(ETUDE)
+    with partage.actif():
+        for rapide in (False, True):
+            matrice.generate_matrix_logic(modele, os.path.join(partage.dossier, f"matrice_{rapide}.xlsm"), params, fast_save=rapide)
+    for rapide in (False, True):
+        matrice.generate_matrix_logic(MODELE_LIVRE, os.path.join(local, f"matrice_{rapide}.xlsm"), params, fast_save=rapide)
+        if contenu_feuille(os.path.join(partage.dossier, f"matrice_{rapide}.xlsm")) != contenu_feuille(os.path.join(local, f"matrice_{rapide}.xlsm")):
+            ecarts.append(f"génération {'rapide' if rapide else 'openpyxl'}")
+    modifie = matrice.parse_study_params(dict(ETUDE, avenants=ETUDE["avenants"] + 1, patients=ETUDE["patients"] + 5))
+    for rapide in (False, True):
+        for dossier in (partage.dossier, local): matrice.update_matrix(modele, os.path.join(dossier, f"maj_{rapide}.xlsm"), params, fast_save=rapide)
+        with partage.actif(): rapport = matrice.update_matrix(modele, os.path.join(partage.dossier, f"maj_{rapide}.xlsm"), modifie, fast_save=rapide)
+        matrice.update_matrix(MODELE_LIVRE, os.path.join(local, f"maj_{rapide}.xlsm"), modifie, fast_save=rapide)
+        if rapport["mode"] != "incrementale": ecarts.append(f"mise à jour {'rapide' if rapide else 'openpyxl'} : {rapport['raison']}")
+        if contenu_feuille(os.path.join(partage.dossier, f"maj_{rapide}.xlsm")) != contenu_feuille(os.path.join(local, f"maj_{rapide}.xlsm")):
+            ecarts.append(f"mise à jour {'rapide' if rapide else 'openpyxl'}")
+    with partage.actif():
+        for rapide in (False, True): matrice.clear_matrix(os.path.join(partage.dossier, f"matrice_{rapide}.xlsm"), fast_save=rapide)
+    for rapide in (False, True):
+        matrice.clear_matrix(os.path.join(local, f"matrice_{rapide}.xlsm"), fast_save=rapide)
+        if contenu_feuille(os.path.join(partage.dossier, f"matrice_{rapide}.xlsm")) != contenu_feuille(os.path.join(local, f"matrice_{rapide}.xlsm")):
+            ecarts.append(f"effacement {'rapide' if rapide else 'openpyxl'}")
+
+    # Enregistrement interrompu : la matrice existante doit rester lisible et inchangée
+    for rapide in (False, True):
+        destination = os.path.join(partage.dossier, f"matrice_{rapide}.xlsm")
+        with open(destination, "rb") as f: avant = f.read()
+        partage.panne = len(avant) // 2  # octets écrits avant la coupure
+        try:
+            with partage.actif(): matrice.generate_matrix_logic(modele, destination, params, fast_save=rapide)
+            ecarts.append(f"panne non signalée ({'rapide' if rapide else 'openpyxl'})")
+        except OSError: pass
+        finally: partage.panne = None
+        with open(destination, "rb") as f:
+            if f.read() != avant: ecarts.append(f"destination modifiée par un enregistrement interrompu ({'rapide' if rapide else 'openpyxl'})")
+    restes = [nom for nom in os.listdir(partage.dossier) if nom.startswith(".~")]
+    if restes: ecarts.append(f"fichier(s) temporaire(s) laissé(s) : {', '.join(restes)}")
+    return ecarts
+
+def mesurer(nom, partage, modele, repetitions):
+    params = matrice.parse_study_params(ETUDE)
+    modifie = matrice.parse_study_params(dict(ETUDE, avenants=ETUDE["avenants"] + 1))
+    sortie = os.path.join(partage.dossier, "mesure.xlsm")
+    colonnes = []
+    for direct in (True, False):
+        for operation, rapide in itertools.product(("génération", "mise à jour", "effacement"), (False, True)):
+            matrice._template_bytes_cache.clear()  # première génération de la série : modèle lu sur le partage
+            duree, appels = 0.0, 0
+            for _ in range(repetitions):
+                if operation == "effacement": matrice.generate_matrix_logic(modele, sortie, params)
+                if operation == "mise à jour": matrice.update_matrix(modele, sortie, params, fast_save=rapide)
+                with partage.actif(), (acces_directs(partage) if direct else nullcontext()):
+                    appels_avant, debut = partage.appels, time.perf_counter()
+                    if operation == "génération": matrice.generate_matrix_logic(modele, sortie, params, fast_save=rapide)
+                    elif operation == "mise à jour": matrice.update_matrix(modele, sortie, modifie, fast_save=rapide)
+                    else: matrice.clear_matrix(sortie, fast_save=rapide)
+                    duree, appels = duree + time.perf_counter() - debut, appels + partage.appels - appels_avant
+            colonnes.append((f"{operation} {'rapide' if rapide else 'openpyxl'}", direct, duree / repetitions, appels // repetitions))
+    for libelle in dict.fromkeys(libelle for libelle, *_ in colonnes):
+        (_, _, avant, appels_avant), (_, _, apres, appels_apres) = [c for c in colonnes if c[0] == libelle]
+        print(f"{nom:<16} {libelle:<20} | accès directs {avant:7.3f} s {appels_avant:>6} appels | accès groupés {apres:7.3f} s {appels_apres:>6} appels")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latence", type=float, default=2.0, help="Latence ajoutée à chaque appel au partage (ms).")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--lignes", type=int, nargs="*", default=[])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as dossier:
+        local, partage = os.path.join(dossier, "local"), PartageLent(os.path.join(dossier, "partage"), args.latence / 1000)
+        os.makedirs(local)
+        os.makedirs(partage.dossier)
+        modele = os.path.join(partage.dossier, "modele.xlsm")
+        shutil.copy(MODELE_LIVRE, modele)
+        matrice.load_template_model(modele)  # analyse mise en cache à côté du modèle, comme après une première génération
+        ecarts = verifier(partage, modele, local)
+        for ecart in ecarts: print(f"  ÉCART : {ecart}")
+        print(f"Générations, mises à jour et effacements sur le partage simulé : {len(ecarts)} écart(s).")
+        mesurer("matrice livrée", partage, modele, args.repetitions)
+        for nombre_lignes in args.lignes:
+            modele = os.path.join(partage.dossier, f"modele_{nombre_lignes}.xlsm")
+            construire_modele(modele, nombre_lignes)
+            matrice.load_template_model(modele)
+            mesurer(f"{nombre_lignes} lignes", partage, modele, args.repetitions)
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""Vérification et micro-benchmark de la table de règles par ligne.
+
+Compare, ligne par ligne, l'ancienne cascade if/elif de generate_matrix_logic (recopiée
+ci-dessous comme référence) à prepare_line + compute_line sur la matrice livrée
+pour une grille de paramètres, vérifie que chaque règle déclare dans LINE_RULE_INPUTS tous
+les paramètres dont dépend son résultat, puis mesure le temps de classification par ligne
+sur des modèles synthétiques.
+
+    python benchmarks/bench_regles.py [--lignes 1000 10000 50000]
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+
+matrice = charger_matrice()
+
+
+# --- Référence : ancienne implémentation (parseurs non mémorisés et cascade if/elif) ---
+
+def legacy_extract_montants_par_niveau(text):
+    if not isinstance(text, str): return {}
+    montants = {}
+    patterns = [r"niveau\s*1\s*:?\s*(\d+[.,]?\d*)", r"niveau\s*2\s*:?\s*(\d+[.,]?\d*)", r"niveau\s*3\s*:?\s*(\d+[.,]?\d*)"]
+    for i, pattern in enumerate(patterns, 1):
+        matches = re.findall(pattern, text.lower())
+        if matches:
+            montants_niveau = [matrice.safe_float(m.replace(",", ".")) for m in matches]
+            montants[str(i)] = max(montants_niveau)
+    return montants
+
+def legacy_extract_montants_par_centre(text):
+    if not isinstance(text, str): return {}
+    montants = {}
+    patterns = [r"coordonnateur\s*:?\s*(\d+[.,]?\d*)", r"associé\s*:?\s*(\d+[.,]?\d*)"]
+    centres = ["Coordonnateur", "Associé"]
+    for i, pattern in enumerate(patterns):
+        matches = re.findall(pattern, text.lower())
+        if matches:
+            montants_centre = [matrice.safe_float(m.replace(",", ".")) for m in matches]
+            montants[centres[i]] = max(montants_centre)
+    return montants
+
+def legacy_extract_time_hours(text):
+    if not isinstance(text, str): return 0.0
+    hour_patterns = [r"(\d+[.,]?\d*)\s*h(?:eures?)?", r"(\d+[.,]?\d*)\s*heure(?:s)?"]
+    for pattern in hour_patterns:
+        matches = re.findall(pattern, text.lower())
+        if matches: return matrice.safe_float(matches[0].replace(",", "."))
+    minute_patterns = [r"(\d+[.,]?\d*)\s*min(?:utes?)?", r"(\d+[.,]?\d*)\s*minute(?:s)?"]
+    for pattern in minute_patterns:
+        matches = re.findall(pattern, text.lower())
+        if matches: return matrice.safe_float(matches[0].replace(",", ".")) / 60.0
+    return 0.0
+
+def legacy_line(designation, montant_value, consignes_value, params):
+    studyLevel, numPatients, numVisits, centerType = params["niveau"], params["patients"], params["visites"], params["centre"]
+    studyDuration, numAvenants, numVisitesMonitoring = params["duree"], params["avenants"], params["monitoring"]
+    personnelExterieur, numPagesCRF, numAutoQ, formatAutoQ = params["personnel"], params["pages_crf"], params["auto_q_count"], params["auto_q_format"]
+    nb_prelevements_sang, nb_prelevements_urine, nb_signes_vitaux = params["prelevements_sang"], params["prelevements_urine"], params["signes_vitaux"]
+    nb_injections, nb_perfusions, nb_catheters, nb_pk_pd = params["injections"], params["perfusions"], params["catheters"], params["pk_pd"]
+    numVisitsSurSite = max(0, numVisits - 2)
+
+    quantity_per_patient_or_center, montant_unitaire, is_level_specific, is_center_specific, is_fixed_cost_line, is_special_calculation, special_calc_key = None, None, False, False, False, False, ""
+    designation_lower = designation.lower()
+
+    if "frais administratifs" in designation_lower:
+        quantity_per_patient_or_center, is_center_specific, is_fixed_cost_line = 1, True, True
+    elif "frais supplémentaires pour l'élaboration d'un avenant" in designation_lower:
+        if numAvenants > 0: quantity_per_patient_or_center, is_center_specific, is_fixed_cost_line = numAvenants, True, True
+    elif "mise en place de la recherche" in designation_lower:
+        quantity_per_patient_or_center, is_level_specific, is_fixed_cost_line = 1, True, True
+    elif "forfait de frais logistique" in designation_lower:
+        is_personnel_exterieur_line = "personnels extérieurs" in designation_lower
+        if not is_personnel_exterieur_line or (is_personnel_exterieur_line and personnelExterieur): quantity_per_patient_or_center, is_level_specific = numVisits, True
+    elif "forfait maintenance des appareils" in designation_lower:
+        quantity_per_patient_or_center, is_fixed_cost_line = studyDuration, True
+    elif "consultation d'inclusion" in designation_lower:
+        quantity_per_patient_or_center, is_level_specific = 1, True
+    elif "prise de connaissance de l'amendement" in designation_lower or "prise de connaissance de l'addendum" in designation_lower:
+        if numAvenants > 0:
+            time_per_amendment = legacy_extract_time_hours(designation) or legacy_extract_time_hours(str(consignes_value))
+            quantity_per_patient_or_center, is_fixed_cost_line = numAvenants * (time_per_amendment or 0.5), True
+    elif "consultation pour addendum" in designation_lower or "consultation pour amendement" in designation_lower:
+        if numAvenants > 0:
+            time_per_addendum = legacy_extract_time_hours(designation) or legacy_extract_time_hours(str(consignes_value))
+            quantity_per_patient_or_center, is_fixed_cost_line = numAvenants * (time_per_addendum or 1.0), True
+    elif "temps tec formation" in designation_lower and not "questionnaires" in designation_lower:
+        if "niveau 1" in designation_lower and studyLevel == "1": quantity_per_patient_or_center = 5
+        if "niveau 2" in designation_lower and studyLevel == "2": quantity_per_patient_or_center = 6
+        if "niveau 3" in designation_lower and studyLevel == "3": quantity_per_patient_or_center = 8
+        if quantity_per_patient_or_center is not None: is_fixed_cost_line, is_level_specific = True, True
+    elif "temps tec monitoring avec promoteur/cro" in designation_lower:
+        hrs_per_visit = 0
+        if "niveau 1" in designation_lower and studyLevel == "1": hrs_per_visit = 2.5
+        if "niveau 2" in designation_lower and studyLevel == "2": hrs_per_visit = 4
+        if "niveau 3" in designation_lower and studyLevel == "3": hrs_per_visit = 5
+        if hrs_per_visit > 0: quantity_per_patient_or_center, is_fixed_cost_line, is_level_specific = numVisitesMonitoring * hrs_per_visit, True, True
+    elif "temps tec visite de screening patient" in designation_lower:
+        is_special_calculation, is_level_specific, quantity_per_patient_or_center, special_calc_key = True, True, 1, "screening"
+    elif "temps tec visite sur site, de suivi patient ou téléphonique" in designation_lower:
+        is_special_calculation, is_level_specific, quantity_per_patient_or_center, special_calc_key = True, True, numVisitsSurSite, "visite_site"
+    elif "temps tec visite finale ou arrêt prématuré" in designation_lower:
+        is_special_calculation, is_level_specific, quantity_per_patient_or_center, special_calc_key = True, True, 1, "visite_finale"
+    elif "temps tec formation aux questionnaires et carnets patient" in designation_lower:
+        quantity_per_patient_or_center, montant_unitaire, is_fixed_cost_line = 1, 57.50, True
+    elif "temps tec gestion auto-questionnaire" in designation_lower:
+        quantity_per_patient_or_center, is_fixed_cost_line = numAutoQ, False
+        montant_unitaire = 28.75 if numAutoQ > 5 else 14.37
+    elif "temps tec formation initiale du patient à l'auto-questionnaire" in designation_lower:
+        quantity_per_patient_or_center, is_fixed_cost_line = 1, False
+        montant_unitaire = (86.25 if formatAutoQ == "électronique" else 43.12) if numAutoQ > 5 else (57.5 if formatAutoQ == "électronique" else 28.75)
+    elif "temps tec pour la gestion des kits de prélèvement" in designation_lower:
+        quantity_per_patient_or_center, montant_unitaire, is_fixed_cost_line = numVisits, 57.50, False
+    elif "temps tec appel ivrs/iwrs" in designation_lower:
+        quantity_per_patient_or_center, montant_unitaire, is_fixed_cost_line = numVisits, 11.24, False
+    elif "temps tec pour la gestion des remboursements des frais patients" in designation_lower:
+        quantity_per_patient_or_center, is_fixed_cost_line = numVisits, False
+        montant_unitaire = 47.92 if "47,92" in str(montant_value) else 19.17
+    elif re.search(r"temps\s+ide\s*:\s*formation\s+au\s+protocole\s+initial", designation_lower):
+        quantity_per_patient_or_center, is_fixed_cost_line, is_level_specific = 1, True, True
+    elif "temps infirmier pour prélèvements sanguins" in designation_lower:
+        quantity_per_patient_or_center = nb_prelevements_sang if nb_prelevements_sang is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 13.00, False
+    elif "temps infirmier pour prélèvements d'urine" in designation_lower:
+        quantity_per_patient_or_center = nb_prelevements_urine if nb_prelevements_urine is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 13.00, False
+    elif "temps infirmier pour la mesure des signes vitaux" in designation_lower:
+        quantity_per_patient_or_center = nb_signes_vitaux if nb_signes_vitaux is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 13.00, False
+    elif re.search(r"temps\s+infirmier.*injection.*traitement", designation_lower):
+        quantity_per_patient_or_center = nb_injections if nb_injections is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 13.00, False
+    elif re.search(r"temps\s+infirmier.*pose.*retrait.*perfusion", designation_lower):
+        quantity_per_patient_or_center = nb_perfusions if nb_perfusions is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 26.00, False
+    elif re.search(r"temps\s+infirmier.*pose.*retrait.*cathéter", designation_lower):
+        quantity_per_patient_or_center = nb_catheters if nb_catheters is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 26.00, False
+    elif re.search(r"temps\s+infirmier.*aide\s+au\s+médecin", designation_lower):
+        quantity_per_patient_or_center, is_fixed_cost_line = numVisits, False
+    elif re.search(r"temps\s+infirmier.*point\s+de\s+pk/pd", designation_lower):
+        quantity_per_patient_or_center = nb_pk_pd if nb_pk_pd is not None else numVisits
+        montant_unitaire, is_fixed_cost_line = 13.00, False
+    elif re.search(r"temps\s+manipulateur\s+radio.*administration", designation_lower):
+        quantity_per_patient_or_center, montant_unitaire, is_fixed_cost_line = numVisits, 28.75, False
+
+    if quantity_per_patient_or_center is not None and quantity_per_patient_or_center >= 0:
+        if montant_unitaire is None: montant_unitaire = matrice.safe_float(montant_value)
+        if is_level_specific and not is_special_calculation:
+            montants_niveau = legacy_extract_montants_par_niveau(str(montant_value))
+            if studyLevel in montants_niveau: montant_unitaire = montants_niveau[studyLevel]
+        elif is_center_specific:
+            montants_centre = legacy_extract_montants_par_centre(str(montant_value))
+            if centerType in montants_centre: montant_unitaire = montants_centre[centerType]
+        if is_special_calculation:
+            base_time = matrice.TEMPS_BASE[special_calc_key][studyLevel]
+            additional_time = matrice.calculate_additional_time(studyLevel, numPagesCRF)
+            total_time_per_visit = base_time + additional_time
+            montant_unitaire = total_time_per_visit * matrice.COUT_HORAIRE[special_calc_key][studyLevel]
+        total_ligne = quantity_per_patient_or_center * montant_unitaire
+        total_centre = total_ligne if is_fixed_cost_line else (quantity_per_patient_or_center * montant_unitaire * numPatients)
+        return quantity_per_patient_or_center, total_ligne, total_centre, is_level_specific or is_center_specific or is_special_calculation
+    return None
+
+# Tests de l'ancienne cascade réduits à la classification (mêmes conditions, même ordre)
+LEGACY_TESTS = [
+    lambda d: "frais administratifs" in d,
+    lambda d: "frais supplémentaires pour l'élaboration d'un avenant" in d,
+    lambda d: "mise en place de la recherche" in d,
+    lambda d: "forfait de frais logistique" in d,
+    lambda d: "forfait maintenance des appareils" in d,
+    lambda d: "consultation d'inclusion" in d,
+    lambda d: "prise de connaissance de l'amendement" in d or "prise de connaissance de l'addendum" in d,
+    lambda d: "consultation pour addendum" in d or "consultation pour amendement" in d,
+    lambda d: "temps tec formation" in d and not "questionnaires" in d,
+    lambda d: "temps tec monitoring avec promoteur/cro" in d,
+    lambda d: "temps tec visite de screening patient" in d,
+    lambda d: "temps tec visite sur site, de suivi patient ou téléphonique" in d,
+    lambda d: "temps tec visite finale ou arrêt prématuré" in d,
+    lambda d: "temps tec formation aux questionnaires et carnets patient" in d,
+    lambda d: "temps tec gestion auto-questionnaire" in d,
+    lambda d: "temps tec formation initiale du patient à l'auto-questionnaire" in d,
+    lambda d: "temps tec pour la gestion des kits de prélèvement" in d,
+    lambda d: "temps tec appel ivrs/iwrs" in d,
+    lambda d: "temps tec pour la gestion des remboursements des frais patients" in d,
+    lambda d: re.search(r"temps\s+ide\s*:\s*formation\s+au\s+protocole\s+initial", d),
+    lambda d: "temps infirmier pour prélèvements sanguins" in d,
+    lambda d: "temps infirmier pour prélèvements d'urine" in d,
+    lambda d: "temps infirmier pour la mesure des signes vitaux" in d,
+    lambda d: re.search(r"temps\s+infirmier.*injection.*traitement", d),
+    lambda d: re.search(r"temps\s+infirmier.*pose.*retrait.*perfusion", d),
+    lambda d: re.search(r"temps\s+infirmier.*pose.*retrait.*cathéter", d),
+    lambda d: re.search(r"temps\s+infirmier.*aide\s+au\s+médecin", d),
+    lambda d: re.search(r"temps\s+infirmier.*point\s+de\s+pk/pd", d),
+    lambda d: re.search(r"temps\s+manipulateur\s+radio.*administration", d),
+]
+
+def legacy_classify(designation_lower):
+    for (key, *_), test in zip(matrice.LINE_RULES, LEGACY_TESTS):
+        if test(designation_lower): return key
+    return None
+
+
+# --- Données ---
+
+def lignes_modele(path=MODELE_LIVRE):
+    import openpyxl
+    sheet = openpyxl.load_workbook(path, keep_vba=True)[matrice.SHEET_NAME]
+    firstRow, lastRow, _ = matrice.find_data_rows(sheet)
+    lignes = []
+    for r in range(firstRow, lastRow + 1):
+        value = sheet.cell(row=r, column=matrice.COL_DESIGNATION).value
+        designation = str(value).strip() if value is not None else ""
+        if designation:
+            lignes.append((designation, sheet.cell(row=r, column=matrice.COL_MONTANT_UNITAIRE).value, sheet.cell(row=r, column=matrice.COL_CONSIGNES).value))
+    return lignes
+
+def grille_parametres():
+    for niveau, centre, avenants, auto_q, format_q, personnel, pages_crf, infirmier in itertools.product(
+            matrice.NIVEAUX, matrice.TYPES_CENTRE, [0, 2], [0, 3, 8], matrice.FORMATS_AUTO_Q, [False, True], [0, 17], [None, 4]):
+        params = {"niveau": niveau, "patients": 12, "visites": 7, "centre": centre, "duree": 3, "avenants": avenants, "monitoring": 5,
+                  "personnel": personnel, "pages_crf": pages_crf, "auto_q_count": auto_q, "auto_q_format": format_q}
+        params.update({name: infirmier for name in matrice.CHAMPS_INFIRMIER})
+        yield params
+
+def lignes_synthetiques(lignes, nombre, seed=0):
+    # Désignations du modèle rendues uniques (pas de réussite de cache) + lignes sans règle
+    rnd = random.Random(seed)
+    synthetiques = []
+    for i in range(nombre):
+        designation, montant, consignes = rnd.choice(lignes)
+        synthetiques.append((f"{designation}\nvisite {i}", montant, consignes))
+    return synthetiques
+
+
+# --- Vérification et mesures ---
+
+def verifier(lignes):
+    ecarts = 0
+    for params in grille_parametres():
+        for designation, montant, consignes in lignes:
+            attendu = legacy_line(designation, montant, consignes, params)
+            obtenu = matrice.compute_line(matrice.prepare_line(0, designation, montant, consignes), params)
+            if attendu != obtenu:
+                ecarts += 1
+                print(f"ÉCART {designation[:60]!r} {params}: {attendu} != {obtenu}")
+    return ecarts
+
+def variantes(params, name):
+    # Autres valeurs possibles d'un paramètre, pour vérifier LINE_RULE_INPUTS
+    value = params[name]
+    if name == "niveau": return [v for v in matrice.NIVEAUX if v != value]
+    if name == "centre": return [v for v in matrice.TYPES_CENTRE if v != value]
+    if name == "auto_q_format": return [v for v in matrice.FORMATS_AUTO_Q if v != value]
+    if name == "personnel": return [not value]
+    if value is None: return [4]
+    return [value + 1, value + 9] + ([None] if name in matrice.CHAMPS_INFIRMIER else [])
+
+def verifier_dependances(lignes):
+    # Un paramètre absent de LINE_RULE_INPUTS pour la règle d'une ligne ne doit pas changer son résultat
+    ecarts = 0
+    preparees = [matrice.prepare_line(0, *ligne) for ligne in lignes]
+    preparees = [ligne for ligne in preparees if ligne["rule"] is not None]
+    for params in itertools.islice(grille_parametres(), 0, None, 7):
+        for ligne in preparees:
+            reference = matrice.compute_line(ligne, params)
+            for name in params:
+                if name in matrice.LINE_RULE_INPUTS[ligne["rule"]]: continue
+                for valeur in variantes(params, name):
+                    if matrice.compute_line(ligne, dict(params, **{name: valeur})) != reference:
+                        ecarts += 1
+                        print(f"DÉPENDANCE NON DÉCLARÉE {ligne['rule']} <- {name}")
+    return ecarts
+
+def vider_caches():
+    for fonction in (matrice.classify_designation, matrice.extract_montants_par_niveau, matrice.extract_montants_par_centre, matrice.extract_time_hours):
+        fonction.cache_clear()
+
+def chronometrer(fonction, elements, repetitions=3):
+    # Passage à froid : les mémorisations des parseurs sont vidées avant chaque répétition
+    meilleur = float("inf")
+    for _ in range(repetitions):
+        vider_caches()
+        debut = time.perf_counter()
+        for element in elements: fonction(element)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+def mesurer(lignes, nombre):
+    synthetiques = lignes_synthetiques(lignes, nombre)
+    textes = [designation.lower() for designation, _, _ in synthetiques]
+    params = next(grille_parametres())
+    t_legacy = chronometrer(legacy_classify, textes)
+    t_table = chronometrer(matrice._match_line_rule, textes)
+
+    def ligne_table(ligne):
+        designation, montant, consignes = ligne
+        return matrice.compute_line(matrice.prepare_line(0, designation, montant, consignes), params)
+
+    t_ligne_legacy = chronometrer(lambda ligne: legacy_line(*ligne, params), synthetiques)
+    t_ligne_table = chronometrer(ligne_table, synthetiques)
+    print(f"{nombre:>8} lignes | classification {t_legacy / nombre * 1e6:7.2f} -> {t_table / nombre * 1e6:7.2f} µs/ligne (x{t_legacy / t_table:.1f})"
+          f" | calcul complet {t_ligne_legacy / nombre * 1e6:7.2f} -> {t_ligne_table / nombre * 1e6:7.2f} µs/ligne (x{t_ligne_legacy / t_ligne_table:.1f})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--sans-verification", action="store_true")
+    args = parser.parse_args(argv)
+
+    lignes = lignes_modele()
+    if not args.sans_verification:
+        ecarts = verifier(lignes)
+        print(f"Vérification sur la matrice livrée : {len(lignes)} lignes, {ecarts} écart(s).")
+        dependances = verifier_dependances(lignes)
+        print(f"Dépendances des règles (LINE_RULE_INPUTS) : {dependances} écart(s).")
+        if ecarts or dependances: return 1
+    for nombre in args.lignes:
+        mesurer(lignes, nombre)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
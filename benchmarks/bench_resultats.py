@@ -0,0 +1,76 @@
+"""Vérification et benchmark de la base des résultats (record_run, query_results).
+
+Un batch de deux études portant le même nom (« A », niveaux 1 et 2, donc deux fichiers différents) est
+enregistré deux fois dans une base neuve : sans historique, les deux études doivent apparaître une
+seule fois chacune (dernière génération de chaque fichier), y compris dans la requête par désignation ;
+avec l'historique, les quatre générations. Les montants renvoyés doivent être arrondis au centime.
+La durée des requêtes est ensuite mesurée sur une base de --etudes études enregistrées en une seule
+exécution.
+
+    python benchmarks/bench_resultats.py [--etudes 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+
+matrice = charger_matrice()
+
+ETUDES = [{"etude": "A", "niveau": "1", "patients": 10, "visites": 6, "centre": "Associé", "duree": 2, "pages_crf": 12, "avenants": 0, "monitoring": 3},
+          {"etude": "A", "niveau": "2", "patients": 10, "visites": 6, "centre": "Associé", "duree": 2, "pages_crf": 12, "avenants": 0, "monitoring": 3}]
+
+def verifier(dossier):
+    base, etudes_csv, ecarts = os.path.join(dossier, "resultats.sqlite"), os.path.join(dossier, "etudes.csv"), []
+    champs = list(ETUDES[0])
+    with open(etudes_csv, "w", encoding="utf-8") as f:
+        f.write(";".join(champs) + "\n" + "".join(";".join(str(etude[c]) for c in champs) + "\n" for etude in ETUDES))
+    for _ in range(2): matrice.run_batch(etudes_csv, MODELE_LIVRE, os.path.join(dossier, "matrices"), workers=1, results_db=base)
+
+    _, lignes = matrice.query_results(base)
+    if sorted(ligne[2] for ligne in lignes) != ["1", "2"]: ecarts.append(f"études de même nom : niveaux {[ligne[2] for ligne in lignes]} au lieu de 1 et 2")
+    if len({ligne[-1] for ligne in lignes}) != len(lignes): ecarts.append("même fichier compté plusieurs fois")
+    for niveau in ("1", "2"):
+        _, lignes = matrice.query_results(base, level=niveau, designation="monitoring")
+        if not lignes: ecarts.append(f"requête par désignation vide pour l'étude de niveau {niveau}")
+    for grouper in matrice.RESULTS_GROUPS:
+        colonnes, lignes = matrice.query_results(base, group_by=grouper, history=True)
+        montants = [ligne[i] for ligne in lignes for i, c in enumerate(colonnes) if c in ("total_general", "total", "quantite")]
+        if any(isinstance(m, float) and round(m, 2) != m for m in montants): ecarts.append(f"montants non arrondis (--grouper {grouper})")
+    _, lignes = matrice.query_results(base, history=True)
+    if len(lignes) != 4: ecarts.append(f"historique : {len(lignes)} génération(s) au lieu de 4")
+    return ecarts
+
+def mesurer(nombre, dossier):
+    base = os.path.join(dossier, "portefeuille.sqlite")
+    modele = matrice.load_template_model(MODELE_LIVRE)
+    records = []
+    for i in range(nombre):
+        params = matrice.parse_study_params(dict(ETUDES[i % 2], patients=1 + i % 50))
+        results, total_general = matrice.compute_matrix(modele, params)
+        records.append(matrice.study_record(f"etude {i % 100}", os.path.join(dossier, f"etude_{i}.xlsm"), params, modele, results, total_general))
+    debut = time.perf_counter()
+    matrice.record_run(base, "batch", MODELE_LIVRE, records)
+    print(f"enregistrement de {nombre} études : {time.perf_counter() - debut:7.3f} s")
+    for grouper, options in (("etude", {}), ("niveau", {}), ("designation", {"designation": "monitoring"})):
+        debut = time.perf_counter()
+        _, lignes = matrice.query_results(base, group_by=grouper, **options)
+        print(f"requête --grouper {grouper:<12} : {len(lignes):>6} ligne(s) en {time.perf_counter() - debut:7.3f} s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--etudes", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as dossier:
+        ecarts = verifier(dossier)
+        for ecart in ecarts: print(f"  ÉCART : {ecart}")
+        print(f"Études de même nom dans la base des résultats : {len(ecarts)} écart(s).")
+        if args.etudes: mesurer(args.etudes, dossier)
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Vérification et benchmark du modèle de coût vectorisé (mode --scenarios).
+
+Compare, scénario par scénario, evaluate_cost_model à compute_matrix (calcul ligne par ligne
+de la génération) sur la matrice livrée, pour toutes les combinaisons de paramètres qualitatifs
+et des valeurs numériques tirées au hasard, puis mesure le débit d'évaluation.
+
+    python benchmarks/bench_scenarios.py [--scenarios 1000 100000 1000000]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+
+matrice = charger_matrice()
+
+
+def etudes_reference():
+    for niveau, centre, format_q, personnel, infirmier in itertools.product(
+            matrice.NIVEAUX, matrice.TYPES_CENTRE, matrice.FORMATS_AUTO_Q, [False, True], [None, 3]):
+        params = matrice.parse_study_params({"niveau": niveau, "patients": "1", "visites": "2", "centre": centre, "duree": "1",
+                                             "auto_q_format": format_q, "personnel": personnel})
+        for champ in matrice.CHAMPS_INFIRMIER: params[champ] = infirmier
+        yield params
+
+def valeurs_aleatoires(nombre, graine):
+    aleatoire = random.Random(graine)
+    return {
+        "patients": [aleatoire.randint(1, 500) for _ in range(nombre)],
+        "visites": [aleatoire.randint(2, 40) for _ in range(nombre)],
+        "monitoring": [aleatoire.randint(0, 30) for _ in range(nombre)],
+        "pages_crf": [aleatoire.randint(0, 200) for _ in range(nombre)],
+        "avenants": [aleatoire.randint(0, 4) for _ in range(nombre)],
+        "duree": [aleatoire.randint(1, 8) for _ in range(nombre)],
+        "auto_q_count": [aleatoire.randint(0, 10) for _ in range(nombre)],
+    }
+
+def verifier(modele, nombre=200):
+    ecarts = 0
+    for index, reference in enumerate(etudes_reference()):
+        valeurs = valeurs_aleatoires(nombre, index)
+        totaux, par_ligne = matrice.evaluate_cost_model(matrice.compile_cost_model(modele, reference), valeurs, per_line=True)
+        for i in range(nombre):
+            params = dict(reference, **{champ: valeurs[champ][i] for champ in valeurs})
+            resultats, attendu = matrice.compute_matrix(modele, params)
+            lignes = {ligne: total_centre for ligne, _, _, total_centre, _ in resultats}
+            obtenu_lignes = {ligne: float(total[i]) for ligne, total in par_ligne.items() if ligne in lignes or total[i] != 0}
+            if float(totaux[i]) != attendu or obtenu_lignes != lignes:
+                ecarts += 1
+                print(f"ÉCART {params}: {attendu} != {float(totaux[i])}")
+    return ecarts
+
+def mesurer(modele, nombre):
+    reference = next(etudes_reference())
+    modele_cout = matrice.compile_cost_model(modele, reference)
+    valeurs = {champ: numpy.asarray(colonne) for champ, colonne in valeurs_aleatoires(nombre, 0).items()}
+    debut = time.perf_counter()
+    matrice.evaluate_cost_model(modele_cout, valeurs)
+    duree_vecteur = time.perf_counter() - debut
+
+    echantillon = min(nombre, 2000)
+    debut = time.perf_counter()
+    for i in range(echantillon):
+        matrice.compute_matrix(modele, dict(reference, **{champ: int(valeurs[champ][i]) for champ in valeurs}))
+    duree_boucle = (time.perf_counter() - debut) / echantillon * nombre
+    print(f"{nombre:>9} scénarios | NumPy {duree_vecteur:8.3f} s | compute_matrix {duree_boucle:8.3f} s (estimé) | x{duree_boucle / duree_vecteur:.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--sans-verification", action="store_true")
+    args = parser.parse_args(argv)
+
+    modele = matrice.load_template_model(MODELE_LIVRE)
+    if not args.sans_verification:
+        ecarts = verifier(modele)
+        print(f"Vérification sur la matrice livrée : {ecarts} écart(s).")
+        if ecarts: return 1
+    for nombre in args.scenarios:
+        mesurer(modele, nombre)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Vérification et benchmark du service local de devis (mode --service), entièrement hors ligne.
+
+Le service est démarré dans ce processus sur 127.0.0.1 (port libre) avec la matrice livrée, puis
+interrogé en HTTP par plusieurs clients simultanés :
+- /devis : le total général et les totaux par ligne doivent être ceux de compute_matrix ;
+- /matrice : le classeur reçu doit être identique (valeurs et remplissages de la feuille) à celui
+  de generate_matrix_logic pour les mêmes paramètres ;
+- processus de génération tués (plantage, manque de mémoire) : au plus une requête refusée (503),
+  jamais d'erreur 500, puis /matrice doit de nouveau répondre ;
+puis le débit (requêtes par seconde) est mesuré pour chaque point d'entrée.
+
+    python benchmarks/bench_service.py [--clients 1 8 32] [--requetes 400] [--processus 2] [--rapide]
+"""
+import argparse
+import asyncio
+import http.client
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+
+matrice = charger_matrice()
+import matrice_service
+
+
+def etudes_aleatoires(nombre, graine=0):
+    aleatoire = random.Random(graine)
+    return [{"niveau": aleatoire.choice(matrice.NIVEAUX), "patients": aleatoire.randint(1, 300), "visites": aleatoire.randint(2, 30),
+             "centre": aleatoire.choice(matrice.TYPES_CENTRE), "duree": aleatoire.randint(1, 6), "pages_crf": aleatoire.randint(0, 80),
+             "avenants": aleatoire.randint(0, 3), "monitoring": aleatoire.randint(0, 12), "auto_q_count": aleatoire.choice(["", 3, 8]),
+             "auto_q_format": aleatoire.choice(matrice.FORMATS_AUTO_Q), "personnel": aleatoire.random() < 0.5,
+             "prelevements_sang": aleatoire.choice(["", 4])} for _ in range(nombre)]
+
+def demarrer_service(processus, rapide):
+    # Boucle asyncio du service dans un thread ; renvoie (port, service, fonction d'arrêt)
+    pret, etat = threading.Event(), {}
+    async def principal():
+        service = matrice_service.QuoteService(MODELE_LIVRE, workers=processus, fast_save=rapide)
+        serveur = await service.start("127.0.0.1", 0)
+        etat["service"], etat["port"], etat["boucle"], etat["arret"] = service, serveur.sockets[0].getsockname()[1], asyncio.get_running_loop(), asyncio.Event()
+        pret.set()
+        try:
+            async with serveur: await etat["arret"].wait()
+        finally:
+            service.close()
+    thread = threading.Thread(target=asyncio.run, args=(principal(),), daemon=True)
+    thread.start()
+    pret.wait()
+    def arreter():
+        etat["boucle"].call_soon_threadsafe(etat["arret"].set)
+        thread.join()
+    return etat["port"], etat["service"], arreter
+
+class Client:
+    # Connexion HTTP persistante (une par thread client)
+    def __init__(self, port):
+        self.connexion = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def envoyer(self, methode, chemin, document=None):
+        corps = None if document is None else json.dumps(document).encode("utf-8")
+        self.connexion.request(methode, chemin, body=corps, headers={"Content-Type": "application/json"})
+        reponse = self.connexion.getresponse()
+        return reponse.status, reponse.getheader("Content-Type"), reponse.read()
+
+    def fermer(self):
+        self.connexion.close()
+
+def contenu_feuille(source):
+    sheet = openpyxl.load_workbook(source)[matrice.SHEET_NAME]
+    return [(cell.coordinate, cell.value, cell.fill.fgColor.rgb) for row in sheet.iter_rows(max_col=matrice.COL_CONSIGNES) for cell in row]
+
+def verifier(port, service, nombre_devis=200, nombre_matrices=6):
+    client, ecarts = Client(port), 0
+    modele = matrice.load_template_model(MODELE_LIVRE)
+    for etude in etudes_aleatoires(nombre_devis, 1):
+        statut, _, corps = client.envoyer("POST", "/devis", etude)
+        resultats, attendu = matrice.compute_matrix(modele, matrice.parse_study_params(etude))
+        devis = json.loads(corps)
+        lignes = {ligne["ligne"]: ligne["total_centre"] for ligne in devis.get("lignes", [])}
+        if statut != 200 or devis["total_general"] != attendu or lignes != {r[0]: r[3] for r in resultats}:
+            ecarts += 1
+            print(f"ÉCART /devis {etude}: {statut} {devis.get('total_general')} != {attendu}")
+    with tempfile.TemporaryDirectory() as dossier:
+        reference = os.path.join(dossier, "reference.xlsm")
+        for etude in etudes_aleatoires(nombre_matrices, 2):
+            statut, type_contenu, corps = client.envoyer("POST", "/matrice", etude)
+            matrice.generate_matrix_logic(MODELE_LIVRE, reference, matrice.parse_study_params(etude))
+            if statut != 200 or type_contenu != matrice_service.XLSM_CONTENT_TYPE or contenu_feuille(io.BytesIO(corps)) != contenu_feuille(reference):
+                ecarts += 1
+                print(f"ÉCART /matrice {etude}: {statut} {type_contenu}")
+    for processus in list(service.executor._processes.values()):
+        processus.kill()
+        processus.join()
+    statuts = [client.envoyer("POST", "/matrice", etude)[0] for etude in etudes_aleatoires(2, 4)]
+    if statuts[0] not in (200, 503) or statuts[1] != 200: ecarts += 1; print(f"ÉCART après l'arrêt des processus : {statuts}")
+    statut, _, _ = client.envoyer("POST", "/devis", {"niveau": "4"})
+    if statut != 400: ecarts += 1; print(f"ÉCART paramètres invalides : {statut} au lieu de 400")
+    client.fermer()
+    return ecarts
+
+def mesurer(port, chemin, clients, requetes):
+    etudes = etudes_aleatoires(requetes, 3)
+    def travail(indice):
+        client, statuts = Client(port), []
+        for etude in etudes[indice::clients]:
+            statuts.append(client.envoyer("POST", chemin, etude)[0])
+        client.fermer()
+        return statuts
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        statuts = [statut for resultat in executor.map(travail, range(clients)) for statut in resultat]
+    duree = time.perf_counter() - debut
+    refus = sum(statut == 503 for statut in statuts)
+    print(f"  {chemin:<9} {clients:>3} client(s) | {requetes:>5} requêtes en {duree:7.3f} s | {requetes / duree:8.1f} req/s"
+          + (f" | {refus} refusée(s) (503)" if refus else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requetes", type=int, default=400, help="Requêtes /devis par mesure (/matrice : un dixième).")
+    parser.add_argument("--processus", type=int, default=2)
+    parser.add_argument("--rapide", action="store_true")
+    parser.add_argument("--sans-verification", action="store_true")
+    args = parser.parse_args(argv)
+
+    port, service, arreter = demarrer_service(args.processus, args.rapide)
+    try:
+        if not args.sans_verification:
+            ecarts = verifier(port, service)
+            print(f"Vérification sur la matrice livrée : {ecarts} écart(s).")
+            if ecarts: return 1
+        print(f"Service sur 127.0.0.1:{port}, {args.processus} processus{' (enregistrement rapide)' if args.rapide else ''} :")
+        for clients in args.clients:
+            mesurer(port, "/devis", clients, args.requetes)
+        for clients in args.clients:
+            mesurer(port, "/matrice", clients, max(args.requetes // 10, clients))
+    finally:
+        arreter()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Vérification et benchmark du modèle gardé ouvert pendant la session de l'interface (TemplateSession).
+
+Des matrices sont générées à la suite à partir d'un même modèle ouvert une seule fois, un paramètre de
+l'étude changeant à chaque étape : chaque feuille obtenue (valeurs et remplissages) doit être identique à
+celle d'une génération sans session. Le modèle est ensuite modifié sur le disque (il doit être rechargé),
+puis plus de modèles que TEMPLATE_SESSION_LIMIT sont ouverts (le nombre de classeurs gardés doit rester
+borné). Enfin, la durée d'une génération avec et sans session est comparée, pour la matrice livrée et,
+avec --lignes, pour des modèles synthétiques.
+
+    python benchmarks/bench_session.py [--etapes 12] [--graine 0] [--repetitions 5] [--lignes 5000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _matrice import MODELE_LIVRE, charger_matrice
+from bench_generation import construire_modele
+from bench_incrementale import ETUDE, MODIFICATIONS, contenu_feuille
+
+matrice = charger_matrice()
+
+def comparer(session, modele, params, dossier):
+    sortie, reference = os.path.join(dossier, "session.xlsm"), os.path.join(dossier, "reference.xlsm")
+    matrice.generate_matrix_logic(modele, sortie, params, session=session)
+    matrice.generate_matrix_logic(modele, reference, params)
+    return contenu_feuille(sortie) == contenu_feuille(reference)
+
+def verifier(etapes, graine, dossier):
+    aleatoire, etude, ecarts = random.Random(graine), dict(ETUDE), 0
+    modele = os.path.join(dossier, "modele.xlsm")
+    shutil.copy(MODELE_LIVRE, modele)
+    session = matrice.TemplateSession()
+    for etape in range(etapes):
+        if etape:
+            champ = aleatoire.choice(sorted(MODIFICATIONS))
+            etude[champ] = aleatoire.choice(MODIFICATIONS[champ])
+        if not comparer(session, modele, matrice.parse_study_params(etude), dossier):
+            ecarts += 1
+            print(f"  ÉCART à l'étape {etape} ({etude})")
+
+    # Modèle modifié sur le disque : la génération suivante doit en tenir compte
+    classeur = openpyxl.load_workbook(modele, keep_vba=True)
+    classeur[matrice.SHEET_NAME]["A1"] = "Modèle modifié pendant la session"
+    classeur.save(modele)
+    if not comparer(session, modele, matrice.parse_study_params(etude), dossier):
+        ecarts += 1
+        print("  ÉCART après modification du modèle sur le disque (classeur non rechargé)")
+
+    # Plusieurs modèles : seuls les TEMPLATE_SESSION_LIMIT plus récents restent ouverts
+    for i in range(matrice.TEMPLATE_SESSION_LIMIT + 2):
+        copie = os.path.join(dossier, f"modele_{i}.xlsm")
+        shutil.copy(MODELE_LIVRE, copie)
+        if not comparer(session, copie, matrice.parse_study_params(ETUDE), dossier): ecarts += 1
+    if len(session) > matrice.TEMPLATE_SESSION_LIMIT:
+        ecarts += 1
+        print(f"  ÉCART : {len(session)} modèles ouverts (limite {matrice.TEMPLATE_SESSION_LIMIT})")
+    return ecarts
+
+def mesurer(nom, modele, repetitions, dossier):
+    sortie = os.path.join(dossier, "mesure.xlsm")
+    params = [matrice.parse_study_params(dict(ETUDE, patients=patients)) for patients in range(1, repetitions + 1)]
+    matrice.load_template_model(modele)  # analyse mise en cache, comme après une première génération
+    durees = []
+    for session in (None, matrice.TemplateSession()):
+        if session is not None: matrice.generate_matrix_logic(modele, sortie, params[0], session=session)  # ouverture
+        debut = time.perf_counter()
+        for p in params: matrice.generate_matrix_logic(modele, sortie, p, session=session)
+        durees.append((time.perf_counter() - debut) / repetitions)
+    print(f"{nom:<22} | sans session {durees[0]:7.3f} s | session {durees[1]:7.3f} s par génération")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--etapes", type=int, default=12)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--lignes", type=int, nargs="*", default=[])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as dossier:
+        ecarts = verifier(args.etapes, args.graine, dossier)
+        print(f"Générations successives avec le modèle ouvert : {ecarts} écart(s).")
+        mesurer("matrice livrée", MODELE_LIVRE, args.repetitions, dossier)
+        for nombre_lignes in args.lignes:
+            modele = os.path.join(dossier, f"modele_{nombre_lignes}.xlsm")
+            construire_modele(modele, nombre_lignes)
+            mesurer(f"{nombre_lignes} lignes", modele, args.repetitions, dossier)
+    return 1 if ecarts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2637 @@
+# Cœur de calcul de la matrice des coûts et surcoûts : constantes, lecture des textes de la
+# matrice, règles de calcul par ligne, analyse du modèle, génération, effacement, batch,
+# variantes et scénarios. Aucune dépendance à l'interface graphique (tkinter) ; openpyxl et
+# NumPy ne sont chargés qu'au besoin. Utilisé par le script de l'interface et par benchmarks/.
+import io
+import itertools
+import os
+import re
+import csv
+import json
+import math
+import html
+import hashlib
+import shutil
+import zipfile
+import posixpath
+import bisect
+import warnings
+import traceback
+import threading
+import time
+import platform
+import datetime
+import tracemalloc
+import xml.etree.ElementTree as ET
+from copy import copy
+from decimal import Decimal
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+
+# Définir les constantes
+SHEET_NAME = "Annexe 2.1+MO-autorisation24"
+PATIENT_COUNT_CELL = "B10"
+COL_DESIGNATION = 1  # A
+COL_LIMITE_OCCURRENCE = 2  # B
+COL_COUT_SURCOUT = 3  # C
+COL_MONTANT_UNITAIRE = 4  # D
+COL_NOMBRE_ITEMS = 5  # E
+COL_TOTAL_LIGNE = 6  # F
+COL_TOTAL_CENTRE = 7  # G
+COL_CONSIGNES = 8  # H
+START_ROW = 18
+END_ROW_MARKER = "TOTAL GÉNÉRAL"
+TOTAL_GENERAL_ROW_OFFSET = 1
+TOLERANCE = 0.01
+
+# Couleurs de surlignage
+HIGHLIGHT_COLOR_DEFAULT = "ADD8E6"  # Bleu clair (par défaut)
+HIGHLIGHT_COLOR_LEVEL = "FFC7CE"    # Rouge clair (pour lignes spécifiques au niveau)
+
+# openpyxl n'est importé qu'à la première ouverture d'un classeur : le calcul, l'analyse en cache
+# et l'interface se chargent sans lui. Un chemin est lu d'un seul bloc (voir ACCÈS AUX FICHIERS).
+def load_workbook(filename, **options):
+    import openpyxl
+    return openpyxl.load_workbook(bulk_source(filename), **options)
+
+def new_workbook(**options):
+    import openpyxl
+    return openpyxl.Workbook(**options)
+
+@lru_cache(maxsize=None)
+def fill_for_color(color):
+    # Remplissage uni de la couleur donnée ; None retire le remplissage
+    from openpyxl.styles import PatternFill
+    if color is None: return PatternFill(fill_type=None)
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+def _openpyxl_version():
+    import openpyxl
+    return openpyxl.__version__
+
+# Coûts horaires par niveau et par type de ligne
+COUT_HORAIRE = {
+    "screening": { "1": 57.5, "2": 115.0, "3": 172.5 },
+    "visite_site": { "1": 57.5, "2": 115.0, "3": 115.0 },
+    "visite_finale": { "1": 57.5, "2": 115.0, "3": 115.0 }
+}
+
+# Temps de base par niveau et par type de ligne
+TEMPS_BASE = {
+    "screening": { "1": 1.0, "2": 2.0, "3": 3.0 },
+    "visite_site": { "1": 1.0, "2": 2.0, "3": 2.0 },
+    "visite_finale": { "1": 1.0, "2": 2.0, "3": 2.0 }
+}
+
+def extract_max_hour(text):
+    if not isinstance(text, str): return 0.0
+    numbers = re.findall(r"\d+[.,]?\d*", text.replace(",", "."))
+    max_h = 0.0
+    for num_str in numbers:
+        try:
+            h = float(num_str)
+            if h > max_h: max_h = h
+        except ValueError: continue
+    return max_h
+
+def safe_float(value, default=0.0):
+    if value is None: return default
+    try:
+        if isinstance(value, str) and ('%' in value or value.strip() == ''): return default
+        if isinstance(value, str): value = value.replace(",", ".").strip()
+        return float(value)
+    except (ValueError, TypeError): return default
+
+_MONTANT_NIVEAU_PATTERNS = [re.compile(r"niveau\s*1\s*:?\s*(\d+[.,]?\d*)"), re.compile(r"niveau\s*2\s*:?\s*(\d+[.,]?\d*)"), re.compile(r"niveau\s*3\s*:?\s*(\d+[.,]?\d*)")]
+_MONTANT_CENTRE_PATTERNS = [re.compile(r"coordonnateur\s*:?\s*(\d+[.,]?\d*)"), re.compile(r"associé\s*:?\s*(\d+[.,]?\d*)")]
+_HOUR_PATTERNS = [re.compile(r"(\d+[.,]?\d*)\s*h(?:eures?)?"), re.compile(r"(\d+[.,]?\d*)\s*heure(?:s)?")]
+_MINUTE_PATTERNS = [re.compile(r"(\d+[.,]?\d*)\s*min(?:utes?)?"), re.compile(r"(\d+[.,]?\d*)\s*minute(?:s)?")]
+
+# Les textes des colonnes D et H se répètent d'une ligne et d'une génération à l'autre :
+# les résultats sont mémorisés sans limite, un cache borné se vidant avant d'être réutilisé sur
+# les grands modèles (ne pas modifier les dictionnaires renvoyés).
+@lru_cache(maxsize=None)
+def extract_montants_par_niveau(text):
+    if not isinstance(text, str): return {}
+    montants = {}
+    for i, pattern in enumerate(_MONTANT_NIVEAU_PATTERNS, 1):
+        matches = pattern.findall(text.lower())
+        if matches:
+            montants_niveau = [safe_float(m.replace(",", ".")) for m in matches]
+            montants[str(i)] = max(montants_niveau)
+    return montants
+
+@lru_cache(maxsize=None)
+def extract_montants_par_centre(text):
+    if not isinstance(text, str): return {}
+    montants = {}
+    centres = ["Coordonnateur", "Associé"]
+    for i, pattern in enumerate(_MONTANT_CENTRE_PATTERNS):
+        matches = pattern.findall(text.lower())
+        if matches:
+            montants_centre = [safe_float(m.replace(",", ".")) for m in matches]
+            montants[centres[i]] = max(montants_centre)
+    return montants
+
+@lru_cache(maxsize=None)
+def extract_time_hours(text):
+    if not isinstance(text, str): return 0.0
+    for pattern in _HOUR_PATTERNS:
+        matches = pattern.findall(text.lower())
+        if matches: return safe_float(matches[0].replace(",", "."))
+    for pattern in _MINUTE_PATTERNS:
+        matches = pattern.findall(text.lower())
+        if matches: return safe_float(matches[0].replace(",", ".")) / 60.0
+    return 0.0
+
+def calculate_additional_time(study_level, num_pages_crf):
+    if study_level == "1": return (num_pages_crf // 10) * 0.25
+    elif study_level in ["2", "3"]: return (num_pages_crf // 5) * 0.25
+    return 0.0
+
+
+# --- RÈGLES DE CALCUL PAR LIGNE ---
+# Une ligne est décrite par le dictionnaire renvoyé par prepare_line. Chaque règle renvoie le
+# résultat de _calc(...) ou None si la ligne ne doit pas être remplie.
+
+def _calc(quantity, montant_unitaire=None, level=False, center=False, fixed=False, special=""):
+    # (quantité, montant unitaire imposé, spécifique niveau, spécifique centre, coût fixe, clé de calcul spécial)
+    return quantity, montant_unitaire, level, center, fixed, special
+
+def _regle_avenant(line, p):
+    if p["avenants"] > 0: return _calc(p["avenants"], center=True, fixed=True)
+
+def _regle_logistique(line, p):
+    is_personnel_exterieur_line = "personnels extérieurs" in line["designation_lower"]
+    if not is_personnel_exterieur_line or p["personnel"]: return _calc(p["visites"], level=True)
+
+def _regle_amendement(line, p):
+    if p["avenants"] > 0: return _calc(p["avenants"] * (line["temps"] or 0.5), fixed=True)
+
+def _regle_addendum(line, p):
+    if p["avenants"] > 0: return _calc(p["avenants"] * (line["temps"] or 1.0), fixed=True)
+
+_HEURES_FORMATION_TEC = {"1": 5, "2": 6, "3": 8}
+_HEURES_MONITORING_TEC = {"1": 2.5, "2": 4, "3": 5}
+
+def _regle_tec_formation(line, p):
+    if f"niveau {p['niveau']}" in line["designation_lower"] and p["niveau"] in _HEURES_FORMATION_TEC:
+        return _calc(_HEURES_FORMATION_TEC[p["niveau"]], level=True, fixed=True)
+
+def _regle_tec_monitoring(line, p):
+    if f"niveau {p['niveau']}" in line["designation_lower"] and p["niveau"] in _HEURES_MONITORING_TEC:
+        return _calc(p["monitoring"] * _HEURES_MONITORING_TEC[p["niveau"]], level=True, fixed=True)
+
+def _regle_auto_questionnaire(line, p):
+    return _calc(p["auto_q_count"], 28.75 if p["auto_q_count"] > 5 else 14.37)
+
+def _regle_formation_auto_questionnaire(line, p):
+    electronique = p["auto_q_format"] == "électronique"
+    return _calc(1, (86.25 if electronique else 43.12) if p["auto_q_count"] > 5 else (57.5 if electronique else 28.75))
+
+def _regle_remboursements(line, p):
+    return _calc(p["visites"], 47.92 if "47,92" in line["montant_texte"] else 19.17)
+
+def _regle_acte_infirmier(champ, montant_unitaire):
+    # Nombre d'actes saisi dans le cadre "temps infirmier", sinon un acte par visite
+    def regle(line, p):
+        return _calc(p[champ] if p[champ] is not None else p["visites"], montant_unitaire)
+    return regle
+
+# Ordre de l'ancienne cascade if/elif : la première règle qui correspond l'emporte.
+# (clé, famille, textes recherchés, expressions régulières, textes excluant la règle, calcul)
+# La famille est un texte présent dans tout déclencheur de la règle : il sert d'index pour
+# ne tester, sur une désignation donnée, que les règles dont la famille y figure.
+LINE_RULES = [
+    ("frais_administratifs", "frais", ["frais administratifs"], [], [], lambda line, p: _calc(1, center=True, fixed=True)),
+    ("avenant", "frais", ["frais supplémentaires pour l'élaboration d'un avenant"], [], [], _regle_avenant),
+    ("mise_en_place", "mise en place", ["mise en place de la recherche"], [], [], lambda line, p: _calc(1, level=True, fixed=True)),
+    ("logistique", "forfait", ["forfait de frais logistique"], [], [], _regle_logistique),
+    ("maintenance", "forfait", ["forfait maintenance des appareils"], [], [], lambda line, p: _calc(p["duree"], fixed=True)),
+    ("inclusion", "consultation", ["consultation d'inclusion"], [], [], lambda line, p: _calc(1, level=True)),
+    ("amendement", "prise de connaissance", ["prise de connaissance de l'amendement", "prise de connaissance de l'addendum"], [], [], _regle_amendement),
+    ("addendum", "consultation", ["consultation pour addendum", "consultation pour amendement"], [], [], _regle_addendum),
+    ("tec_formation", "temps tec", ["temps tec formation"], [], ["questionnaires"], _regle_tec_formation),
+    ("tec_monitoring", "temps tec", ["temps tec monitoring avec promoteur/cro"], [], [], _regle_tec_monitoring),
+    ("screening", "temps tec", ["temps tec visite de screening patient"], [], [], lambda line, p: _calc(1, level=True, special="screening")),
+    ("visite_site", "temps tec", ["temps tec visite sur site, de suivi patient ou téléphonique"], [], [], lambda line, p: _calc(max(0, p["visites"] - 2), level=True, special="visite_site")),
+    ("visite_finale", "temps tec", ["temps tec visite finale ou arrêt prématuré"], [], [], lambda line, p: _calc(1, level=True, special="visite_finale")),
+    ("formation_questionnaires", "temps tec", ["temps tec formation aux questionnaires et carnets patient"], [], [], lambda line, p: _calc(1, 57.50, fixed=True)),
+    ("auto_questionnaire", "temps tec", ["temps tec gestion auto-questionnaire"], [], [], _regle_auto_questionnaire),
+    ("formation_auto_questionnaire", "temps tec", ["temps tec formation initiale du patient à l'auto-questionnaire"], [], [], _regle_formation_auto_questionnaire),
+    ("kits_prelevement", "temps tec", ["temps tec pour la gestion des kits de prélèvement"], [], [], lambda line, p: _calc(p["visites"], 57.50)),
+    ("ivrs_iwrs", "temps tec", ["temps tec appel ivrs/iwrs"], [], [], lambda line, p: _calc(p["visites"], 11.24)),
+    ("remboursements", "temps tec", ["temps tec pour la gestion des remboursements des frais patients"], [], [], _regle_remboursements),
+    ("ide_formation", "ide", [], [r"temps\s+ide\s*:\s*formation\s+au\s+protocole\s+initial"], [], lambda line, p: _calc(1, level=True, fixed=True)),
+    ("prelevements_sang", "infirmier", ["temps infirmier pour prélèvements sanguins"], [], [], _regle_acte_infirmier("prelevements_sang", 13.00)),
+    ("prelevements_urine", "infirmier", ["temps infirmier pour prélèvements d'urine"], [], [], _regle_acte_infirmier("prelevements_urine", 13.00)),
+    ("signes_vitaux", "infirmier", ["temps infirmier pour la mesure des signes vitaux"], [], [], _regle_acte_infirmier("signes_vitaux", 13.00)),
+    ("injections", "infirmier", [], [r"temps\s+infirmier.*injection.*traitement"], [], _regle_acte_infirmier("injections", 13.00)),
+    ("perfusions", "infirmier", [], [r"temps\s+infirmier.*pose.*retrait.*perfusion"], [], _regle_acte_infirmier("perfusions", 26.00)),
+    ("catheters", "infirmier", [], [r"temps\s+infirmier.*pose.*retrait.*cathéter"], [], _regle_acte_infirmier("catheters", 26.00)),
+    ("aide_medecin", "infirmier", [], [r"temps\s+infirmier.*aide\s+au\s+médecin"], [], lambda line, p: _calc(p["visites"])),
+    ("pk_pd", "infirmier", [], [r"temps\s+infirmier.*point\s+de\s+pk/pd"], [], _regle_acte_infirmier("pk_pd", 13.00)),
+    ("manipulateur_radio", "manipulateur", [], [r"temps\s+manipulateur\s+radio.*administration"], [], lambda line, p: _calc(p["visites"], 28.75)),
+]
+LINE_RULE_FUNCTIONS = {key: calc for key, _, _, _, _, calc in LINE_RULES}
+
+# Paramètres dont dépend le total d'une ligne, selon sa règle : ceux lus par la règle, plus ceux de
+# compute_line (niveau pour les lignes par niveau et les temps TEC, centre pour les lignes par
+# centre, pages_crf pour les temps TEC, patients pour les coûts par patient).
+# Sert à l'aperçu pour ne recalculer que les lignes touchées par un champ modifié.
+LINE_RULE_INPUTS = {
+    "frais_administratifs": ("centre",),
+    "avenant": ("avenants", "centre"),
+    "mise_en_place": ("niveau",),
+    "logistique": ("personnel", "visites", "niveau", "patients"),
+    "maintenance": ("duree",),
+    "inclusion": ("niveau", "patients"),
+    "amendement": ("avenants",),
+    "addendum": ("avenants",),
+    "tec_formation": ("niveau",),
+    "tec_monitoring": ("niveau", "monitoring"),
+    "screening": ("niveau", "pages_crf", "patients"),
+    "visite_site": ("visites", "niveau", "pages_crf", "patients"),
+    "visite_finale": ("niveau", "pages_crf", "patients"),
+    "formation_questionnaires": (),
+    "auto_questionnaire": ("auto_q_count", "patients"),
+    "formation_auto_questionnaire": ("auto_q_count", "auto_q_format", "patients"),
+    "kits_prelevement": ("visites", "patients"),
+    "ivrs_iwrs": ("visites", "patients"),
+    "remboursements": ("visites", "patients"),
+    "ide_formation": ("niveau",),
+    "prelevements_sang": ("prelevements_sang", "visites", "patients"),
+    "prelevements_urine": ("prelevements_urine", "visites", "patients"),
+    "signes_vitaux": ("signes_vitaux", "visites", "patients"),
+    "injections": ("injections", "visites", "patients"),
+    "perfusions": ("perfusions", "visites", "patients"),
+    "catheters": ("catheters", "visites", "patients"),
+    "aide_medecin": ("visites", "patients"),
+    "pk_pd": ("pk_pd", "visites", "patients"),
+    "manipulateur_radio": ("visites", "patients"),
+}
+
+def _compile_line_rules(rules):
+    families, tests = [], []
+    for key, family, contains, regexes, excludes, _ in rules:
+        if any(family not in text for text in contains):
+            raise ValueError(f"Règle '{key}' : la famille '{family}' doit figurer dans chaque texte recherché.")
+        if family not in families: families.append(family)
+        tests.append((key, families.index(family), tuple(contains), tuple(re.compile(regex) for regex in regexes), tuple(excludes)))
+    return tuple(families), tests
+
+_LINE_RULE_FAMILIES, _LINE_RULE_TESTS = _compile_line_rules(LINE_RULES)
+_CANDIDATE_RULES = {}  # règles à tester (dans l'ordre de la table) selon les familles présentes
+
+def _match_line_rule(designation_lower):
+    presence = tuple([family in designation_lower for family in _LINE_RULE_FAMILIES])
+    candidates = _CANDIDATE_RULES.get(presence)
+    if candidates is None:
+        candidates = _CANDIDATE_RULES[presence] = [test for test in _LINE_RULE_TESTS if presence[test[1]]]
+    # Boucles simples plutôt que any(...) : pas de générateur créé par règle testée
+    for key, _, contains, regexes, excludes in candidates:
+        for text in contains:
+            if text in designation_lower: break
+        else:
+            for regex in regexes:
+                if regex.search(designation_lower): break
+            else: continue
+        for text in excludes:
+            if text in designation_lower: break
+        else: return key
+    return None
+
+@lru_cache(maxsize=None)
+def classify_designation(designation_lower):
+    return _match_line_rule(designation_lower)
+
+# Analyses des colonnes D et H lues par compute_line selon la règle : montants par niveau pour les
+# lignes par niveau (hors temps TEC), montants par centre pour les lignes par centre, temps de l'acte
+# pour les amendements. Les autres ne sont pas faites et restent vides.
+LINE_RULE_PARSING = {
+    "frais_administratifs": ("montants_centre",),
+    "avenant": ("montants_centre",),
+    "mise_en_place": ("montants_niveau",),
+    "logistique": ("montants_niveau",),
+    "inclusion": ("montants_niveau",),
+    "amendement": ("temps",),
+    "addendum": ("temps",),
+    "tec_formation": ("montants_niveau",),
+    "tec_monitoring": ("montants_niveau",),
+    "ide_formation": ("montants_niveau",),
+}
+
+def prepare_line(row, designation, montant, consignes):
+    # Ligne du modèle : désignation (colonne A) classée, montants (colonne D) et temps (colonnes A/H) analysés pour sa règle
+    designation_lower = designation.lower()
+    montant_texte = str(montant)
+    rule = classify_designation(designation_lower)
+    parsing = LINE_RULE_PARSING.get(rule, ())
+    return {
+        "row": row,
+        "rule": rule,
+        "designation": designation,
+        "designation_lower": designation_lower,
+        "montant_texte": montant_texte,
+        "montant_valeur": safe_float(montant),
+        "montants_niveau": extract_montants_par_niveau(montant_texte) if "montants_niveau" in parsing else {},
+        "montants_centre": extract_montants_par_centre(montant_texte) if "montants_centre" in parsing else {},
+        "temps": (extract_time_hours(designation) or extract_time_hours(str(consignes))) if "temps" in parsing else 0.0,
+    }
+
+def compute_line(line, params):
+    # Renvoie (quantité, total ligne, total centre, surlignage "niveau") ou None
+    if line["rule"] is None: return None
+    calc = LINE_RULE_FUNCTIONS[line["rule"]](line, params)
+    if calc is None: return None
+    quantity_per_patient_or_center, montant_unitaire, is_level_specific, is_center_specific, is_fixed_cost_line, special_calc_key = calc
+    is_special_calculation = bool(special_calc_key)
+    if quantity_per_patient_or_center is None or quantity_per_patient_or_center < 0: return None
+    studyLevel = params["niveau"]
+    if montant_unitaire is None: montant_unitaire = line["montant_valeur"]
+    if is_level_specific and not is_special_calculation:
+        montants_niveau = line["montants_niveau"]
+        if studyLevel in montants_niveau: montant_unitaire = montants_niveau[studyLevel]
+    elif is_center_specific:
+        montants_centre = line["montants_centre"]
+        if params["centre"] in montants_centre: montant_unitaire = montants_centre[params["centre"]]
+    if is_special_calculation:
+        base_time = TEMPS_BASE[special_calc_key][studyLevel]
+        additional_time = calculate_additional_time(studyLevel, params["pages_crf"])
+        total_time_per_visit = base_time + additional_time
+        montant_unitaire = total_time_per_visit * COUT_HORAIRE[special_calc_key][studyLevel]
+    total_ligne = quantity_per_patient_or_center * montant_unitaire
+    total_centre = total_ligne if is_fixed_cost_line else (quantity_per_patient_or_center * montant_unitaire * params["patients"])
+    return quantity_per_patient_or_center, total_ligne, total_centre, is_level_specific or is_center_specific or is_special_calculation
+
+
+# Paramètres d'une étude : mêmes noms que les variables du formulaire (sans le suffixe "_var")
+CHAMPS_PARAMETRES = ["niveau", "patients", "visites", "centre", "duree", "pages_crf"]
+CHAMPS_INFIRMIER = ["prelevements_sang", "prelevements_urine", "signes_vitaux", "injections", "perfusions", "catheters", "pk_pd"]
+CHAMPS_OPTIONS = ["avenants", "monitoring", "auto_q_count", "auto_q_format", "personnel"]
+CHAMPS_ETUDE = CHAMPS_PARAMETRES + CHAMPS_INFIRMIER + CHAMPS_OPTIONS
+NIVEAUX = ["1", "2", "3"]
+TYPES_CENTRE = ["Coordonnateur", "Associé"]
+FORMATS_AUTO_Q = ["papier", "électronique"]
+VALEURS_VRAI = {"1", "oui", "o", "vrai", "true", "yes", "x"}
+
+def _texte_parametre(raw, name, default=""):
+    value = raw.get(name)
+    if value is None or value == "": return default
+    if isinstance(value, bool): return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer(): value = int(value)
+    return str(value).strip()
+
+def validate_study_params(raw, form=False):
+    # form=True (saisie de l'interface) : avenants, monitoring et pages CRF doivent être remplis ;
+    # ailleurs (batch, variantes, service), un champ vide vaut 0
+    errors = []
+    get = lambda name, default="": _texte_parametre(raw, name, default)
+    required = (lambda name: not get(name)) if form else (lambda name: False)
+    try:
+        if not get("niveau"): errors.append("Niveau de l'étude manquant.")
+        elif get("niveau") not in NIVEAUX: errors.append("Niveau de l'étude invalide (1, 2 ou 3).")
+        if not get("patients") or int(get("patients")) <= 0: errors.append("Nombre de patients invalide (> 0).")
+        if not get("visites") or int(get("visites")) <= 0: errors.append("Nombre de visites invalide (> 0).")
+        if not get("centre"): errors.append("Type de centre manquant.")
+        elif get("centre") not in TYPES_CENTRE: errors.append("Type de centre invalide (Coordonnateur ou Associé).")
+        if not get("duree") or int(get("duree")) <= 0: errors.append("Durée d'étude invalide (> 0).")
+        if required("avenants") or int(get("avenants", "0")) < 0: errors.append("Nombre d'avenants invalide (>= 0).")
+        if required("monitoring") or int(get("monitoring", "0")) < 0: errors.append("Nombre de visites de monitoring invalide (>= 0).")
+        if required("pages_crf") or int(get("pages_crf", "0")) < 0: errors.append("Nombre de pages CRF invalide (>= 0).")
+        if get("auto_q_count") and int(get("auto_q_count")) < 0:
+            errors.append("Nombre d'auto-questionnaires invalide (>= 0).")
+        if get("auto_q_format") and get("auto_q_format") not in FORMATS_AUTO_Q:
+            errors.append("Format d'auto-questionnaire invalide (papier ou électronique).")
+        if int(get("visites")) < 2:
+            errors.append("Le nombre total de visites doit être au moins 2 (1 screening + 1 finale).")
+    except ValueError:
+        errors.append("Veuillez saisir des nombres valides pour tous les champs requis.")
+    except Exception as e:
+         errors.append(f"Erreur inattendue dans les saisies : {e}")
+    return errors
+
+def parse_study_params(raw):
+    # À appeler sur des saisies déjà validées par validate_study_params
+    get = lambda name, default="": _texte_parametre(raw, name, default)
+
+    def get_optional_int(name):
+        val = get(name)
+        return int(val) if val.isdigit() else None
+
+    params = {
+        "niveau": get("niveau"),
+        "patients": int(get("patients")),
+        "visites": int(get("visites")),
+        "centre": get("centre"),
+        "duree": int(get("duree")),
+        "avenants": int(get("avenants", "0")),
+        "monitoring": int(get("monitoring", "0")),
+        "personnel": get("personnel").lower() in VALEURS_VRAI,
+        "pages_crf": int(get("pages_crf", "0")),
+        "auto_q_count": int(get("auto_q_count")) if get("auto_q_count") else 0,
+        "auto_q_format": get("auto_q_format") or "électronique",
+    }
+    for name in CHAMPS_INFIRMIER:
+        params[name] = get_optional_int(name)
+    return params
+
+
+def find_data_rows(sheet):
+    with profiled("find_data_rows"):
+        return locate_data_rows([row[0] for row in sheet.iter_rows(min_row=START_ROW, max_col=COL_DESIGNATION, values_only=True)])
+
+def locate_data_rows(designations):
+    # designations : valeurs de la colonne A à partir de START_ROW, jusqu'à la dernière ligne de la feuille
+    max_row = START_ROW + len(designations) - 1
+    value_at = lambda r: designations[r - START_ROW] if r <= max_row else None
+    firstRow, lastRow, totalRow = 0, 0, 0
+    foundStart = False
+    for r in range(START_ROW, max_row + 1):
+        designation = str(value_at(r)) if value_at(r) else ""
+        if not foundStart and designation: firstRow, foundStart = r, True
+        if foundStart and END_ROW_MARKER.lower() in designation.lower():
+            lastRow = r - 1
+            for i in range(r, r + 6):
+                total_text = str(value_at(i)).lower() if value_at(i) else ""
+                if "total" in total_text and "général" in total_text:
+                    totalRow = i
+                    break
+            break
+    if firstRow > 0 and not totalRow: lastRow = max_row
+    return firstRow, lastRow, totalRow
+
+
+# --- LECTURE EN FLUX DE LA FEUILLE (SANS OPENPYXL) ---
+# Le calcul n'a besoin que des colonnes A à H de SHEET_NAME jusqu'à la ligne "TOTAL GÉNÉRAL" (et de
+# B10) : l'archive est ouverte directement, la feuille est retrouvée par son nom et seul son XML est
+# parcouru (iterparse), jusqu'à la ligne demandée. Ni les autres feuilles, ni les styles, ni le
+# projet VBA ne sont chargés. Les valeurs sont celles d'openpyxl en lecture seule (values_only) ;
+# ce qu'il convertit autrement (dates, formules partagées ou matricielles) provoque le repli sur openpyxl.
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_BUILTIN_DATE_FORMATS = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}
+_FORMAT_LITERAL_RE = re.compile(r'"[^"]*"|\\.|_.|\*.|\[(?![hms]+\])[^\]]*\]', re.I)
+_NUMFMT_RE = re.compile(rb'<numFmt\b[^>]*?numFmtId="(\d+)"[^>]*?formatCode="([^"]*)"')
+_CELL_XFS_RE = re.compile(rb"<cellXfs\b[^>]*>(.*?)</cellXfs>", re.S)
+_XF_NUMFMT_RE = re.compile(rb"<xf\b([^>]*)")
+
+class SheetStreamUnsupported(Exception):
+    # Valeur que le lecteur en flux ne restitue pas comme openpyxl : relire la feuille avec openpyxl
+    pass
+
+def _date_styles(archive):
+    # Indices des styles de cellule dont le format de nombre peut être une date (par excès)
+    try: xml = archive.read("xl/styles.xml")
+    except KeyError: return set()
+    formats = {int(i): html.unescape(code.decode("utf-8")) for i, code in _NUMFMT_RE.findall(xml)}
+    section = _CELL_XFS_RE.search(xml)
+    styles = set()
+    for index, attrs in enumerate(_XF_NUMFMT_RE.findall(section.group(1)) if section else []):
+        match = re.search(rb'numFmtId="(\d+)"', attrs)
+        fmt_id = int(match.group(1)) if match else 0
+        code = formats.get(fmt_id)
+        if fmt_id in _BUILTIN_DATE_FORMATS or (code and re.search(r"[dmhys]", _FORMAT_LITERAL_RE.sub("", code.split(";")[0]), re.I)):
+            styles.add(index)
+    return styles
+
+def _shared_strings(archive):
+    try: source = archive.open("xl/sharedStrings.xml")
+    except KeyError: return []
+    strings, table = [], None
+    with source:
+        for event, node in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if node.tag == _SHEET_NS + "sst": table = node
+            elif node.tag == _SHEET_NS + "si":
+                strings.append(_string_item(node).replace("x005F_", ""))
+                if table is not None: table.clear()  # seul le <si> en cours reste en mémoire
+    return strings
+
+def _string_item(node):
+    # Texte d'un <si> ou <is> : <t> direct puis les <t> des <r> (sans les indications phonétiques)
+    text = node.findtext(_SHEET_NS + "t")
+    parts = [text] if text is not None else []
+    parts += [run.findtext(_SHEET_NS + "t") or "" for run in node.iterfind(_SHEET_NS + "r")]
+    return "".join(parts)
+
+def _stream_cell_value(cell, data_only, shared_strings, date_styles):
+    data_type = cell.get("t", "n")
+    formula = None if data_only else cell.find(_SHEET_NS + "f")
+    if formula is not None:
+        if formula.get("t") in ("array", "dataTable") or (formula.get("t") == "shared" and formula.text is None):
+            raise SheetStreamUnsupported(f"Formule {formula.get('t')} en {cell.get('r')}.")
+        return "=" + (formula.text or "")
+    if data_type == "inlineStr":
+        node = cell.find(_SHEET_NS + "is")
+        return None if node is None else _string_item(node)
+    value = cell.findtext(_SHEET_NS + "v") or None
+    if value is None: return None
+    if data_type == "n":
+        if int(cell.get("s") or 0) in date_styles(): raise SheetStreamUnsupported(f"Date possible en {cell.get('r')}.")
+        return float(value) if "." in value or "e" in value or "E" in value else int(value)
+    if data_type == "s": return shared_strings()[int(value)]
+    if data_type == "b": return bool(int(value))
+    if data_type == "d": raise SheetStreamUnsupported(f"Date ISO 8601 en {cell.get('r')}.")
+    return value  # "str", "e"
+
+def iter_sheet_rows(source_file, sheet_name=SHEET_NAME, max_col=COL_CONSIGNES, data_only=False, stop=None):
+    # Même suite de tuples que sheet.iter_rows(min_row=1, max_col=max_col, values_only=True) d'une feuille
+    # ouverte en lecture seule (lignes absentes comprises, bornée par <dimension>). stop(ligne, valeurs) :
+    # la lecture s'arrête après la première ligne pour laquelle il renvoie vrai.
+    with zipfile.ZipFile(bulk_source(source_file)) as archive:
+        sheet_path = _resolve_sheet_path(archive, sheet_name)
+        cache = {}
+        shared_strings = lambda: cache["sst"] if "sst" in cache else cache.setdefault("sst", _shared_strings(archive))
+        date_styles = lambda: cache["styles"] if "styles" in cache else cache.setdefault("styles", _date_styles(archive))
+        empty_row = (None,) * max_col
+        max_row, expected, row_number, beyond = None, 1, 0, False
+        with archive.open(sheet_path) as source:
+            # Chaque ligne traitée est retirée de <sheetData> : seule la ligne en cours reste en mémoire
+            sheet_data = None
+            for event, node in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if node.tag == _SHEET_NS + "sheetData": sheet_data = node
+                elif node.tag == _SHEET_NS + "dimension":
+                    bound = _CELL_REF_RE.search(node.get("ref", "").split(":")[-1])
+                    if bound: max_row = int(bound.group(2))
+                elif node.tag == _SHEET_NS + "row":
+                    row_number = int(float(node.get("r"))) if node.get("r") else row_number + 1
+                    if max_row is not None and row_number > max_row:
+                        beyond = True
+                        break
+                    values, column = [None] * max_col, 0
+                    for cell in node.iterfind(_SHEET_NS + "c"):
+                        ref = cell.get("r")
+                        column = _column_index(_CELL_REF_RE.match(ref).group(1)) if ref else column + 1
+                        if column <= max_col: values[column - 1] = _stream_cell_value(cell, data_only, shared_strings, date_styles)
+                    if sheet_data is not None: sheet_data.clear()
+                    while expected < row_number:
+                        yield empty_row
+                        expected += 1
+                    if expected == row_number:
+                        values = tuple(values)
+                        yield values
+                        expected += 1
+                        if stop is not None and stop(row_number, values): return
+                elif node.tag == _SHEET_NS + "sheetData":
+                    break
+        # Comme openpyxl : lignes vides jusqu'à la dimension seulement si la feuille la dépasse
+        if beyond:
+            while expected <= max_row:
+                yield empty_row
+                expected += 1
+
+def _is_total_row(row_number, values):
+    return row_number >= START_ROW and END_ROW_MARKER.lower() in (str(values[0]) if values[0] else "").lower()
+
+def iter_matrix_rows(source_file, max_col=COL_CONSIGNES, data_only=False):
+    # Lignes 1 à "TOTAL GÉNÉRAL" de SHEET_NAME (colonnes 1 à max_col), au fil de la lecture en flux, ou
+    # feuille entière par openpyxl en lecture seule si le flux ne s'applique pas : le repli reprend après
+    # les lignes déjà renvoyées (identiques à celles d'openpyxl). KeyError si la feuille manque.
+    source_file = bulk_source(source_file)  # un chemin n'est lu qu'une fois, même en cas de repli
+    done = 0
+    try:
+        for values in iter_sheet_rows(source_file, max_col=max_col, data_only=data_only, stop=_is_total_row):
+            yield values
+            done += 1
+        return
+    except (SheetStreamUnsupported, XlsmPatchError, zipfile.BadZipFile):
+        profile_note("lecture_en_flux", "repli openpyxl")
+    workbook = load_workbook(source_file, read_only=True, data_only=data_only, keep_links=False)
+    try: yield from itertools.islice(workbook[SHEET_NAME].iter_rows(min_row=1, max_col=max_col, values_only=True), done, None)
+    finally: workbook.close()
+
+def read_matrix_rows(source_file, max_col=COL_CONSIGNES, data_only=False):
+    return list(iter_matrix_rows(source_file, max_col=max_col, data_only=data_only))
+
+
+# --- MODÈLE DE LA MATRICE (ANALYSE MISE EN CACHE) ---
+# Le résultat de l'analyse du modèle (plage de données, ligne de total, règle et montants de
+# chaque ligne) est enregistré à côté du fichier .xlsm et réutilisé tant que le fichier ne change pas.
+TEMPLATE_CACHE_VERSION = 3
+TEMPLATE_CACHE_SUFFIX = ".analyse.json"
+_RULES_SIGNATURE = hashlib.sha256(repr([rule[:5] for rule in LINE_RULES]).encode("utf-8")).hexdigest()[:16]
+
+def is_section_title(designation):
+    # Titre de section : désignation entièrement en majuscules (ex. "FORFAITS", "IMAGERIE")
+    return any(ch.isalpha() for ch in designation) and designation == designation.upper()
+
+def analyse_template(sheet):
+    # Lecture ligne à ligne (colonnes A à H) : fonctionne aussi sur une feuille ouverte en lecture seule
+    return analyse_template_rows(sheet.iter_rows(min_row=1, max_col=COL_CONSIGNES, values_only=True))
+
+def analyse_template_rows(rows):
+    # rows : valeurs des colonnes A à H depuis la ligne 1, liste ou itérateur, parcourues une seule fois :
+    # seules les lignes calculées sont gardées. Même plage que locate_data_rows : de la première
+    # désignation à partir de START_ROW jusqu'à la ligne END_ROW_MARKER (qui est aussi le total général).
+    marker = END_ROW_MARKER.lower()
+    firstRow, lastRow, totalRow, r = 0, 0, 0, 0
+    above, lines, sections = None, [], []
+    classify = classify_designation if _active_profiler is None else _active_profiler.classify
+    with profiled("lecture_lignes"):
+        for r, values in enumerate(rows, 1):
+            if r < START_ROW - 1: continue
+            value = values[COL_DESIGNATION - 1]
+            designation = str(value).strip() if value is not None else ""
+            if not firstRow:
+                if r < START_ROW or not value:
+                    if designation: above = (r, designation)
+                    continue
+                # La première section peut commencer juste au-dessus de la plage de données
+                firstRow = r
+                if above and is_section_title(above[1]): sections.append(above)
+            if marker in str(value).lower():
+                lastRow, totalRow = r - 1, r
+                break
+            if not designation: continue
+            if classify(designation.lower()) is None:
+                if is_section_title(designation): sections.append((r, designation))
+                continue
+            lines.append(prepare_line(r, designation, values[COL_MONTANT_UNITAIRE - 1], values[COL_CONSIGNES - 1]))
+        else:
+            lastRow = r
+    if not (firstRow > 0 and lastRow >= firstRow):
+         raise ValueError("Impossible de déterminer la plage de données de la matrice.")
+    return {"first_row": firstRow, "last_row": lastRow, "total_row": totalRow, "lines": lines, "sections": sections}
+
+def template_cache_path(source_file):
+    return source_file + TEMPLATE_CACHE_SUFFIX
+
+def _read_template_cache(source_file):
+    try:
+        with open(template_cache_path(source_file), encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache.get("version") != TEMPLATE_CACHE_VERSION or cache.get("rules") != _RULES_SIGNATURE or cache.get("sheet") != SHEET_NAME: return None
+    return cache
+
+def _write_template_cache(source_file, cache):
+    # Écriture atomique (plusieurs processus batch peuvent partager le même modèle) ; un dossier
+    # en lecture seule désactive simplement le cache
+    cache_file = template_cache_path(source_file)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try: os.remove(tmp_file)
+        except OSError: pass
+
+def load_template_model(source_file, sheet=None, rebuild=False):
+    # sheet : feuille déjà chargée du même fichier (évite un second chargement si le cache est invalide)
+    stat = os.stat(source_file)
+    cache = None if rebuild else _read_template_cache(source_file)
+    if cache and cache["size"] == stat.st_size:
+        if cache["mtime_ns"] == stat.st_mtime_ns:
+            profile_note("cache_analyse", "valide")
+            return cache["model"]
+        with profiled("empreinte_sha256"): sha256 = template_sha256(source_file)
+        if cache["sha256"] == sha256:
+            # Fichier recopié ou "touché" sans modification : seule la date est mise à jour
+            cache["mtime_ns"] = stat.st_mtime_ns
+            _write_template_cache(source_file, cache)
+            profile_note("cache_analyse", "valide (date mise à jour)")
+            return cache["model"]
+    else:
+        with profiled("empreinte_sha256"): sha256 = template_sha256(source_file)
+    profile_note("cache_analyse", "reconstruit")
+    if sheet is None:
+        model = analyse_template_rows(iter_matrix_rows(open_template(source_file)))  # contenu déjà lu pour l'empreinte
+    else:
+        model = analyse_template(sheet)
+    _write_template_cache(source_file, {
+        "version": TEMPLATE_CACHE_VERSION, "rules": _RULES_SIGNATURE, "sheet": SHEET_NAME,
+        "sha256": sha256, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "model": model,
+    })
+    return model
+
+def print_template_analysis(source_file, rebuild=False):
+    previous = None if rebuild else _read_template_cache(source_file)
+    model = load_template_model(source_file, rebuild=rebuild)
+    cache = _read_template_cache(source_file)
+    if cache is None: state = "non enregistré (dossier en lecture seule ?)"
+    elif previous and previous["sha256"] == cache["sha256"]: state = "valide, réutilisé"
+    else: state = "reconstruit"
+    print(f"Modèle : {source_file}")
+    print(f"Cache  : {template_cache_path(source_file)} ({state})")
+    if cache: print(f"SHA-256: {cache['sha256']}")
+    print(f"Données: lignes {model['first_row']} à {model['last_row']}, total général : {model['total_row'] or 'absent'}")
+    print(f"Sections : {', '.join(title for _, title in model['sections']) or 'aucune'}")
+    print(f"{len(model['lines'])} ligne(s) calculée(s) :")
+    for line in model["lines"]:
+        montants = line["montants_niveau"] or line["montants_centre"] or line["montant_valeur"]
+        print(f"  {line['row']:>5}  {line['rule']:<28} {line['designation'].splitlines()[0][:50]:<50} {montants}")
+
+# --- PROGRESSION ET ANNULATION ---
+# progress(phase, fait, total) est appelé à chaque étape ; il peut lever OperationCancelled pour
+# interrompre le traitement. Le fichier de sortie n'est remplacé qu'à la toute fin (fichier
+# temporaire puis os.replace) : une annulation ne laisse jamais de fichier à moitié écrit.
+PROGRESS_PHASES = {
+    "chargement": "Chargement du classeur",
+    "lignes": "Repérage des lignes de la matrice",
+    "calcul": "Calcul des lignes",
+    "ecriture": "Écriture des cellules",
+    "enregistrement": "Enregistrement du fichier",
+    "variantes": "Génération des variantes",
+    "consolidation": "Copie des variantes dans le classeur consolidé",
+    "collecte": "Lecture des matrices existantes",
+    "echeancier": "Écriture de l'échéancier patient × visite",
+}
+
+class OperationCancelled(Exception):
+    pass
+
+def _report(progress, phase, done=0, total=0):
+    if progress is not None: progress(phase, done, total)
+
+def _temporary_path(output_file):
+    # Dans le même dossier que la sortie pour que os.replace reste un simple renommage
+    directory, name = os.path.split(os.path.abspath(output_file))
+    return os.path.join(directory, f".~{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def _remove_quietly(path):
+    try: os.remove(path)
+    except OSError: pass
+
+def save_workbook_atomic(workbook, output_file, progress=None):
+    with output_spool() as spool:
+        _report(progress, "enregistrement", 0, 1)
+        workbook.save(spool)
+        _report(progress, "enregistrement", 1, 1)
+        publish_spool(spool, output_file)
+
+
+# --- ACCÈS AUX FICHIERS (PARTAGES RÉSEAU) ---
+# Sur un partage réseau (SMB), chaque petite lecture, écriture ou repositionnement d'openpyxl et de
+# zipfile coûte un aller-retour. Les classeurs sont lus en une seule lecture séquentielle dans un
+# tampon en mémoire ; ils sont écrits d'abord en mémoire (dans un fichier temporaire local au-delà de
+# OUTPUT_SPOOL_MAX_BYTES), puis copiés par gros blocs dans un fichier temporaire voisin de la
+# destination, renommé ensuite (os.replace) : un enregistrement interrompu laisse la destination
+# intacte. Le contenu des modèles est gardé en mémoire tant que leur date et leur taille ne changent
+# pas (TEMPLATE_BYTES_CACHE_MAX_BYTES au total, le moins récemment utilisé est oublié).
+OUTPUT_SPOOL_MAX_BYTES = 64 << 20
+TEMPLATE_BYTES_CACHE_MAX_BYTES = 64 << 20
+IO_BLOCK_BYTES = 8 << 20
+_template_bytes_cache = {}  # {chemin absolu: ((date, taille), contenu)}, du moins au plus récemment utilisé
+_template_bytes_lock = threading.Lock()
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def read_file_bytes(path):
+    # Renvoie ((date, taille), contenu) : une ouverture et une lecture séquentielle du fichier entier
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        return (stat.st_mtime_ns, stat.st_size), f.read()
+
+def template_bytes(path):
+    # Contenu du modèle, relu seulement si sa date ou sa taille a changé
+    key, signature = os.path.abspath(path), _file_signature(path)
+    with _template_bytes_lock:
+        cached = _template_bytes_cache.pop(key, None)
+        if cached is not None and cached[0] == signature:
+            _template_bytes_cache[key] = cached
+            profile_note("modele_en_memoire", "réutilisé")
+            return cached[1]
+    with profiled("lecture_modele"): signature, data = read_file_bytes(path)
+    with _template_bytes_lock:
+        _template_bytes_cache.pop(key, None)
+        _template_bytes_cache[key] = (signature, data)
+        total = sum(len(content) for _, content in _template_bytes_cache.values())
+        while total > TEMPLATE_BYTES_CACHE_MAX_BYTES and len(_template_bytes_cache) > 1:
+            total -= len(_template_bytes_cache.pop(next(iter(_template_bytes_cache)))[1])
+    return data
+
+def open_template(path):
+    return io.BytesIO(template_bytes(path))
+
+def template_sha256(path):
+    # Empreinte calculée sur le contenu gardé en mémoire : le modèle n'est pas relu pour autant
+    return hashlib.sha256(template_bytes(path)).hexdigest()
+
+def bulk_source(source):
+    # Chemin : contenu lu d'un bloc (non mis en cache) ; fichier déjà ouvert ou tampon : inchangé
+    return io.BytesIO(read_file_bytes(source)[1]) if isinstance(source, (str, os.PathLike)) else source
+
+def output_spool():
+    import tempfile  # chargé au premier enregistrement seulement, comme openpyxl
+    return tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_BYTES)
+
+def publish_spool(spool, output_file):
+    # Copie séquentielle du contenu préparé, puis renommage : la destination n'est jamais à moitié écrite
+    tmp_file = _temporary_path(output_file)
+    try:
+        spool.seek(0)
+        with open(tmp_file, "wb", buffering=0) as f:
+            shutil.copyfileobj(spool, f, IO_BLOCK_BYTES)
+            os.fsync(f.fileno())
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        _remove_quietly(tmp_file)
+        raise
+
+# --- PROFILAGE (DIAGNOSTIC, OPTIONNEL) ---
+# Activé seulement à l'intérieur de profile_operation(...) : durée et pic mémoire (tracemalloc) de
+# chaque phase signalée par progress, durée de find_data_rows, et par règle le nombre de lignes
+# classées et calculées avec le temps passé. Chaque opération ajoute un enregistrement JSON au
+# journal (une ligne par opération, fichier tournant). Un seul profilage actif à la fois.
+PROFILE_LOG_FILE = os.environ.get("MATRICE_PROFIL_LOG") or os.path.join(os.path.expanduser("~"), ".matrice_couts", "profil.jsonl")
+PROFILE_LOG_MAX_BYTES = 1 << 20
+PROFILE_LOG_BACKUPS = 5
+_RULE_DETAILS = {key: (family, bool(regexes)) for key, family, _, regexes, _, _ in LINE_RULES}
+_active_profiler = None
+_profile_loggers = {}
+
+class Profiler:
+    def __init__(self, operation, **context):
+        self.record = {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"), "operation": operation,
+            "poste": platform.node(), "python": platform.python_version(), "openpyxl": _openpyxl_version(),
+            **context, "phases": {}, "sections": {}, "regles": {},
+        }
+        self._phase, self._phase_start = None, None
+
+    def progress(self, inner=None):
+        # Rappel progress à passer à generate_matrix_logic / clear_matrix (inner : rappel d'origine)
+        def callback(phase, done=0, total=0):
+            if phase != self._phase: self._switch_phase(phase)
+            if inner is not None: inner(phase, done, total)
+        return callback
+
+    def _switch_phase(self, phase):
+        now = time.perf_counter()
+        if self._phase is not None:
+            stats = self.record["phases"].setdefault(self._phase, {"secondes": 0.0, "pic_memoire_mo": 0.0})
+            stats["secondes"] += now - self._phase_start
+            if tracemalloc.is_tracing():
+                stats["pic_memoire_mo"] = max(stats["pic_memoire_mo"], tracemalloc.get_traced_memory()[1] / 2**20)
+        if tracemalloc.is_tracing(): tracemalloc.reset_peak()
+        self._phase, self._phase_start = phase, time.perf_counter()
+
+    def add_section(self, name, seconds):
+        stats = self.record["sections"].setdefault(name, {"appels": 0, "secondes": 0.0})
+        stats["appels"] += 1
+        stats["secondes"] += seconds
+
+    def _rule_stats(self, key):
+        family, regex = _RULE_DETAILS.get(key, ("", False))
+        return self.record["regles"].setdefault(key or "sans_regle", {
+            "famille": family, "regex": regex, "lignes_classees": 0, "classification_s": 0.0, "lignes_calculees": 0, "calcul_s": 0.0})
+
+    def classify(self, designation_lower):
+        # Classification sans le cache lru de classify_designation, pour mesurer la table de règles
+        start = time.perf_counter()
+        key = _match_line_rule(designation_lower)
+        stats = self._rule_stats(key)
+        stats["lignes_classees"] += 1
+        stats["classification_s"] += time.perf_counter() - start
+        return key
+
+    def compute_line(self, line, params):
+        start = time.perf_counter()
+        result = compute_line(line, params)
+        stats = self._rule_stats(line["rule"])
+        stats["lignes_calculees"] += 1
+        stats["calcul_s"] += time.perf_counter() - start
+        return result
+
+    def finish(self, seconds, status, error=""):
+        self._switch_phase(None)
+        self.record.update(duree_s=seconds, statut=status, erreur=error)
+        peaks = [stats["pic_memoire_mo"] for stats in self.record["phases"].values()]
+        self.record["pic_memoire_mo"] = max(peaks, default=0.0)
+
+def profile_note(name, value):
+    if _active_profiler is not None: _active_profiler.record[name] = value
+
+@contextmanager
+def profiled(name):
+    # Chronomètre une étape si un profilage est actif, sans effet sinon
+    if _active_profiler is None:
+        yield
+        return
+    profiler, start = _active_profiler, time.perf_counter()
+    try: yield
+    finally: profiler.add_section(name, time.perf_counter() - start)
+
+def write_profile_record(record, log_file=None):
+    log_file = log_file or PROFILE_LOG_FILE
+    logger = _profile_loggers.get(log_file)
+    try:
+        if logger is None:
+            import logging.handlers
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            logger = logging.getLogger(f"matrice.profil.{len(_profile_loggers)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=PROFILE_LOG_MAX_BYTES, backupCount=PROFILE_LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            _profile_loggers[log_file] = logger
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+    except OSError:
+        traceback.print_exc()  # le diagnostic ne doit jamais faire échouer l'opération
+
+@contextmanager
+def profile_operation(operation, log_file=None, **context):
+    # with profile_operation("generation", modele=...) as profiler:
+    #     generate_matrix_logic(..., progress=profiler.progress())
+    global _active_profiler
+    profiler = Profiler(operation, **context)
+    for name in ("modele", "fichier"):
+        path = context.get(name)
+        if path and os.path.exists(path):
+            profiler.record[f"{name}_ko"] = os.path.getsize(path) // 1024
+            profiler.record[f"{name}_reseau"] = path.startswith(("\\\\", "//"))
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing: tracemalloc.start()
+    previous, _active_profiler = _active_profiler, profiler
+    start, status, error = time.perf_counter(), "ok", ""
+    try:
+        yield profiler
+    except OperationCancelled:
+        status = "annule"
+        raise
+    except Exception as e:
+        status, error = "erreur", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _active_profiler = previous
+        profiler.finish(time.perf_counter() - start, status, error)
+        if started_tracing: tracemalloc.stop()
+        write_profile_record(profiler.record, log_file)
+
+
+def compute_matrix(model, params, progress=None):
+    # Renvoie [(ligne, quantité, total ligne, total centre, surlignage "niveau")] et le total général
+    results, total_general = [], 0.0
+    lines = model["lines"]
+    compute = compute_line if _active_profiler is None else _active_profiler.compute_line
+    for i, line in enumerate(lines, 1):
+        _report(progress, "calcul", i, len(lines))
+        result = compute(line, params)
+        if result is None: continue
+        results.append((line["row"],) + result)
+        total_general += result[2]
+    return results, total_general
+
+
+# --- APERÇU DES TOTAUX ---
+# Totaux par section et total général tenus à jour à partir du modèle en mémoire : à chaque
+# changement de paramètres, seules les lignes qui dépendent d'un paramètre modifié
+# (LINE_RULE_INPUTS) sont recalculées, ainsi que les sections qui les contiennent.
+SECTION_SANS_TITRE = "(hors section)"
+
+class MatrixPreview:
+    def __init__(self, model):
+        self.model = model
+        self.params = None
+        self.sections = []  # [titre, lignes de la section, total]
+        section_rows = sorted(model.get("sections", []))
+        starts, titles = [row for row, _ in section_rows], [title for _, title in section_rows]
+        section_of_line = {line["row"]: bisect.bisect_left(starts, line["row"]) - 1 for line in model["lines"]}
+        for index in sorted(set(section_of_line.values())):
+            title = titles[index] if index >= 0 else SECTION_SANS_TITRE
+            self.sections.append([title, [line for line in model["lines"] if section_of_line[line["row"]] == index], 0.0])
+        self.section_index = {line["row"]: i for i, (_, lines, _) in enumerate(self.sections) for line in lines}
+        self.lines_by_input = {}
+        for line in model["lines"]:
+            for name in LINE_RULE_INPUTS[line["rule"]]: self.lines_by_input.setdefault(name, []).append(line)
+        self.line_totals = {}
+        self.total_general = 0.0
+
+    def update(self, params):
+        # Renvoie (nombre de lignes recalculées, indices des sections dont le total a été recalculé)
+        if self.params is None: lines = self.model["lines"]
+        else:
+            changed = [name for name in params if params[name] != self.params.get(name)]
+            lines = {line["row"]: line for name in changed for line in self.lines_by_input.get(name, [])}.values()
+        self.params = dict(params)
+        sections = set()
+        for line in lines:
+            result = compute_line(line, params)
+            self.line_totals[line["row"]] = result[2] if result else 0.0
+            sections.add(self.section_index[line["row"]])
+        for i in sections:
+            self.sections[i][2] = sum(self.line_totals[line["row"]] for line in self.sections[i][1])
+        self.total_general = sum(total for _, _, total in self.sections)
+        return len(lines), sorted(sections)
+
+def format_euros(value):
+    # 12345.6 -> "12 345,60"
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",")
+
+def _short_designation(designation, width=60):
+    # Désignation sur une ligne (les cellules de la colonne A contiennent souvent des retours à la ligne)
+    return " ".join(designation.split())[:width].rstrip()
+
+
+# --- BUDGET CIBLE (SOLVEUR) ---
+# "Combien de patients pour X € ?" : le total général est affine en nombre de patients (lignes à
+# coût fixe + total ligne × patients) et, à partir de 2 visites, en nombre de visites (quantités
+# d'une par visite, visites de suivi = visites - 2). Les coefficients de chaque ligne sont tirés de
+# deux calculs du modèle en mémoire ; la valeur obtenue est ensuite confirmée par compute_matrix,
+# le total général étant comparé au budget au centime près.
+BUDGET_FIELDS = {"patients": 1, "visites": 2}  # champ résolu : plus petite valeur admise
+BUDGET_UNITS = {"patients": "patient(s)", "visites": "visite(s) par patient"}
+
+def parse_budget_amount(text):
+    # "50 000,00 €" -> 50000.0 ; ValueError si le montant est absent ou négatif
+    value = str(text).replace("€", "").replace(" ", "").replace(" ", "").replace(" ", "").replace(",", ".")
+    try: amount = float(value)
+    except ValueError: raise ValueError(f"Budget invalide : {text!r}") from None
+    if not math.isfinite(amount) or amount <= 0: raise ValueError(f"Budget invalide (> 0) : {text!r}")
+    return amount
+
+def _budget_raw(raw, field):
+    # Le champ résolu reçoit sa plus petite valeur admise : il n'a pas à être saisi
+    if field not in BUDGET_FIELDS: raise ValueError(f"Paramètre à résoudre inconnu : {field} ({', '.join(BUDGET_FIELDS)}).")
+    return {**raw, field: str(BUDGET_FIELDS[field])}
+
+def validate_budget_params(raw, field, form=False):
+    return validate_study_params(_budget_raw(raw, field), form)
+
+def parse_budget_params(raw, field):
+    return parse_study_params(_budget_raw(raw, field))
+
+def _budget_total(model, params, field, value):
+    return compute_matrix(model, {**params, field: value})[1]
+
+def _within_budget(total, budget):
+    return round(total, 2) <= budget
+
+def budget_coefficients(model, params, field):
+    # {ligne: (part fixe, part par unité)} : total centre de la ligne = fixe + par unité × valeur du champ
+    start = BUDGET_FIELDS[field]
+    base = {r[0]: r[3] for r in compute_matrix(model, {**params, field: start})[0]}
+    step = {r[0]: r[3] for r in compute_matrix(model, {**params, field: start + 1})[0]}
+    coefficients = {}
+    for row in sorted(base.keys() | step.keys()):
+        per_unit = step.get(row, 0.0) - base.get(row, 0.0)
+        coefficients[row] = (base.get(row, 0.0) - per_unit * start, per_unit)
+    return coefficients
+
+def solve_budget(model, params, budget, field="patients"):
+    # Plus grande valeur entière du champ dont le total général ne dépasse pas le budget. Renvoie
+    # {"champ", "budget", "valeur" (None : budget insuffisant ou total indépendant du champ), "illimite",
+    #  "total_general", "marge", "total_suivant", "fixe", "par_unite",
+    #  "lignes": [[ligne, désignation, part fixe, part par unité, total centre]]}
+    if field not in BUDGET_FIELDS: raise ValueError(f"Paramètre à résoudre inconnu : {field} ({', '.join(BUDGET_FIELDS)}).")
+    start = BUDGET_FIELDS[field]
+    coefficients = budget_coefficients(model, params, field)
+    fixed = sum(f for f, _ in coefficients.values())
+    per_unit = sum(u for _, u in coefficients.values())
+    value, unlimited = None, False
+    if _within_budget(_budget_total(model, params, field, start), budget):
+        if per_unit <= 0: unlimited = True
+        else:
+            value = max(start, int((budget - fixed) // per_unit))
+            # Confirmation par le calcul de la matrice (arrondis flottants) : en général aucun pas
+            while value > start and not _within_budget(_budget_total(model, params, field, value), budget): value -= 1
+            while _within_budget(_budget_total(model, params, field, value + 1), budget): value += 1
+    shown = start if value is None else value
+    total = _budget_total(model, params, field, shown)
+    designations = {line["row"]: line["designation"] for line in model["lines"]}
+    return {
+        "champ": field, "budget": budget, "valeur": value, "illimite": unlimited,
+        "total_general": total, "marge": budget - total,
+        "total_suivant": None if value is None else _budget_total(model, params, field, value + 1),
+        "fixe": fixed, "par_unite": per_unit,
+        "lignes": [[row, designations[row], f, u, f + u * shown] for row, (f, u) in coefficients.items()],
+    }
+
+def run_budget(studies_file, template_file, budget, field="patients"):
+    # Une solution par étude du fichier (même format que le batch) ; le modèle n'est analysé qu'une fois
+    model = load_template_model(template_file)
+    results = []
+    for index, study in enumerate(read_study_file(studies_file), 1):
+        name = _texte_parametre(study, "etude") or f"etude_{index:03d}"
+        errors = validate_budget_params(study, field)
+        if errors: results.append({"etude": name, "solution": None, "erreur": " ".join(errors)})
+        else: results.append({"etude": name, "solution": solve_budget(model, parse_budget_params(study, field), budget, field), "erreur": ""})
+    return results
+
+def format_budget_solution(solution, max_lines=None):
+    # Résultat de solve_budget en lignes de texte (français) ; détail des lignes qui varient avec le champ
+    field, budget = solution["champ"], format_euros(solution["budget"])
+    unit = BUDGET_UNITS[field]
+    if solution["illimite"]:
+        text = [f"Budget {budget} € : le total général ({format_euros(solution['total_general'])} €) ne dépend pas du nombre de {field}."]
+    elif solution["valeur"] is None:
+        text = [f"Budget {budget} € insuffisant : avec {BUDGET_FIELDS[field]} {unit}, le total général est déjà de {format_euros(solution['total_general'])} €."]
+    else:
+        text = [f"Budget {budget} € : au plus {solution['valeur']} {unit}, total général {format_euros(solution['total_general'])} € "
+                f"(marge {format_euros(solution['marge'])} €, {solution['valeur'] + 1} : {format_euros(solution['total_suivant'])} €)."]
+    text.append(f"Part fixe {format_euros(solution['fixe'])} €, puis {format_euros(solution['par_unite'])} € par unité ({unit}).")
+    variable = sorted((line for line in solution["lignes"] if round(line[3], 2)), key=lambda line: -line[3])
+    shown = variable if max_lines is None else variable[:max_lines]
+    for row, designation, f, u, total in shown:
+        fixed_part = f" {'+' if f > 0 else '-'} {format_euros(abs(f))} € fixe" if round(f, 2) else ""
+        text.append(f"  ligne {row} {_short_designation(designation)} : {format_euros(u)} € par unité{fixed_part} = {format_euros(total)} €")
+    if len(shown) < len(variable): text.append(f"  … et {len(variable) - len(shown)} autre(s) ligne(s) variable(s)")
+    fixed_lines = [line for line in solution["lignes"] if not round(line[3], 2)]
+    if fixed_lines: text.append(f"  {len(fixed_lines)} ligne(s) fixe(s) : {format_euros(sum(line[4] for line in fixed_lines))} €")
+    return text
+
+
+# --- ENREGISTREMENT RAPIDE (.xlsm) ---
+# Écrit directement dans le fichier .xlsm (archive zip) : tous les membres sont recopiés tels quels
+# (dont xl/vbaProject.bin), seule la feuille SHEET_NAME est réécrite au fil de l'eau, cellule par
+# cellule, et styles.xml reçoit les remplissages et formats de cellule nécessaires.
+# Une mise à jour est un dictionnaire {(ligne, colonne): (valeur, couleur)} ; KEEP_VALUE conserve
+# la valeur existante, une couleur None retire le remplissage.
+class _KeepValue:
+    # Sentinelle unique, y compris après pickle (mises à jour envoyées à un autre processus)
+    def __reduce__(self): return "KEEP_VALUE"
+    def __repr__(self): return "KEEP_VALUE"
+
+KEEP_VALUE = _KeepValue()
+
+class XlsmPatchError(Exception):
+    # Structure non prise en charge par l'enregistrement rapide : repli sur openpyxl
+    pass
+
+_XML_CELL_RE = re.compile(rb"<c\b[^>]*?(?:/>|>.*?</c>)", re.S)
+_XML_ATTR_RE = r'\b%s="([^"]*)"'
+_XML_VALUE_RE = re.compile(rb"<v>[^<]|<f\b|<is>")
+_CELL_REF_RE = re.compile(r"([A-Z]+)(\d+)")
+
+def _xml_attr(tag, name):
+    match = re.search((_XML_ATTR_RE % name).encode(), tag)
+    return match.group(1).decode() if match else None
+
+def _set_xml_attr(tag, name, value):
+    # tag : balise ouvrante (bytes), attribut remplacé ou ajouté
+    attr = f'{name}="{value}"'.encode()
+    pattern = (_XML_ATTR_RE % name).encode()
+    if re.search(pattern, tag): return re.sub(pattern, attr, tag, count=1)
+    end = len(tag) - 2 if tag.endswith(b"/>") else len(tag) - 1
+    return tag[:end] + b" " + attr + tag[end:]
+
+def _column_index(letters):
+    index = 0
+    for letter in letters: index = index * 26 + ord(letter) - 64
+    return index
+
+def _column_letters(index):
+    letters = ""
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+def _xml_number(value):
+    if isinstance(value, bool): value = int(value)
+    if isinstance(value, int): return str(value)
+    if isinstance(value, float) and math.isfinite(value): return "%.16g" % value  # même format qu'openpyxl
+    raise XlsmPatchError(f"Valeur non numérique non prise en charge : {value!r}")
+
+def _resolve_sheet_path(archive, sheet_name):
+    ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main", "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships"}
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    for sheet in workbook.iterfind("m:sheets/m:sheet", ns):
+        if sheet.get("name") == sheet_name:
+            rel_id = sheet.get(f"{{{ns['r']}}}id")
+            break
+    else:
+        raise KeyError(sheet_name)
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels:
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    raise XlsmPatchError(f"Relation {rel_id} introuvable pour la feuille '{sheet_name}'.")
+
+
+class _StylesPatch:
+    # Ajoute à styles.xml les remplissages et formats de cellule (cellXfs) demandés, sans toucher au reste
+    _FILL_RE = re.compile(rb"<fill\b[^>]*?(?:/>|>.*?</fill>)", re.S)
+    _XF_RE = re.compile(rb"<xf\b[^>]*?(?:/>|>.*?</xf>)", re.S)
+
+    def __init__(self, xml):
+        self.xml = xml
+        self.fills_section = re.search(rb"<fills\b[^>]*>(.*?)</fills>", xml, re.S)
+        self.xfs_section = re.search(rb"<cellXfs\b[^>]*>(.*?)</cellXfs>", xml, re.S)
+        if not self.fills_section or not self.xfs_section:
+            raise XlsmPatchError("styles.xml sans section fills ou cellXfs.")
+        self.fills = self._FILL_RE.findall(self.fills_section.group(1))
+        self.xfs = self._XF_RE.findall(self.xfs_section.group(1))
+        self.new_fills, self.new_xfs = [], []
+        self._fill_ids, self._styles = {None: 0}, {}
+
+    def _xf(self, style):
+        xfs = self.xfs + self.new_xfs
+        return xfs[style] if 0 <= style < len(xfs) else xfs[0]
+
+    def has_fill(self, style):
+        # Équivalent de "cell.fill.fgColor.rgb != '00000000'" avec openpyxl
+        fill_id = int(_xml_attr(self._xf(style), "fillId") or 0)
+        fills = self.fills + self.new_fills
+        if fill_id >= len(fills): return False
+        color = re.search(rb"<fgColor\b[^>]*", fills[fill_id])
+        return bool(color) and _xml_attr(color.group(0), "rgb") != "00000000"
+
+    def fill_id(self, color):
+        if color not in self._fill_ids:
+            rgb = ("00" + color) if len(color) == 6 else color
+            self.new_fills.append(f'<fill><patternFill patternType="solid"><fgColor rgb="{rgb}"/><bgColor rgb="{rgb}"/></patternFill></fill>'.encode())
+            self._fill_ids[color] = len(self.fills) + len(self.new_fills) - 1
+        return self._fill_ids[color]
+
+    def style_with_fill(self, style, color):
+        key = (style, color)
+        if key not in self._styles:
+            xf = self._xf(style)
+            tag_end = xf.index(b">") + 1
+            tag = _set_xml_attr(_set_xml_attr(xf[:tag_end], "fillId", self.fill_id(color)), "applyFill", 1)
+            self.new_xfs.append(tag + xf[tag_end:])
+            self._styles[key] = len(self.xfs) + len(self.new_xfs) - 1
+        return self._styles[key]
+
+    def serialize(self):
+        if not self.new_xfs: return self.xml
+        def section(match, items, name):
+            tag = _set_xml_attr(re.match(rb"<%s\b[^>]*>" % name, match.group(0)).group(0), "count", len(items))
+            return tag + b"".join(items) + b"</%s>" % name
+        fills = section(self.fills_section, self.fills + self.new_fills, b"fills")
+        xfs = section(self.xfs_section, self.xfs + self.new_xfs, b"cellXfs")
+        a, b = self.fills_section.span()
+        c, d = self.xfs_section.span()
+        if a < c: return self.xml[:a] + fills + self.xml[b:c] + xfs + self.xml[d:]
+        return self.xml[:c] + xfs + self.xml[d:a] + fills + self.xml[b:]
+
+
+class _SheetPatch:
+    # Réécriture en flux du XML de la feuille : seules les lignes concernées par les mises à jour sont analysées
+    _ROW_START_RE = re.compile(rb'<row\b(?:[^>]*?\br="(\d+)")?')
+
+    def __init__(self, updates, styles, clear):
+        self.rows = {}
+        for (r, c), update in updates.items(): self.rows.setdefault(r, {})[c] = update
+        self.pending = sorted(self.rows)
+        self.styles, self.clear = styles, clear
+        self.column_styles = {}
+        self.changed = 0
+
+    def read_columns(self, head):
+        # Style par défaut des colonnes, appliqué aux cellules créées
+        columns = {c for cells in self.rows.values() for c in cells}
+        for col in re.findall(rb"<col\b[^>]*>", head):
+            style = _xml_attr(col, "style")
+            if style is None: continue
+            first, last = int(_xml_attr(col, "min")), int(_xml_attr(col, "max"))
+            for c in columns:
+                if first <= c <= last: self.column_styles[c] = int(style)
+
+    def _new_cell(self, r, c, update, base_style):
+        value, color = update
+        style = self.styles.style_with_fill(base_style, color)
+        ref = f"{_column_letters(c)}{r}"
+        self.changed += 1
+        if value is None or value is KEEP_VALUE: return f'<c r="{ref}" s="{style}"/>'.encode()
+        return f'<c r="{ref}" s="{style}"><v>{_xml_number(value)}</v></c>'.encode()
+
+    def _patch_cell(self, r, c, cell, update):
+        value, color = update
+        tag_end = cell.index(b">") + 1
+        tag = cell[:tag_end]
+        style = int(_xml_attr(tag, "s") or 0)
+        has_value = bool(_XML_VALUE_RE.search(cell))
+        if self.clear and not has_value and not self.styles.has_fill(style): return cell
+        if re.search(rb"<f\b[^>]*\bref=", cell):
+            raise XlsmPatchError(f"Formule partagée ou matricielle en {_column_letters(c)}{r}.")
+        if value is KEEP_VALUE:
+            # Seul le remplissage change : contenu de la cellule conservé
+            self.changed += 1
+            return _set_xml_attr(tag, "s", self.styles.style_with_fill(style, color)) + cell[tag_end:]
+        return self._new_cell(r, c, update, style)
+
+    def patch_row(self, row_xml):
+        tag_end = row_xml.index(b">") + 1
+        tag = row_xml[:tag_end]
+        r = int(_xml_attr(tag, "r") or 0)
+        if not r: raise XlsmPatchError("Ligne sans attribut r dans la feuille.")
+        out = self.flush_before(r)
+        if r not in self.rows: return out + row_xml
+        self.pending.remove(r)
+        updates = self.rows[r]
+        row_style = int(_xml_attr(tag, "s") or 0) if _xml_attr(tag, "customFormat") in ("1", "true") else None
+        cells, done, created = [], set(), False
+        body = b"" if tag.endswith(b"/>") else row_xml[tag_end:-len(b"</row>")]
+        position = 0
+        for match in _XML_CELL_RE.finditer(body):
+            cells.append(body[position:match.start()])
+            position = match.end()
+            cell = match.group(0)
+            ref = _xml_attr(cell[:cell.index(b">") + 1], "r")
+            if ref is None: raise XlsmPatchError(f"Cellule sans référence à la ligne {r}.")
+            c = _column_index(_CELL_REF_RE.match(ref).group(1))
+            for missing in sorted(col for col in updates if col < c and col not in done):
+                if not self.clear:
+                    cells.append(self._new_cell(r, missing, updates[missing], row_style if row_style is not None else self.column_styles.get(missing, 0)))
+                    created = True
+                done.add(missing)
+            if c in updates:
+                cell = self._patch_cell(r, c, cell, updates[c])
+                done.add(c)
+            cells.append(cell)
+        tail = body[position:]
+        for missing in sorted(col for col in updates if col not in done):
+            if not self.clear:
+                cells.append(self._new_cell(r, missing, updates[missing], row_style if row_style is not None else self.column_styles.get(missing, 0)))
+                created = True
+        if tag.endswith(b"/>"): tag = tag[:-2] + b">"
+        if created: tag = re.sub(rb'\sspans="[^"]*"', b"", tag)
+        return out + tag + b"".join(cells) + tail + b"</row>"
+
+    def flush_before(self, r=None):
+        # Lignes absentes de la feuille mais à écrire (mode génération uniquement)
+        out = []
+        while self.pending and (r is None or self.pending[0] < r):
+            row = self.pending.pop(0)
+            if self.clear: continue
+            cells = [self._new_cell(row, c, self.rows[row][c], self.column_styles.get(c, 0)) for c in sorted(self.rows[row])]
+            out.append(f'<row r="{row}">'.encode() + b"".join(cells) + b"</row>")
+        return b"".join(out)
+
+    def stream(self, src, dst, chunk_size=1 << 20):
+        # Les lignes sans mise à jour sont recopiées par blocs, sans être analysées ; l'écriture dans
+        # l'archive se fait aussi par blocs (un appel au compresseur par bloc et non par ligne)
+        buffer, state, eof = b"", "head", False
+        out, out_size = [], 0
+        def write(data):
+            nonlocal out_size
+            out.append(data)
+            out_size += len(data)
+            if out_size >= chunk_size:
+                dst.write(b"".join(out))
+                out.clear()
+                out_size = 0
+        while True:
+            if not eof:
+                chunk = src.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+            if state == "head":
+                start = buffer.find(b"<sheetData")
+                if start == -1 or buffer.find(b">", start) == -1:
+                    if eof: raise XlsmPatchError("Balise sheetData introuvable.")
+                    continue
+                end = buffer.index(b">", start) + 1
+                self.read_columns(buffer[:start])
+                if buffer[end - 2:end] == b"/>":
+                    write(buffer[:start] + b"<sheetData>" + self.flush_before() + b"</sheetData>")
+                    buffer, state = buffer[end:], "tail"
+                else:
+                    write(buffer[:end])
+                    buffer, state = buffer[end:], "rows"
+            if state == "rows":
+                data_end = buffer.find(b"</sheetData>")
+                limit = data_end if data_end != -1 else len(buffer)
+                position, keep = 0, None
+                for match in self._ROW_START_RE.finditer(buffer, 0, limit):
+                    start = match.start()
+                    if match.group(1) is None:
+                        if buffer.find(b">", start, limit) == -1: keep = start; break  # balise coupée en fin de bloc
+                        raise XlsmPatchError("Ligne sans attribut r dans la feuille.")
+                    if not self.pending or int(match.group(1)) < self.pending[0]: continue  # ligne inchangée
+                    tag_end = buffer.find(b">", match.end(), limit)
+                    if tag_end == -1: keep = start; break
+                    if buffer[tag_end - 1:tag_end] == b"/": end = tag_end + 1
+                    else:
+                        end = buffer.find(b"</row>", tag_end, limit)
+                        if end == -1: keep = start; break
+                        end += len(b"</row>")
+                    write(buffer[position:start])
+                    write(self.patch_row(buffer[start:end]))
+                    position = end
+                if keep is None and data_end != -1:
+                    write(buffer[position:data_end] + self.flush_before())
+                    buffer, state = buffer[data_end:], "tail"
+                else:
+                    # Fin du bloc : la dernière balise, peut-être incomplète, est relue avec le bloc suivant
+                    if keep is None: keep = max(buffer.rfind(b"<", position), position)
+                    write(buffer[position:keep])
+                    buffer = buffer[keep:]
+                    if eof: raise XlsmPatchError("Fin de sheetData introuvable.")
+            if state == "tail":
+                write(buffer)
+                buffer = b""
+                if eof: break
+        dst.write(b"".join(out))
+        return self.changed
+
+
+def _workbook_xml_for_recalc(xml):
+    # Les totaux en formule (ex. =SUM(G19:G200)) doivent être recalculés par Excel à l'ouverture
+    calc = re.search(rb"<calcPr\b[^>]*>", xml)
+    if calc: return xml[:calc.start()] + _set_xml_attr(calc.group(0), "fullCalcOnLoad", 1) + xml[calc.end():]
+    for anchor in (b"</definedNames>", b"</externalReferences>", b"</sheets>"):
+        position = xml.find(anchor)
+        if position != -1:
+            position += len(anchor)
+            return xml[:position] + b'<calcPr fullCalcOnLoad="1"/>' + xml[position:]
+    return xml
+
+# Propriétés personnalisées du document (docProps/custom.xml) : l'état de la dernière génération y
+# est enregistré (voir MISE À JOUR INCRÉMENTALE)
+_CUSTOM_PROPS_PATH = "docProps/custom.xml"
+_CUSTOM_PROPS_TYPE = "application/vnd.openxmlformats-officedocument.custom-properties+xml"
+_CUSTOM_PROPS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/custom-properties"
+_CUSTOM_PROPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/custom-properties"
+_VT_NS = "http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes"
+_CUSTOM_PROPS_FMTID = "{D5CDD505-2E9C-101B-9397-08002B2CF9AE}"
+
+def read_custom_property(xml, name):
+    # Valeur (texte) de la propriété personnalisée name, ou None
+    for prop in ET.fromstring(xml).iterfind(f"{{{_CUSTOM_PROPS_NS}}}property"):
+        if prop.get("name") == name: return prop[0].text if len(prop) else None
+    return None
+
+def _custom_properties_xml(xml, name, value):
+    # docProps/custom.xml (None : à créer) avec la propriété texte name = value, remplacée si elle existe
+    def prop(pid):
+        return (f'<property fmtid="{_CUSTOM_PROPS_FMTID}" pid="{pid}" name="{html.escape(name)}">'
+                f'<vt:lpwstr xmlns:vt="{_VT_NS}">{html.escape(value, quote=False)}</vt:lpwstr></property>').encode("utf-8")
+    if xml is None:
+        return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Properties xmlns="{_CUSTOM_PROPS_NS}">'.encode()
+                + prop(2) + b"</Properties>")
+    existing = re.search(rb'<property\b[^>]*\bname="%s"[^>]*>.*?</property>' % re.escape(html.escape(name).encode("utf-8")), xml, re.S)
+    if existing:
+        return xml[:existing.start()] + prop(_xml_attr(existing.group(0)[:existing.group(0).index(b">")], "pid")) + xml[existing.end():]
+    pids = [int(pid) for pid in re.findall(rb'<property\b[^>]*\bpid="(\d+)"', xml)]
+    end = xml.rindex(b"</Properties>")
+    return xml[:end] + prop(max(pids, default=1) + 1) + xml[end:]
+
+def _package_xml_with_custom_props(filename, xml):
+    # Déclare docProps/custom.xml dans [Content_Types].xml et _rels/.rels s'il vient d'être ajouté
+    if filename == "[Content_Types].xml" and b"/docProps/custom.xml" not in xml:
+        end = xml.rindex(b"</Types>")
+        return xml[:end] + f'<Override PartName="/{_CUSTOM_PROPS_PATH}" ContentType="{_CUSTOM_PROPS_TYPE}"/>'.encode() + xml[end:]
+    if filename == "_rels/.rels" and _CUSTOM_PROPS_REL.encode() not in xml:
+        ids, i = set(re.findall(rb'\bId="([^"]*)"', xml)), 1
+        while f"rId{i}".encode() in ids: i += 1
+        end = xml.rindex(b"</Relationships>")
+        return xml[:end] + f'<Relationship Type="{_CUSTOM_PROPS_REL}" Target="{_CUSTOM_PROPS_PATH}" Id="rId{i}"/>'.encode() + xml[end:]
+    return xml
+
+def _copy_zipinfo(info):
+    # Nouvel en-tête pour l'archive de sortie (zipfile modifie l'objet ZipInfo utilisé en écriture)
+    copy = zipfile.ZipInfo(info.filename, info.date_time)
+    copy.compress_type, copy.external_attr, copy.create_system = info.compress_type, info.external_attr, info.create_system
+    return copy
+
+def patch_xlsm_cells(source_file, output_file, updates, clear=False, progress=None, state=None):
+    # clear=True : seules les cellules existantes ayant une valeur ou un remplissage sont modifiées
+    # (comptées dans la valeur renvoyée), aucune cellule n'est créée.
+    # state : état de la matrice (update_matrix), complété par l'empreinte (CRC, taille) de la
+    # feuille écrite et enregistré dans la propriété personnalisée MATRIX_STATE_PROPERTY.
+    # output_file : chemin (publié à la fin, voir publish_spool) ou tampon en mémoire, écrit directement.
+    to_path = isinstance(output_file, (str, os.PathLike))
+    with (output_spool() if to_path else nullcontext(output_file)) as spool:
+        with zipfile.ZipFile(bulk_source(source_file)) as zin:
+            sheet_path = _resolve_sheet_path(zin, SHEET_NAME)
+            styles = _StylesPatch(zin.read("xl/styles.xml"))
+            sheet_patch = _SheetPatch(updates, styles, clear)
+            names = zin.namelist()
+            drop_calc_chain = "xl/calcChain.xml" in names
+            add_custom_props = state is not None and _CUSTOM_PROPS_PATH not in names
+            _report(progress, "enregistrement", 0, len(names))
+            with zipfile.ZipFile(spool, "w", zipfile.ZIP_DEFLATED) as zout:
+                # La feuille d'abord : styles.xml dépend des cellules modifiées, l'état de la matrice de la feuille écrite
+                sheet_info = _copy_zipinfo(zin.getinfo(sheet_path))
+                with zin.open(sheet_path) as src, zout.open(sheet_info, "w", force_zip64=True) as dst:
+                    changed = sheet_patch.stream(src, dst)
+                if state is not None:
+                    state["archive"] = [sheet_info.CRC, sheet_info.file_size]
+                    state_value = json.dumps(state, separators=(",", ":"))
+                for i, info in enumerate(zin.infolist(), 1):
+                    _report(progress, "enregistrement", i, len(names))
+                    if info.filename == sheet_path: continue
+                    if info.filename == "xl/calcChain.xml": continue
+                    if info.filename == "xl/styles.xml":
+                        zout.writestr(_copy_zipinfo(info), styles.serialize())
+                    elif info.filename == "xl/workbook.xml":
+                        zout.writestr(_copy_zipinfo(info), _workbook_xml_for_recalc(zin.read(info)))
+                    elif state is not None and info.filename == _CUSTOM_PROPS_PATH:
+                        zout.writestr(_copy_zipinfo(info), _custom_properties_xml(zin.read(info), MATRIX_STATE_PROPERTY, state_value))
+                    elif (drop_calc_chain and info.filename in ("[Content_Types].xml", "xl/_rels/workbook.xml.rels")) or \
+                            (add_custom_props and info.filename in ("[Content_Types].xml", "_rels/.rels")):
+                        xml = zin.read(info)
+                        # La chaîne de calcul référence d'anciennes formules : supprimée comme le fait openpyxl
+                        if drop_calc_chain: xml = re.sub(rb"<(?:Override|Relationship)\b[^>]*calcChain[^>]*/>", b"", xml)
+                        if add_custom_props: xml = _package_xml_with_custom_props(info.filename, xml)
+                        zout.writestr(_copy_zipinfo(info), xml)
+                    else:
+                        with zin.open(info) as src, zout.open(_copy_zipinfo(info), "w", force_zip64=True) as dst:
+                            shutil.copyfileobj(src, dst, 1 << 20)
+                if add_custom_props:
+                    zout.writestr(_CUSTOM_PROPS_PATH, _custom_properties_xml(None, MATRIX_STATE_PROPERTY, state_value))
+        if to_path: publish_spool(spool, output_file)
+    return changed
+
+
+def _cell_position(ref):
+    letters, row = _CELL_REF_RE.match(ref).groups()
+    return int(row), _column_index(letters)
+
+def matrix_cell_updates(model, params, results, total_general):
+    updates = {_cell_position(PATIENT_COUNT_CELL): (params["patients"], HIGHLIGHT_COLOR_DEFAULT)}
+    for r, quantity_per_patient_or_center, total_ligne, total_centre, is_highlight_level in results:
+        color = HIGHLIGHT_COLOR_LEVEL if is_highlight_level else HIGHLIGHT_COLOR_DEFAULT
+        updates[(r, COL_MONTANT_UNITAIRE)] = (KEEP_VALUE, color)
+        updates[(r, COL_NOMBRE_ITEMS)] = (quantity_per_patient_or_center, color)
+        updates[(r, COL_TOTAL_LIGNE)] = (total_ligne, color)
+        updates[(r, COL_TOTAL_CENTRE)] = (total_centre, color)
+    if model["total_row"] > 0:
+        updates[(model["total_row"], COL_TOTAL_CENTRE)] = (total_general, HIGHLIGHT_COLOR_DEFAULT)
+    return updates
+
+def clear_cell_updates(firstRow, lastRow, totalRow):
+    updates = {}
+    for r in range(firstRow, lastRow + 20):
+        for c in [COL_NOMBRE_ITEMS, COL_TOTAL_LIGNE, COL_TOTAL_CENTRE]: updates[(r, c)] = (None, None)
+    if totalRow > 0: updates[(totalRow, COL_TOTAL_CENTRE)] = (None, None)
+    updates[_cell_position(PATIENT_COUNT_CELL)] = (None, None)
+    return updates
+
+def apply_cell_updates(sheet, updates, progress=None):
+    for i, ((r, c), (value, color)) in enumerate(updates.items(), 1):
+        _report(progress, "ecriture", i, len(updates))
+        cell = sheet.cell(row=r, column=c)
+        if value is not KEEP_VALUE: cell.value = value
+        cell.fill = fill_for_color(color)
+
+def generate_matrix_logic(source_file, output_file, params, fast_save=False, progress=None, on_results=None, session=None):
+    # on_results(model, results, total_general) est appelé une fois la matrice enregistrée ;
+    # session : TemplateSession qui garde le classeur du modèle ouvert d'une génération à l'autre
+    if fast_save:
+        _report(progress, "lignes")
+        model = load_template_model(source_file)
+        results, total_general = compute_matrix(model, params, progress)
+        try:
+            patch_xlsm_cells(open_template(source_file), output_file, matrix_cell_updates(model, params, results, total_general), progress=progress)
+            if on_results: on_results(model, results, total_general)
+            return total_general
+        except XlsmPatchError:
+            traceback.print_exc()  # repli sur l'enregistrement complet par openpyxl
+
+    if session is not None:
+        # Classeur déjà ouvert pendant la session : remis dans l'état du modèle à la sortie
+        with session.checkout(source_file, progress) as template:
+            _report(progress, "lignes")
+            model = template["model"]
+            results, total_general = compute_matrix(model, params, progress)
+            apply_cell_updates(template["sheet"], matrix_cell_updates(model, params, results, total_general), progress)
+            save_workbook_atomic(template["workbook"], output_file, progress)
+        if on_results: on_results(model, results, total_general)
+        return total_general
+
+    _report(progress, "chargement")
+    workbook = load_workbook(open_template(source_file), keep_vba=True)
+    sheet = workbook[SHEET_NAME]
+    _report(progress, "lignes")
+    model = load_template_model(source_file, sheet)
+    results, total_general = compute_matrix(model, params, progress)
+    apply_cell_updates(sheet, matrix_cell_updates(model, params, results, total_general), progress)
+    save_workbook_atomic(workbook, output_file, progress)
+    if on_results: on_results(model, results, total_general)
+    return total_general
+
+def clear_matrix(target_file, fast_save=False, progress=None):
+    # Renvoie le nombre de cellules effacées, ou None si la plage de données est introuvable
+    if fast_save:
+        _report(progress, "lignes")
+        content = bulk_source(target_file)  # une seule lecture : repérage des lignes puis réécriture
+        rows = read_matrix_rows(content, max_col=COL_DESIGNATION)
+        with profiled("find_data_rows"): firstRow, lastRow, totalRow = locate_data_rows([row[0] for row in rows[START_ROW - 1:]])
+        if not (firstRow > 0 and lastRow >= firstRow): return None
+        try:
+            return patch_xlsm_cells(content, target_file, clear_cell_updates(firstRow, lastRow, totalRow), clear=True, progress=progress)
+        except XlsmPatchError:
+            traceback.print_exc()
+
+    _report(progress, "chargement")
+    workbook = load_workbook(target_file, keep_vba=True)
+    sheet = workbook[SHEET_NAME]
+    _report(progress, "lignes")
+    firstRow, lastRow, totalRow = find_data_rows(sheet)
+    if not (firstRow > 0 and lastRow >= firstRow): return None
+    count_cleared = 0
+    updates = clear_cell_updates(firstRow, lastRow, totalRow)
+    for i, (r, c) in enumerate(updates, 1):
+        _report(progress, "ecriture", i, len(updates))
+        cell_to_clear = sheet.cell(row=r, column=c)
+        if cell_to_clear.value is not None or cell_to_clear.fill.fgColor.rgb != '00000000':
+            cell_to_clear.value = None
+            cell_to_clear.fill = fill_for_color(None)
+            count_cleared += 1
+    save_workbook_atomic(workbook, target_file, progress)
+    return count_cleared
+
+
+# --- MODÈLE GARDÉ OUVERT PENDANT LA SESSION (INTERFACE) ---
+# Les générations successives à partir du même modèle réutilisent le classeur déjà chargé. À son
+# ouverture, l'état d'origine (valeur et style) de chaque cellule que le calcul peut écrire (colonnes
+# D à G des lignes de données, total général, PATIENT_COUNT_CELL) est mémorisé ; après chaque
+# génération, seules ces cellules sont remises en l'état. Le classeur est rechargé si le fichier
+# change sur le disque et, au-delà de TEMPLATE_SESSION_LIMIT modèles ouverts, le moins récemment
+# utilisé est refermé.
+TEMPLATE_SESSION_LIMIT = 2
+
+def template_cells(model):
+    # Toutes les cellules que matrix_cell_updates peut écrire pour ce modèle, quels que soient les paramètres
+    cells = [_cell_position(PATIENT_COUNT_CELL)]
+    for line in model["lines"]:
+        cells += [(line["row"], c) for c in (COL_MONTANT_UNITAIRE, COL_NOMBRE_ITEMS, COL_TOTAL_LIGNE, COL_TOTAL_CENTRE)]
+    if model["total_row"] > 0: cells.append((model["total_row"], COL_TOTAL_CENTRE))
+    return cells
+
+class TemplateSession:
+    # Modèles ouverts, du moins au plus récemment utilisé :
+    # {chemin absolu: {"signature", "workbook", "sheet", "model", "original"}}
+    def __init__(self, limit=TEMPLATE_SESSION_LIMIT):
+        self.limit = max(1, limit)
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, source_file):
+        return os.path.abspath(source_file) in self._templates
+
+    def _open(self, source_file, progress=None):
+        key = os.path.abspath(source_file)
+        signature = _file_signature(source_file)  # relevée avant le chargement : une modification pendant celui-ci sera vue la fois suivante
+        template = self._templates.pop(key, None)
+        if template is not None and template["signature"] != signature:
+            profile_note("modele_session", "rechargé (fichier modifié)")
+            template = None
+        if template is None:
+            _report(progress, "chargement")
+            workbook = load_workbook(open_template(source_file), keep_vba=True)
+            sheet = workbook[SHEET_NAME]
+            model = load_template_model(source_file, sheet)
+            original = {}
+            snapshot_cells(sheet, template_cells(model), original)
+            template = {"signature": signature, "workbook": workbook, "sheet": sheet, "model": model, "original": original}
+        else:
+            profile_note("modele_session", "réutilisé")
+        self._templates[key] = template
+        while len(self._templates) > self.limit: del self._templates[next(iter(self._templates))]
+        return template
+
+    @contextmanager
+    def checkout(self, source_file, progress=None):
+        # Classeur du modèle prêt à être rempli (un seul utilisateur à la fois) ; restauré à la sortie,
+        # y compris après une annulation ou une erreur
+        with self._lock:
+            template = self._open(source_file, progress)
+            try: yield template
+            finally: restore_cells(template["sheet"], dict(template["original"]))
+
+    def clear(self):
+        with self._lock: self._templates.clear()
+
+
+# --- MISE À JOUR INCRÉMENTALE D'UNE MATRICE DÉJÀ REMPLIE ---
+# Chaque génération par update_matrix enregistre dans la matrice (propriété personnalisée du
+# document MATRIX_STATE_PROPERTY) les paramètres de l'étude, l'empreinte du modèle et, pour chaque
+# ligne calculée, une empreinte de ses entrées (montants du modèle, paramètres dont elle dépend)
+# et de ses sorties (colonnes E, F, G et couleur). À la génération suivante vers le même fichier,
+# tout est recalculé en mémoire mais seules les lignes dont les sorties ont changé sont réécrites,
+# avec B10 et le TOTAL GÉNÉRAL. Génération complète depuis le modèle quand l'état est absent ou
+# ne correspond plus : autre modèle, ligne qui n'est plus remplie, ou feuille modifiée depuis
+# (empreinte de la feuille dans l'archive en enregistrement rapide, contenu des cellules sinon).
+MATRIX_STATE_PROPERTY = "MatriceEtat"
+MATRIX_STATE_VERSION = 1
+
+def _cell_text(value):
+    # Valeur telle qu'enregistrée dans la feuille (même écriture que _xml_number)
+    if value is None: return ""
+    if isinstance(value, bool): value = int(value)
+    return "%.16g" % value if isinstance(value, float) else str(value)
+
+def _short_hash(*values):
+    return hashlib.blake2b("\x1f".join(map(str, values)).encode("utf-8"), digest_size=6).hexdigest()
+
+def row_inputs_hash(line, params):
+    return _short_hash(line["rule"], line["montant_texte"], line["temps"], *(params[name] for name in LINE_RULE_INPUTS[line["rule"]]))
+
+def row_outputs_hash(quantity, total_ligne, total_centre, color):
+    return _short_hash(_cell_text(quantity), _cell_text(total_ligne), _cell_text(total_centre), color)
+
+def matrix_state(model, template_hash, params, results, total_general):
+    # État enregistré dans la matrice : {"lignes": {ligne: [empreinte entrées, empreinte sorties, total centre]}, ...}
+    lines = {line["row"]: line for line in model["lines"]}
+    rows = {}
+    for r, quantity, total_ligne, total_centre, is_highlight_level in results:
+        color = HIGHLIGHT_COLOR_LEVEL if is_highlight_level else HIGHLIGHT_COLOR_DEFAULT
+        rows[str(r)] = [row_inputs_hash(lines[r], params), row_outputs_hash(quantity, total_ligne, total_centre, color), total_centre]
+    return {"version": MATRIX_STATE_VERSION, "regles": _RULES_SIGNATURE, "feuille": SHEET_NAME, "modele": template_hash,
+            "parametres": params, "total_general": total_general, "lignes": rows, "archive": None}
+
+def read_matrix_state(path):
+    # Renvoie (état enregistré dans la matrice ou None, [CRC, taille] de la feuille dans l'archive ou None) ;
+    # path : chemin (lu d'un bloc) ou contenu déjà lu
+    try:
+        with zipfile.ZipFile(bulk_source(path)) as archive:
+            info = archive.getinfo(_resolve_sheet_path(archive, SHEET_NAME))
+            xml = archive.read(_CUSTOM_PROPS_PATH) if _CUSTOM_PROPS_PATH in archive.namelist() else None
+        value = read_custom_property(xml, MATRIX_STATE_PROPERTY) if xml else None
+        state = json.loads(value) if value else None
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, XlsmPatchError, ET.ParseError):
+        return None, None
+    return (state if isinstance(state, dict) else None), [info.CRC, info.file_size]
+
+def _incremental_refusal(previous, state, sheet_info=None):
+    # Raison d'une génération complète, ou None si la matrice existante peut être mise à jour
+    if previous is None: return "aucun état de génération dans la matrice existante"
+    if any(previous.get(key) != state[key] for key in ("version", "regles", "feuille")): return "état enregistré par une autre version de l'outil"
+    if previous.get("modele") != state["modele"]: return "modèle différent de celui de la dernière génération"
+    removed = sorted(set(previous.get("lignes", {})) - set(state["lignes"]), key=int)
+    if removed: return f"ligne(s) qui ne sont plus remplies : {', '.join(removed)}"
+    if sheet_info is not None:
+        # Enregistrement rapide : la feuille doit être exactement celle écrite par la dernière génération
+        if previous.get("archive") is None: return "dernière génération enregistrée par openpyxl (empreinte de la feuille inconnue)"
+        if previous["archive"] != sheet_info: return "feuille modifiée depuis la dernière génération"
+    return None
+
+def _sheet_row_outputs_hash(sheet, r):
+    # Empreinte des sorties d'une ligne lue dans la feuille ouverte (None si les remplissages diffèrent)
+    cells = [sheet.cell(row=r, column=c) for c in (COL_MONTANT_UNITAIRE, COL_NOMBRE_ITEMS, COL_TOTAL_LIGNE, COL_TOTAL_CENTRE)]
+    colors = {cell.fill.fgColor.rgb[-6:] if cell.fill.fill_type == "solid" and isinstance(cell.fill.fgColor.rgb, str) else None for cell in cells}
+    if len(colors) != 1 or None in colors: return None
+    return row_outputs_hash(cells[1].value, cells[2].value, cells[3].value, colors.pop())
+
+def _set_workbook_state(workbook, state):
+    from openpyxl.packaging.custom import StringProperty
+    properties = workbook.custom_doc_props
+    if MATRIX_STATE_PROPERTY in properties.names: del properties[MATRIX_STATE_PROPERTY]
+    properties.append(StringProperty(name=MATRIX_STATE_PROPERTY, value=json.dumps(state, separators=(",", ":"))))
+
+def update_matrix(source_file, output_file, params, fast_save=False, progress=None, on_results=None):
+    # Génère output_file depuis le modèle, ou ne réécrit que les lignes modifiées si output_file a été
+    # produit par une génération précédente. Renvoie le rapport :
+    # {"mode": "incrementale" | "complete", "raison", "total_general", "total_precedent",
+    #  "parametres": {nom: [avant, après]}, "lignes": [[ligne, désignation, total avant, total après]], "cellules"}
+    _report(progress, "lignes")
+    model = load_template_model(source_file)
+    results, total_general = compute_matrix(model, params, progress)
+    state = matrix_state(model, template_sha256(source_file), params, results, total_general)
+    # Matrice existante lue d'un bloc, une seule fois : état enregistré, puis source de la mise à jour
+    existing = bulk_source(output_file) if os.path.exists(output_file) else None
+    previous, sheet_info = read_matrix_state(existing) if existing is not None else (None, None)
+    reason = "pas de matrice existante" if existing is None else _incremental_refusal(previous, state, sheet_info if fast_save else None)
+    full_updates = matrix_cell_updates(model, params, results, total_general)
+    previous_rows = previous.get("lignes", {}) if previous and reason is None else {}
+    rewrite = set()  # lignes modifiées à la main depuis la dernière génération (enregistrement openpyxl)
+
+    def updates_for(rows):
+        fixed = [_cell_position(PATIENT_COUNT_CELL)] + ([(model["total_row"], COL_TOTAL_CENTRE)] if model["total_row"] > 0 else [])
+        updates = {position: full_updates[position] for position in fixed}
+        for r in rows:
+            for c in (COL_MONTANT_UNITAIRE, COL_NOMBRE_ITEMS, COL_TOTAL_LIGNE, COL_TOTAL_CENTRE): updates[(r, c)] = full_updates[(r, c)]
+        return updates
+    changed_rows = [r for r, *_ in results if reason is not None or previous_rows.get(str(r), [None, None])[1] != state["lignes"][str(r)][1]]
+
+    updates = None
+    if fast_save:
+        updates = updates_for(changed_rows) if reason is None else full_updates
+        try:
+            patch_xlsm_cells(open_template(source_file) if reason else existing, output_file, updates, progress=progress, state=state)
+        except XlsmPatchError:
+            traceback.print_exc()  # repli sur l'enregistrement complet par openpyxl
+            updates = None
+    if updates is None:
+        _report(progress, "chargement")
+        workbook = load_workbook(open_template(source_file) if reason else existing, keep_vba=True)
+        sheet = workbook[SHEET_NAME]
+        if reason is None:
+            rewrite = {int(r) for r, (_, outputs, _) in previous_rows.items() if _sheet_row_outputs_hash(sheet, int(r)) != outputs}
+            changed_rows = sorted(set(changed_rows) | rewrite)
+        updates = updates_for(changed_rows) if reason is None else full_updates
+        apply_cell_updates(sheet, updates, progress)
+        state["archive"] = None
+        _set_workbook_state(workbook, state)
+        save_workbook_atomic(workbook, output_file, progress)
+    if on_results: on_results(model, results, total_general)
+
+    # Rapport : différences avec la génération précédente (si elle porte sur le même modèle)
+    report = {"mode": "complete" if reason else "incrementale", "raison": reason, "total_general": total_general,
+              "total_precedent": None, "parametres": {}, "lignes": [], "cellules": len(updates)}
+    if previous and previous.get("modele") == state["modele"]:
+        old_params, old_rows = previous.get("parametres", {}), previous.get("lignes", {})
+        report["total_precedent"] = previous.get("total_general")
+        report["parametres"] = {name: [old_params.get(name), value] for name, value in params.items() if old_params.get(name) != value}
+        designations = {line["row"]: line["designation"].splitlines()[0].strip() for line in model["lines"]}
+        for r in sorted(set(map(int, old_rows)) | set(map(int, state["lignes"]))):
+            old, new = old_rows.get(str(r)), state["lignes"].get(str(r))
+            if old is None or new is None or old[1] != new[1] or r in rewrite:
+                report["lignes"].append([r, designations.get(r, ""), old and old[2], new and new[2]])
+    return report
+
+def format_matrix_changes(report, max_lines=None):
+    # Rapport d'update_matrix en lignes de texte (français)
+    if report["mode"] == "incrementale":
+        text = [f"Mise à jour incrémentale : {len(report['lignes'])} ligne(s) réécrite(s), {report['cellules']} cellule(s) écrite(s)."]
+    else:
+        text = [f"Génération complète ({report['raison']}) : {report['cellules']} cellule(s) écrite(s)."]
+    if report["parametres"]:
+        text.append("Paramètres modifiés : " + ", ".join(f"{name} {old} -> {new}" for name, (old, new) in report["parametres"].items()))
+    lines = report["lignes"] if max_lines is None else report["lignes"][:max_lines]
+    for r, designation, old, new in lines:
+        text.append(f"  ligne {r} {_short_designation(designation)} : {'-' if old is None else format_euros(old)} -> {'-' if new is None else format_euros(new)} €")
+    if len(lines) < len(report["lignes"]): text.append(f"  … et {len(report['lignes']) - len(lines)} autre(s) ligne(s)")
+    if report["total_precedent"] is not None:
+        text.append(f"Total général : {format_euros(report['total_precedent'])} -> {format_euros(report['total_general'])} €")
+    return text
+
+
+BATCH_SUMMARY_FILE = "resume_batch.csv"
+BATCH_SUMMARY_FIELDS = ["index", "etude", "statut", "fichier", "total_general", "mise_a_jour", "echeancier", "erreur"]
+
+def read_study_file(studies_file):
+    # CSV (séparateur "," ou ";", export Excel) ou JSON (liste d'objets ou {"etudes": [...]})
+    if studies_file.lower().endswith(".json"):
+        with open(studies_file, encoding="utf-8-sig") as f:
+            data = json.load(f)
+        if isinstance(data, dict): data = data.get("etudes", [])
+        return [dict(study) for study in data]
+    with open(studies_file, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try: dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error: dialect = csv.excel
+        return [{(k or "").strip(): v for k, v in row.items()} for row in csv.DictReader(f, dialect=dialect)]
+
+def _batch_output_name(index, study, used_names):
+    name = _texte_parametre(study, "etude") or f"etude_{index:03d}"
+    name = re.sub(r'[<>:"/\\|?*\s]+', "_", name).strip("._") or f"etude_{index:03d}"
+    if name.lower() in used_names: name = f"{name}_{index:03d}"
+    used_names.add(name.lower())
+    return name + ".xlsm"
+
+def _generate_batch_study(index, name, raw, template_file, output_file, fast_save=False, schedule_format=None, incremental=False):
+    result = {"index": index, "etude": name, "statut": "erreur", "fichier": "", "total_general": "", "mise_a_jour": "", "echeancier": "", "erreur": ""}
+    errors = validate_study_params(raw)
+    if errors:
+        result["erreur"] = " ".join(errors)
+        return result
+    try:
+        params, generated = parse_study_params(raw), {}
+        def on_results(model, results, total_general):
+            # Ligne de la base des résultats, écrite par le processus principal en fin de batch
+            result["resultats"] = study_record(name, output_file, params, model, results, total_general)
+            generated.update(model=model, results=results)
+        if incremental:
+            report = update_matrix(template_file, output_file, params, fast_save=fast_save, on_results=on_results)
+            total_general = report["total_general"]
+            result["mise_a_jour"] = f"incrémentale ({len(report['lignes'])} ligne(s))" if report["mode"] == "incrementale" else f"complète ({report['raison']})"
+        else:
+            total_general = generate_matrix_logic(template_file, output_file, params, fast_save=fast_save, on_results=on_results)
+        result.update(statut="ok", fichier=output_file, total_general=round(total_general, 2))
+        if schedule_format:
+            schedule = write_schedule(generated["model"], params, schedule_file_for(output_file, schedule_format), generated["results"])
+            result["echeancier"] = schedule["fichier"]
+            if schedule["ecarts"]: result["erreur"] = f"Échéancier : écart de rapprochement (lignes {', '.join(map(str, schedule['ecarts']))})."
+    except KeyError:
+        result["erreur"] = f"La feuille '{SHEET_NAME}' est introuvable dans le fichier modèle."
+    except Exception as e:
+        result["erreur"] = f"{type(e).__name__}: {e}"
+    return result
+
+def run_batch(studies_file, template_file, output_dir, workers=None, summary_file=None, fast_save=False, results_db=None, schedule_format=None,
+              incremental=False):
+    # schedule_format : ".csv" ou ".xlsx" pour écrire aussi l'échéancier patient × visite de chaque étude ;
+    # incremental : les matrices déjà présentes dans output_dir sont mises à jour (update_matrix)
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    studies = read_study_file(studies_file)
+    os.makedirs(output_dir, exist_ok=True)
+    load_template_model(template_file)  # analyse une seule fois, partagée par les processus via le cache
+    used_names, tasks = set(), []
+    for index, study in enumerate(studies, 1):
+        output_file = os.path.join(output_dir, _batch_output_name(index, study, used_names))
+        tasks.append((index, _texte_parametre(study, "etude"), study, template_file, output_file, fast_save, schedule_format, incremental))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(_generate_batch_study, *task): task for task in tasks}
+        for future in as_completed(futures):
+            index, name = futures[future][:2]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # Processus de travail interrompu : l'étude est signalée, le batch continue
+                results.append({"index": index, "etude": name, "statut": "erreur", "fichier": "", "total_general": "", "mise_a_jour": "", "echeancier": "",
+                                "erreur": f"{type(e).__name__}: {e}"})
+    results.sort(key=lambda res: res["index"])
+    records = [res.pop("resultats") for res in results if "resultats" in res]
+    if results_db and records: record_run(results_db, "batch", template_file, records)
+
+    summary_file = summary_file or os.path.join(output_dir, BATCH_SUMMARY_FILE)
+    with open(summary_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=BATCH_SUMMARY_FIELDS, delimiter=";")
+        writer.writeheader()
+        writer.writerows(results)
+    return results
+
+
+# --- VARIANTES (UN SEUL CHARGEMENT DU MODÈLE) ---
+# Plusieurs matrices (type de centre × niveau, ou sites avec leur propre nombre de patients) sont
+# produites à partir d'un seul chargement et d'une seule analyse du modèle : entre deux variantes,
+# seules les cellules écrites sont remises dans leur état d'origine.
+VARIANTS_SUMMARY_FILE = "resume_variantes.csv"
+VARIANTS_SUMMARY_FIELDS = ["variante", "niveau", "centre", "patients", "total_general", "fichier"]
+
+def expand_variants(spec):
+    # {"etude": {...}, "niveaux": [...], "centres": [...]}
+    # ou {"etude": {...}, "niveaux": [...], "sites": [{"nom": ..., "centre": ..., "patients": ...}]}
+    base = dict(spec.get("etude", {}))
+    niveaux = spec.get("niveaux") or [_texte_parametre(base, "niveau")]
+    if spec.get("sites"):
+        groups = [(site.get("nom") or f"site_{i:02d}", {k: v for k, v in site.items() if k != "nom"}) for i, site in enumerate(spec["sites"], 1)]
+    else:
+        groups = [(centre, {"centre": centre}) for centre in (spec.get("centres") or [_texte_parametre(base, "centre")])]
+    variants, errors = [], []
+    for group_name, overrides in groups:
+        for niveau in niveaux:
+            raw = dict(base, **overrides)
+            raw["niveau"] = niveau
+            name = f"{group_name} niveau {_texte_parametre(raw, 'niveau')}"
+            variant_errors = validate_study_params(raw)
+            if variant_errors: errors.append(f"{name} : {' '.join(variant_errors)}")
+            else: variants.append((name, parse_study_params(raw)))
+    if errors: raise ValueError("\n".join(errors))
+    return variants
+
+def snapshot_cells(sheet, coordinates, saved):
+    # Mémorise, une seule fois par cellule, l'état d'origine des cellules qui vont être écrites
+    # (le style est copié : openpyxl modifie le StyleArray de la cellule en place)
+    for coordinate in coordinates:
+        if coordinate in saved: continue
+        cell = sheet._cells.get(coordinate)
+        saved[coordinate] = None if cell is None else (cell._value, cell.data_type, copy(cell._style))
+
+def restore_cells(sheet, saved):
+    for coordinate, state in saved.items():
+        if state is None: sheet._cells.pop(coordinate, None)  # cellule créée par l'écriture
+        else:
+            cell = sheet._cells[coordinate]
+            cell._value, cell.data_type, cell._style = state[0], state[1], copy(state[2])
+    saved.clear()
+
+def _sheet_title(name, used_titles):
+    # Nom de feuille Excel : 31 caractères au plus, sans []:*?/\ et unique dans le classeur
+    title = re.sub(r"[\[\]:*?/\\]", "_", name).strip("'")[:31] or "Variante"
+    base, i = title, 2
+    while title.lower() in used_titles:
+        suffix = f" ({i})"
+        title, i = base[:31 - len(suffix)] + suffix, i + 1
+    used_titles.add(title.lower())
+    return title
+
+def generate_variants(source_file, variants, output_dir, fast_save=False, consolidated_file=None, progress=None, results_db=None):
+    # variants : [(nom, paramètres)] ; renvoie une ligne de résumé par variante
+    os.makedirs(output_dir, exist_ok=True)
+    workbook = sheet = None
+    if not fast_save or consolidated_file:
+        workbook = load_workbook(open_template(source_file), keep_vba=True)
+        sheet = workbook[SHEET_NAME]
+    model = load_template_model(source_file, sheet)
+
+    used_names, saved, summary, all_updates, records = set(), {}, [], [], []
+    for i, (name, params) in enumerate(variants, 1):
+        _report(progress, "variantes", i, len(variants))
+        output_file = os.path.join(output_dir, _batch_output_name(i, {"etude": name}, used_names))
+        results, total_general = compute_matrix(model, params)
+        updates = matrix_cell_updates(model, params, results, total_general)
+        all_updates.append((name, updates))
+        patched = False
+        if fast_save:
+            try: patch_xlsm_cells(open_template(source_file), output_file, updates); patched = True
+            except XlsmPatchError: traceback.print_exc()  # repli sur openpyxl pour cette variante
+        if not patched:
+            if sheet is None:
+                workbook = load_workbook(open_template(source_file), keep_vba=True)
+                sheet = workbook[SHEET_NAME]
+            snapshot_cells(sheet, updates, saved)
+            apply_cell_updates(sheet, updates)
+            save_workbook_atomic(workbook, output_file)
+            restore_cells(sheet, saved)
+        summary.append({"variante": name, "niveau": params["niveau"], "centre": params["centre"], "patients": params["patients"],
+                        "total_general": round(total_general, 2), "fichier": output_file})
+        if results_db: records.append(study_record(name, output_file, params, model, results, total_general))
+
+    if consolidated_file:
+        # Une feuille par variante, copiée de la feuille du modèle remplie puis restaurée.
+        # copy_worksheet reprend valeurs, styles, fusions et dimensions, mais pas les validations
+        # de données ni la mise en forme conditionnelle.
+        used_titles = {title.lower() for title in workbook.sheetnames}
+        for i, (name, updates) in enumerate(all_updates, 1):
+            _report(progress, "consolidation", i, len(all_updates))
+            snapshot_cells(sheet, updates, saved)
+            apply_cell_updates(sheet, updates)
+            with warnings.catch_warnings():
+                # Titre provisoire "<feuille> Copy" trop long pour Excel, renommé aussitôt
+                warnings.simplefilter("ignore", UserWarning)
+                copied = workbook.copy_worksheet(sheet)
+            copied.title = _sheet_title(name, used_titles)
+            restore_cells(sheet, saved)
+        save_workbook_atomic(workbook, consolidated_file, progress)
+    if records: record_run(results_db, "variantes", source_file, records)
+    return summary
+
+def run_variants(spec_file, template_file, output_dir, fast_save=False, consolidated_file=None, results_db=None):
+    with open(spec_file, encoding="utf-8-sig") as f:
+        variants = expand_variants(json.load(f))
+    summary = generate_variants(template_file, variants, output_dir, fast_save=fast_save, consolidated_file=consolidated_file, results_db=results_db)
+    with open(os.path.join(output_dir, VARIANTS_SUMMARY_FILE), "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=VARIANTS_SUMMARY_FIELDS, delimiter=";")
+        writer.writeheader()
+        writer.writerows(summary)
+    return summary
+
+
+# --- ÉCHÉANCIER PATIENT × VISITE (ÉCRITURE EN FLUX) ---
+# Détail de la matrice par patient, par visite et par acte facturable : la quantité par patient de
+# chaque ligne (colonne E) est répartie sur les visites 1 (screening) à N (visite finale), les
+# lignes par centre (coûts fixes) donnent une seule ligne "centre". Les lignes sont produites par un
+# générateur et écrites au fil de l'eau (csv, ou openpyxl en mode write_only) : la mémoire ne dépend
+# pas du nombre de patients. Les montants sont exacts (Decimal : quantité × montant unitaire) et les
+# sous-totaux cumulés pendant l'écriture sont rapprochés des colonnes E et G de la matrice.
+SCHEDULE_SUFFIX = "_echeancier"
+SCHEDULE_RECONCILIATION_SUFFIX = "_rapprochement"
+SCHEDULE_FORMATS = [".csv", ".xlsx"]
+SCHEDULE_FIELDS = ["patient", "visite", "type_visite", "ligne", "acte", "designation", "quantite", "montant_unitaire", "montant"]
+SCHEDULE_RECONCILIATION_FIELDS = ["ligne", "acte", "designation", "quantite_matrice", "quantite_echeancier", "total_matrice", "total_echeancier", "ecart"]
+SCHEDULE_SHEET_ROWS = 1048576  # lignes d'une feuille Excel : au-delà, l'échéancier continue sur une nouvelle feuille
+SCHEDULE_PRECISION = Decimal("0.000001")
+# Visites sur lesquelles est répartie une ligne par patient (par défaut : toutes les visites)
+SCHEDULE_VISITS = {
+    "inclusion": "premiere",
+    "screening": "premiere",
+    "formation_auto_questionnaire": "premiere",
+    "visite_site": "suivi",
+    "visite_finale": "derniere",
+}
+
+def schedule_file_for(output_file, extension=".csv"):
+    # matrices/etude.xlsm -> matrices/etude_echeancier.csv
+    return os.path.splitext(output_file)[0] + SCHEDULE_SUFFIX + extension
+
+def _exact(value):
+    # Nombre -> Decimal de même écriture décimale (0.1 -> Decimal("0.1"))
+    return Decimal(value) if isinstance(value, int) else Decimal(repr(value))
+
+def _schedule_number(value):
+    # Decimal -> texte : deux décimales au moins, sans zéros inutiles au-delà (71.875)
+    if not value: value = value.copy_abs()  # pas de "-0.00" pour un écart nul
+    cents = value.quantize(Decimal("0.01"))
+    return f"{cents:f}" if cents == value else f"{value.normalize():f}"
+
+def _visit_type(visit, visits):
+    if visit == 1: return "screening"
+    return "finale" if visit == visits else "suivi"
+
+def visit_quantities(rule, quantity, visits):
+    # {visite: quantité} : la quantité par patient d'une ligne répartie régulièrement, en entiers,
+    # sur ses visites (SCHEDULE_VISITS) ; une quantité non entière reste sur la première
+    where = SCHEDULE_VISITS.get(rule, "toutes")
+    first, last = {"premiere": (1, 1), "suivi": (2, visits - 1), "derniere": (visits, visits)}.get(where, (1, visits))
+    count = last - first + 1
+    if quantity <= 0 or count <= 0: return {}
+    if quantity != int(quantity): return {first: quantity}
+    quantity, spread = int(quantity), {}
+    for i in range(count):
+        share = (i + 1) * quantity // count - i * quantity // count
+        if share: spread[first + i] = share
+    return spread
+
+def schedule_plan(model, params, results=None):
+    # Renvoie (lignes de la matrice, actes par visite) : chaque ligne porte ses valeurs dans la
+    # matrice et les sous-totaux de l'échéancier, cumulés par iter_schedule
+    if results is None: results = compute_matrix(model, params)[0]
+    lines = {line["row"]: line for line in model["lines"]}
+    plan, by_visit = [], {}
+    for row, quantity, total_ligne, total_centre, _ in results:
+        line = lines[row]
+        fixed = LINE_RULE_FUNCTIONS[line["rule"]](line, params)[4]
+        # Les montants unitaires ont au plus quelques décimales (ex. 1,25 h × 57,50 = 71,875)
+        unit = _exact(round(total_ligne / quantity, 6)) if quantity else Decimal(0)
+        entry = {"ligne": row, "acte": line["rule"], "designation": line["designation"].splitlines()[0].strip(), "fixe": fixed,
+                 "montant_unitaire": unit, "quantite_matrice": quantity if fixed else quantity * params["patients"],
+                 "total_matrice": total_centre, "quantite_echeancier": 0, "total_echeancier": Decimal(0)}
+        plan.append(entry)
+        if not fixed:
+            for visit, share in visit_quantities(line["rule"], quantity, params["visites"]).items():
+                by_visit.setdefault(visit, []).append((entry, share, _exact(share) * unit))
+    return plan, by_visit
+
+def iter_schedule(plan, by_visit, params, progress=None):
+    # Lignes de l'échéancier (SCHEDULE_FIELDS) : lignes par centre, puis patient par patient et visite par visite
+    for entry in plan:
+        quantity = entry["quantite_matrice"]
+        if not entry["fixe"] or quantity <= 0: continue
+        amount = _exact(quantity) * entry["montant_unitaire"]
+        entry["quantite_echeancier"] += quantity
+        entry["total_echeancier"] += amount
+        yield ["", "", "centre", entry["ligne"], entry["acte"], entry["designation"], quantity, entry["montant_unitaire"], amount]
+    visits, patients = params["visites"], params["patients"]
+    for patient in range(1, patients + 1):
+        _report(progress, "echeancier", patient, patients)
+        for visit in range(1, visits + 1):
+            visit_type = _visit_type(visit, visits)
+            for entry, quantity, amount in by_visit.get(visit, ()):
+                entry["quantite_echeancier"] += quantity
+                entry["total_echeancier"] += amount
+                yield [patient, visit, visit_type, entry["ligne"], entry["acte"], entry["designation"], quantity, entry["montant_unitaire"], amount]
+
+def schedule_reconciliation(plan):
+    # Renvoie (lignes SCHEDULE_RECONCILIATION_FIELDS avec le total général, lignes de la matrice en écart)
+    rows, mismatches = [], []
+    total_matrice, total_echeancier = 0.0, Decimal(0)
+    for entry in plan:
+        ecart = entry["total_echeancier"] - _exact(entry["total_matrice"])
+        if abs(ecart) >= SCHEDULE_PRECISION or entry["quantite_echeancier"] != entry["quantite_matrice"]: mismatches.append(entry["ligne"])
+        rows.append([entry["ligne"], entry["acte"], entry["designation"], entry["quantite_matrice"], entry["quantite_echeancier"],
+                     entry["total_matrice"], entry["total_echeancier"], ecart.quantize(SCHEDULE_PRECISION)])
+        total_matrice += entry["total_matrice"]  # même ordre d'addition que compute_matrix
+        total_echeancier += entry["total_echeancier"]
+    ecart = total_echeancier - _exact(total_matrice)
+    if abs(ecart) >= SCHEDULE_PRECISION: mismatches.append(END_ROW_MARKER)
+    rows.append(["", "", END_ROW_MARKER, "", "", total_matrice, total_echeancier, ecart.quantize(SCHEDULE_PRECISION)])
+    return rows, mismatches
+
+def _write_schedule_csv(rows, output_file):
+    texts = {}  # peu de montants différents : chacun n'est mis en forme qu'une fois
+    def text(value):
+        if not isinstance(value, Decimal): return value
+        if value not in texts: texts[value] = _schedule_number(value)
+        return texts[value]
+    count = 0
+    with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(SCHEDULE_FIELDS)
+        for row in rows:
+            row[7], row[8] = text(row[7]), text(row[8])
+            writer.writerow(row)
+            count += 1
+    return count
+
+def _write_schedule_xlsx(rows, workbook):
+    # Feuilles "Échéancier", "Échéancier (2)", ... de SCHEDULE_SHEET_ROWS lignes au plus (en-tête compris)
+    count, sheet, sheet_rows = 0, None, SCHEDULE_SHEET_ROWS
+    for row in rows:
+        if sheet_rows >= SCHEDULE_SHEET_ROWS:
+            sheet = workbook.create_sheet("Échéancier" if sheet is None else f"Échéancier ({len(workbook.sheetnames) + 1})")
+            sheet.append(SCHEDULE_FIELDS)
+            sheet_rows = 1
+        row[7], row[8] = float(row[7]), float(row[8])
+        sheet.append(row)
+        sheet_rows += 1
+        count += 1
+    if sheet is None: workbook.create_sheet("Échéancier").append(SCHEDULE_FIELDS)
+    return count
+
+def write_schedule(model, params, output_file, results=None, progress=None):
+    # Écrit l'échéancier (.csv en flux, ou .xlsx en mode write_only) et son rapprochement avec la
+    # matrice : fichier <nom>_rapprochement.csv, ou feuille "Rapprochement" du classeur.
+    # Renvoie {"fichier", "rapprochement", "lignes", "total_matrice", "total_echeancier", "ecarts"}
+    extension = os.path.splitext(output_file)[1].lower()
+    if extension not in SCHEDULE_FORMATS:
+        raise ValueError(f"Format d'échéancier non pris en charge : {extension or output_file} ({', '.join(SCHEDULE_FORMATS)}).")
+    plan, by_visit = schedule_plan(model, params, results)
+    rows = iter_schedule(plan, by_visit, params, progress)
+    reconciliation_file = output_file
+    tmp_file = _temporary_path(output_file)
+    try:
+        if extension == ".xlsx":
+            workbook = new_workbook(write_only=True)
+            count = _write_schedule_xlsx(rows, workbook)
+            reconciliation, mismatches = schedule_reconciliation(plan)
+            sheet = workbook.create_sheet("Rapprochement")
+            sheet.append(SCHEDULE_RECONCILIATION_FIELDS)
+            for row in reconciliation:
+                row[6], row[7] = float(row[6]), float(row[7])
+                sheet.append(row)
+            save_workbook_atomic(workbook, output_file)
+        else:
+            count = _write_schedule_csv(rows, tmp_file)
+            reconciliation, mismatches = schedule_reconciliation(plan)
+            reconciliation_file = os.path.splitext(output_file)[0] + SCHEDULE_RECONCILIATION_SUFFIX + ".csv"
+            with open(reconciliation_file, "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f, delimiter=";")
+                writer.writerow(SCHEDULE_RECONCILIATION_FIELDS)
+                writer.writerows([_schedule_number(value) if isinstance(value, Decimal) else value for value in row] for row in reconciliation)
+            os.replace(tmp_file, output_file)
+    except BaseException:
+        _remove_quietly(tmp_file)
+        raise
+    return {"fichier": output_file, "rapprochement": reconciliation_file, "lignes": count, "total_matrice": reconciliation[-1][5],
+            "total_echeancier": reconciliation[-1][6], "ecarts": mismatches}
+
+
+# --- BASE DES RÉSULTATS (SQLite) ---
+# Chaque génération (interface, batch, variantes) peut être enregistrée dans une base SQLite locale :
+# paramètres de l'étude et, pour chaque ligne calculée, quantité (COL_NOMBRE_ITEMS), total ligne
+# (COL_TOTAL_LIGNE) et total centre (COL_TOTAL_CENTRE). Une exécution = une transaction (insertions
+# groupées). Les requêtes de portefeuille (query_results) ne lisent que cette base, jamais les .xlsm.
+# Une étude est identifiée par le chemin complet du fichier généré (deux études de même nom écrites
+# dans des fichiers différents restent distinctes) : sauf historique demandé, seule la dernière
+# génération de chaque fichier compte.
+RESULTS_DB_FILE = os.environ.get("MATRICE_RESULTATS_DB") or os.path.join(os.path.expanduser("~"), ".matrice_couts", "resultats.sqlite")
+RESULTS_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS executions (
+    id INTEGER PRIMARY KEY, date TEXT NOT NULL, operation TEXT NOT NULL, modele TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS etudes (
+    id INTEGER PRIMARY KEY, execution_id INTEGER NOT NULL REFERENCES executions(id), date TEXT NOT NULL,
+    etude TEXT NOT NULL, fichier TEXT NOT NULL, niveau TEXT NOT NULL, centre TEXT NOT NULL,
+    patients INTEGER, visites INTEGER, duree INTEGER, parametres TEXT NOT NULL, total_general REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS lignes (
+    etude_id INTEGER NOT NULL REFERENCES etudes(id), ligne INTEGER NOT NULL, designation TEXT NOT NULL,
+    quantite REAL, total_ligne REAL, total_centre REAL, par_niveau INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS etudes_etude ON etudes(etude);
+CREATE INDEX IF NOT EXISTS etudes_fichier ON etudes(fichier);
+CREATE INDEX IF NOT EXISTS etudes_niveau ON etudes(niveau, date);
+CREATE INDEX IF NOT EXISTS etudes_centre ON etudes(centre, date);
+CREATE INDEX IF NOT EXISTS etudes_date ON etudes(date);
+CREATE INDEX IF NOT EXISTS lignes_etude ON lignes(etude_id);
+CREATE INDEX IF NOT EXISTS lignes_designation ON lignes(designation);
+"""
+RESULTS_GROUPS = ["etude", "niveau", "centre", "annee", "mois", "designation"]
+_RESULTS_GROUP_KEYS = {"niveau": "e.niveau", "centre": "e.centre", "annee": "substr(e.date, 1, 4)", "mois": "substr(e.date, 1, 7)"}
+
+def open_results_db(db_file):
+    import sqlite3
+    directory = os.path.dirname(os.path.abspath(db_file))
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(db_file, timeout=30)
+    connection.executescript(RESULTS_DB_SCHEMA)
+    return connection
+
+def study_record(name, output_file, params, model, results, total_general):
+    # Étude sans nom : nom du fichier généré
+    designations = {line["row"]: line["designation"] for line in model["lines"]}
+    return {
+        "etude": name or os.path.splitext(os.path.basename(output_file))[0], "fichier": os.path.abspath(output_file),
+        "params": params, "total_general": total_general,
+        "lignes": [(r, designations[r], quantity, total_ligne, total_centre, int(bool(level)))
+                   for r, quantity, total_ligne, total_centre, level in results],
+    }
+
+def record_run(db_file, operation, template_file, records):
+    # Renvoie l'identifiant de l'exécution, ou None si la base n'a pas pu être écrite (l'opération
+    # elle-même a réussi : l'erreur est seulement signalée)
+    import sqlite3
+    date = datetime.datetime.now().isoformat(timespec="seconds")
+    try:
+        connection = open_results_db(db_file)
+        try:
+            with connection:
+                run_id = connection.execute("INSERT INTO executions (date, operation, modele) VALUES (?, ?, ?)",
+                                            (date, operation, os.path.abspath(template_file))).lastrowid
+                lines = []
+                for record in records:
+                    params = record["params"]
+                    study_id = connection.execute(
+                        "INSERT INTO etudes (execution_id, date, etude, fichier, niveau, centre, patients, visites, duree, parametres, total_general)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, date, record["etude"], record["fichier"], params["niveau"], params["centre"], params["patients"],
+                         params["visites"], params["duree"], json.dumps(params, ensure_ascii=False), record["total_general"])).lastrowid
+                    lines.extend((study_id,) + line for line in record["lignes"])
+                connection.executemany("INSERT INTO lignes (etude_id, ligne, designation, quantite, total_ligne, total_centre, par_niveau)"
+                                       " VALUES (?, ?, ?, ?, ?, ?, ?)", lines)
+            return run_id
+        finally:
+            connection.close()
+    except (sqlite3.Error, OSError):
+        traceback.print_exc()
+        return None
+
+def query_results(db_file, group_by="etude", level=None, centre=None, study=None, designation=None, since=None, until=None, history=False):
+    # Renvoie (colonnes, lignes). study / designation : texte contenu (sans casse) ; since / until :
+    # dates AAAA-MM-JJ incluses. Avec designation (ou group_by="designation"), les totaux sont ceux
+    # des lignes correspondantes ; sinon, le total général des études. Montants arrondis au centime.
+    conditions, values = [], []
+    if not history: conditions.append("e.id IN (SELECT MAX(id) FROM etudes GROUP BY fichier)")
+    if level: conditions.append("e.niveau = ?"); values.append(str(level))
+    if centre: conditions.append("e.centre = ?"); values.append(centre)
+    if study: conditions.append("e.etude LIKE ?"); values.append(f"%{study}%")
+    if since: conditions.append("e.date >= ?"); values.append(since)
+    if until: conditions.append("substr(e.date, 1, 10) <= ?"); values.append(until)
+    per_line = bool(designation) or group_by == "designation"
+    if designation: conditions.append("l.designation LIKE ?"); values.append(f"%{designation}%")
+    source = "etudes e JOIN lignes l ON l.etude_id = e.id" if per_line else "etudes e"
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    total = "round(sum(l.total_centre), 2)" if per_line else "round(sum(e.total_general), 2)"
+    if group_by == "etude" and not per_line:
+        columns = ["date", "etude", "niveau", "centre", "patients", "visites", "duree", "total_general", "fichier"]
+        sql = f"SELECT {', '.join('round(e.total_general, 2)' if c == 'total_general' else 'e.' + c for c in columns)} FROM {source}{where} ORDER BY e.date, e.id"
+    elif group_by == "etude":
+        columns = ["date", "etude", "niveau", "centre", "lignes", "total"]
+        sql = f"SELECT e.date, e.etude, e.niveau, e.centre, count(*), {total} FROM {source}{where} GROUP BY e.id ORDER BY e.date, e.id"
+    elif group_by == "designation":
+        columns = ["designation", "etudes", "quantite", "total"]
+        sql = f"SELECT l.designation, count(DISTINCT e.id), round(sum(l.quantite), 2), {total} FROM {source}{where} GROUP BY l.designation ORDER BY l.designation"
+    elif group_by in _RESULTS_GROUP_KEYS:
+        key = _RESULTS_GROUP_KEYS[group_by]
+        columns = [group_by, "etudes", "total"]
+        sql = f"SELECT {key}, count(DISTINCT e.id), {total} FROM {source}{where} GROUP BY {key} ORDER BY {key}"
+    else:
+        raise ValueError(f"Regroupement inconnu : {group_by} ({', '.join(RESULTS_GROUPS)}).")
+    if not os.path.exists(db_file): return columns, []
+    connection = open_results_db(db_file)
+    try: return columns, connection.execute(sql, values).fetchall()
+    finally: connection.close()
+
+def export_results_csv(columns, rows, csv_file):
+    with open(csv_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+# --- COLLECTE DES MATRICES EXISTANTES (LECTURE SEULE) ---
+# Parcourt une arborescence de matrices remplies (par cet outil ou par les anciennes macros VBA) et
+# en extrait le nombre de patients (PATIENT_COUNT_CELL), chaque ligne de données remplie (désignation
+# et colonnes E, F, G) et le total général. Les classeurs sont lus en lecture seule, valeurs
+# uniquement, par un groupe de processus ; les résultats sont écrits au fil de l'eau dans un index
+# SQLite qui sert aussi à ne relire que les fichiers dont la date de modification (ou la taille) a
+# changé depuis la collecte précédente. Les fichiers de l'arborescence ne sont jamais modifiés.
+HARVEST_INDEX_FILE = "collecte_matrices.sqlite"
+HARVEST_TABLE_FILE = "collecte_matrices.csv"
+HARVEST_TABLE_FIELDS = ["fichier", "patients", "total_general", "ligne", "designation", "quantite", "total_ligne", "total_centre"]
+HARVEST_COMMIT_EVERY = 100
+HARVEST_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fichiers (
+    chemin TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, taille INTEGER NOT NULL, statut TEXT NOT NULL,
+    erreur TEXT, patients, total_general, lecture TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS lignes (
+    chemin TEXT NOT NULL, ligne INTEGER NOT NULL, designation TEXT NOT NULL, quantite, total_ligne, total_centre);
+CREATE INDEX IF NOT EXISTS lignes_chemin ON lignes(chemin);
+CREATE INDEX IF NOT EXISTS lignes_designation ON lignes(designation);
+"""
+
+def find_matrix_files(root_dir):
+    # Fichiers .xlsm de l'arborescence, hors fichiers de verrouillage Excel (~$) et temporaires (.~)
+    for directory, subdirs, files in os.walk(root_dir):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".xlsm") and not name.startswith(("~$", ".~")):
+                yield os.path.abspath(os.path.join(directory, name))
+
+def harvest_matrix(path):
+    # Exécuté dans un processus de travail : ne lève pas d'exception, l'erreur est renvoyée
+    stat = os.stat(path)
+    harvest = {"chemin": path, "mtime_ns": stat.st_mtime_ns, "taille": stat.st_size, "statut": "ok", "erreur": None,
+               "patients": None, "total_general": None, "lignes": []}
+    try:
+        patient_row, patient_col = _cell_position(PATIENT_COUNT_CELL)
+        try: rows = read_matrix_rows(path, max_col=max(COL_TOTAL_CENTRE, patient_col), data_only=True)
+        except KeyError: raise KeyError(f"Feuille '{SHEET_NAME}' introuvable.") from None
+        if len(rows) >= patient_row: harvest["patients"] = rows[patient_row - 1][patient_col - 1]
+        firstRow, lastRow, totalRow = locate_data_rows([row[COL_DESIGNATION - 1] for row in rows[START_ROW - 1:]])
+        if not (firstRow > 0 and lastRow >= firstRow): raise ValueError("Impossible de déterminer la plage de données de la matrice.")
+        for r in range(firstRow, lastRow + 1):
+            values = rows[r - 1]
+            designation = str(values[COL_DESIGNATION - 1]).strip() if values[COL_DESIGNATION - 1] is not None else ""
+            filled = values[COL_NOMBRE_ITEMS - 1:COL_TOTAL_CENTRE]
+            if designation and any(value is not None for value in filled): harvest["lignes"].append((r, designation) + tuple(filled))
+        if totalRow > 0: harvest["total_general"] = rows[totalRow - 1][COL_TOTAL_CENTRE - 1]
+    except KeyError as e:
+        harvest.update(statut="erreur", erreur=e.args[0] if e.args else str(e), lignes=[])
+    except Exception as e:
+        harvest.update(statut="erreur", erreur=f"{type(e).__name__}: {e}", lignes=[])
+    return harvest
+
+def _store_harvest(connection, harvest):
+    connection.execute("DELETE FROM lignes WHERE chemin = ?", (harvest["chemin"],))
+    connection.execute("INSERT OR REPLACE INTO fichiers (chemin, mtime_ns, taille, statut, erreur, patients, total_general, lecture) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (harvest["chemin"], harvest["mtime_ns"], harvest["taille"], harvest["statut"], harvest["erreur"], harvest["patients"],
+                        harvest["total_general"], datetime.datetime.now().isoformat(timespec="seconds")))
+    connection.executemany("INSERT INTO lignes (chemin, ligne, designation, quantite, total_ligne, total_centre) VALUES (?, ?, ?, ?, ?, ?)",
+                           [(harvest["chemin"],) + line for line in harvest["lignes"]])
+
+def harvest_matrices(root_dir, index_file=HARVEST_INDEX_FILE, table_file=HARVEST_TABLE_FILE, workers=None, progress=None):
+    # Renvoie {"fichiers", "lus", "inchanges", "supprimes", "erreurs": [(chemin, message)]}
+    import sqlite3
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    root = os.path.join(os.path.abspath(root_dir), "")
+    connection = sqlite3.connect(index_file)
+    try:
+        connection.executescript(HARVEST_INDEX_SCHEMA)
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in connection.execute(
+            "SELECT chemin, mtime_ns, taille FROM fichiers WHERE substr(chemin, 1, ?) = ?", (len(root), root))}
+        to_read, seen = [], set()
+        for path in find_matrix_files(root_dir):
+            seen.add(path)
+            try: stat = os.stat(path)
+            except OSError: continue
+            if known.get(path) != (stat.st_mtime_ns, stat.st_size): to_read.append(path)
+        removed = [path for path in known if path not in seen]
+        with connection:
+            for path in removed:
+                connection.execute("DELETE FROM lignes WHERE chemin = ?", (path,))
+                connection.execute("DELETE FROM fichiers WHERE chemin = ?", (path,))
+
+        # Au plus quelques fichiers en cours par processus : la mémoire reste bornée quel que soit le nombre de fichiers
+        workers = workers or os.cpu_count() or 1
+        pending, done_count = {}, 0  # futur -> chemin
+        def store(futures):
+            nonlocal done_count
+            for future in futures:
+                path = pending.pop(future)
+                try: harvest = future.result()
+                except Exception as e:
+                    # Processus de travail interrompu : fichier signalé (et relu à la prochaine collecte)
+                    harvest = {"chemin": path, "mtime_ns": 0, "taille": 0, "statut": "erreur", "erreur": f"{type(e).__name__}: {e}",
+                               "patients": None, "total_general": None, "lignes": []}
+                _store_harvest(connection, harvest)
+                done_count += 1
+                _report(progress, "collecte", done_count, len(to_read))
+                if done_count % HARVEST_COMMIT_EVERY == 0: connection.commit()
+        if to_read:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for path in to_read:
+                    if len(pending) >= 4 * workers: store(wait(pending, return_when=FIRST_COMPLETED).done)
+                    pending[executor.submit(harvest_matrix, path)] = path
+                store(list(pending))
+        connection.commit()
+
+        errors = connection.execute("SELECT chemin, erreur FROM fichiers WHERE statut = 'erreur' AND substr(chemin, 1, ?) = ? ORDER BY chemin",
+                                    (len(root), root)).fetchall()
+        with open(table_file, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(HARVEST_TABLE_FIELDS)
+            writer.writerows(connection.execute(
+                "SELECT f.chemin, f.patients, f.total_general, l.ligne, l.designation, l.quantite, l.total_ligne, l.total_centre"
+                " FROM fichiers f JOIN lignes l ON l.chemin = f.chemin WHERE substr(f.chemin, 1, ?) = ? ORDER BY f.chemin, l.ligne",
+                (len(root), root)))
+    finally:
+        connection.close()
+    return {"fichiers": len(seen), "lus": len(to_read), "inchanges": len(seen) - len(to_read), "supprimes": len(removed), "erreurs": errors}
+
+# --- SCÉNARIOS ET MONTE CARLO (NumPy) ---
+# Le modèle de la matrice est évalué sur des tableaux de paramètres numériques (un élément par
+# scénario) ; les paramètres qualitatifs (niveau, centre, format des auto-questionnaires,
+# personnel extérieur, actes infirmiers saisis) restent ceux de l'étude de référence.
+# La plupart des règles de LINE_RULES acceptent telles quelles des tableaux ; seules celles qui
+# testent une valeur numérique (if, max, seuil) ont un équivalent vectoriel ci-dessous.
+# NumPy n'est importé que par ce mode.
+CHAMPS_SCENARIO = ["patients", "visites", "monitoring", "pages_crf", "avenants", "duree", "auto_q_count"]
+MINIMUMS_SCENARIO = {"patients": 1, "visites": 2, "monitoring": 0, "pages_crf": 0, "avenants": 0, "duree": 1, "auto_q_count": 0}
+CENTILES_SCENARIO = [5, 10, 25, 50, 75, 90, 95]
+
+def _import_numpy():
+    try: import numpy
+    except ImportError: raise RuntimeError("Le mode scénarios nécessite NumPy (pip install numpy).") from None
+    return numpy
+
+def _formation_auto_questionnaire_vector(line, p, np):
+    electronique = p["auto_q_format"] == "électronique"
+    return _calc(1, np.where(p["auto_q_count"] > 5, 86.25 if electronique else 43.12, 57.5 if electronique else 28.75))
+
+# Une ligne "sautée" (ex. 0 avenant) y vaut 0, ce qui ne change aucun total
+VECTOR_RULE_FUNCTIONS = {
+    "avenant": lambda line, p, np: _calc(p["avenants"], center=True, fixed=True),
+    "amendement": lambda line, p, np: _calc(p["avenants"] * (line["temps"] or 0.5), fixed=True),
+    "addendum": lambda line, p, np: _calc(p["avenants"] * (line["temps"] or 1.0), fixed=True),
+    "visite_site": lambda line, p, np: _calc(np.maximum(0, p["visites"] - 2), level=True, special="visite_site"),
+    "auto_questionnaire": lambda line, p, np: _calc(p["auto_q_count"], np.where(p["auto_q_count"] > 5, 28.75, 14.37)),
+    "formation_auto_questionnaire": _formation_auto_questionnaire_vector,
+}
+
+def compile_cost_model(model, params):
+    # params : étude de référence (parse_study_params) ; ses valeurs numériques servent de défaut
+    lines = []
+    for line in model["lines"]:
+        if line["rule"] is None: continue
+        vector_rule = VECTOR_RULE_FUNCTIONS.get(line["rule"])
+        scalar_rule = LINE_RULE_FUNCTIONS[line["rule"]]
+        rule = vector_rule if vector_rule else (lambda line, p, np, scalar_rule=scalar_rule: scalar_rule(line, p))
+        lines.append((line, rule))
+    return {"params": dict(params), "lines": lines}
+
+def compute_line_vector(line, rule, params, np):
+    # Équivalent de compute_line (total centre uniquement) pour des paramètres en tableaux
+    calc = rule(line, params, np)
+    if calc is None: return None
+    quantity, montant_unitaire, is_level_specific, is_center_specific, is_fixed_cost_line, special_calc_key = calc
+    if quantity is None: return None
+    quantity = np.where(np.asarray(quantity) < 0, 0, quantity)
+    studyLevel = params["niveau"]
+    if montant_unitaire is None: montant_unitaire = line["montant_valeur"]
+    if is_level_specific and not special_calc_key:
+        montant_unitaire = line["montants_niveau"].get(studyLevel, montant_unitaire)
+    elif is_center_specific:
+        montant_unitaire = line["montants_centre"].get(params["centre"], montant_unitaire)
+    if special_calc_key:
+        # calculate_additional_time accepte un tableau de pages CRF (division entière élément par élément)
+        total_time_per_visit = TEMPS_BASE[special_calc_key][studyLevel] + calculate_additional_time(studyLevel, params["pages_crf"])
+        montant_unitaire = total_time_per_visit * COUT_HORAIRE[special_calc_key][studyLevel]
+    total_ligne = quantity * montant_unitaire
+    return total_ligne if is_fixed_cost_line else quantity * montant_unitaire * params["patients"]
+
+def evaluate_cost_model(cost_model, values, per_line=False):
+    # values : {champ de CHAMPS_SCENARIO: tableau}, les tableaux étant de même forme (ou diffusables).
+    # Renvoie (total général, {ligne: total centre}) ; le détail par ligne seulement si per_line.
+    np = _import_numpy()
+    params = dict(cost_model["params"])
+    for name, value in values.items():
+        if name not in CHAMPS_SCENARIO: raise ValueError(f"Paramètre de scénario inconnu : {name}")
+        params[name] = np.asarray(value, dtype=np.int64)
+    shape = np.broadcast_shapes(*(np.shape(params[name]) for name in CHAMPS_SCENARIO))
+    # Sommes dans l'ordre des lignes, comme compute_matrix : mêmes totaux au centime près (et au bit près)
+    total_general, line_totals = np.zeros(shape), {}
+    for line, rule in cost_model["lines"]:
+        total_centre = compute_line_vector(line, rule, params, np)
+        if total_centre is None: continue
+        total_general = total_general + total_centre
+        if per_line: line_totals[line["row"]] = np.broadcast_to(total_centre, shape)
+    return total_general, line_totals
+
+def _scenario_range(name, spec, np):
+    # [début, fin] ou [début, fin, pas] (bornes incluses), ou {"valeurs": [...]}
+    if isinstance(spec, dict): values = spec["valeurs"]
+    elif isinstance(spec, list) and len(spec) in (2, 3): values = range(int(spec[0]), int(spec[1]) + 1, int(spec[2]) if len(spec) == 3 else 1)
+    else: values = [spec]
+    values = np.asarray(list(values), dtype=np.int64)
+    if values.size == 0 or values.min() < MINIMUMS_SCENARIO[name]: raise ValueError(f"Plage invalide pour '{name}' (minimum {MINIMUMS_SCENARIO[name]}).")
+    return values
+
+def scenario_grid(grid):
+    # Produit cartésien des plages : {champ: tableau à plat}
+    np = _import_numpy()
+    names = list(grid)
+    axes = [_scenario_range(name, grid[name], np) for name in names]
+    return {name: axis.ravel() for name, axis in zip(names, np.meshgrid(*axes, indexing="ij"))}
+
+def sample_scenarios(laws, count, seed=None):
+    # Tirages aléatoires : {champ: nombre | {"loi": ..., paramètres}} -> {champ: tableau d'entiers}
+    # Lois : constante, uniforme (min, max), normale (moyenne, ecart_type), poisson (moyenne),
+    # triangulaire (min, mode, max), choix (valeurs, poids facultatifs).
+    np = _import_numpy()
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name, law in laws.items():
+        if name not in CHAMPS_SCENARIO: raise ValueError(f"Paramètre de scénario inconnu : {name}")
+        if not isinstance(law, dict): law = {"loi": "constante", "valeur": law}
+        kind = law.get("loi")
+        if kind == "constante": values = np.full(count, law["valeur"])
+        elif kind == "uniforme": values = rng.integers(law["min"], law["max"], size=count, endpoint=True)
+        elif kind == "normale": values = rng.normal(law["moyenne"], law["ecart_type"], size=count)
+        elif kind == "poisson": values = rng.poisson(law["moyenne"], size=count)
+        elif kind == "triangulaire": values = rng.triangular(law["min"], law["mode"], law["max"], size=count)
+        elif kind == "choix":
+            weights = law.get("poids")
+            if weights: weights = np.asarray(weights, dtype=float) / sum(weights)
+            values = rng.choice(np.asarray(law["valeurs"]), size=count, p=weights)
+        else: raise ValueError(f"Loi inconnue pour '{name}' : {kind}")
+        # Quantités entières, bornées comme dans validate_study_params
+        samples[name] = np.maximum(np.rint(values), MINIMUMS_SCENARIO[name]).astype(np.int64)
+    return samples
+
+def _scenario_study_params(raw, varied):
+    # Les champs qui varient reçoivent une valeur valide provisoire pour la validation
+    raw = dict(raw)
+    for name in varied: raw[name] = str(MINIMUMS_SCENARIO[name])
+    errors = validate_study_params(raw)
+    if errors: raise ValueError(" ".join(errors))
+    return parse_study_params(raw)
+
+def run_scenarios(spec_file, template_file, output_file):
+    # spec : {"etude": {...}, "grille": {champ: plage}} pour un balayage, ou
+    #        {"etude": {...}, "lois": {champ: loi}, "tirages": n, "graine": s, "centiles": [...]} pour Monte Carlo
+    np = _import_numpy()
+    with open(spec_file, encoding="utf-8-sig") as f:
+        spec = json.load(f)
+    if ("grille" in spec) == ("lois" in spec): raise ValueError("La spécification doit contenir soit 'grille', soit 'lois'.")
+    varied = spec.get("grille") or spec.get("lois")
+    params = _scenario_study_params(spec.get("etude", {}), varied)
+    cost_model = compile_cost_model(load_template_model(template_file), params)
+
+    with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        if "grille" in spec:
+            values = scenario_grid(spec["grille"])
+            totals, _ = evaluate_cost_model(cost_model, values)
+            writer.writerow(list(values) + ["total_general"])
+            columns = [values[name] for name in values] + [np.round(totals, 2)]
+            writer.writerows(zip(*(column.tolist() for column in columns)))
+            return {"scenarios": int(totals.size), "min": float(totals.min()), "max": float(totals.max())}
+
+        count = int(spec.get("tirages", 100000))
+        values = sample_scenarios(spec["lois"], count, spec.get("graine"))
+        totals, line_totals = evaluate_cost_model(cost_model, values, per_line=True)
+        centiles = spec.get("centiles", CENTILES_SCENARIO)
+        rows = sorted(line_totals)
+        writer.writerow(["statistique", "total_general"] + [f"ligne {row}" for row in rows])
+        writer.writerow(["moyenne", round(float(totals.mean()), 2)] + [round(float(line_totals[row].mean()), 2) for row in rows])
+        for centile in centiles:
+            writer.writerow([f"P{centile:g}", round(float(np.percentile(totals, centile)), 2)]
+                            + [round(float(np.percentile(line_totals[row], centile)), 2) for row in rows])
+        return {"scenarios": count, "centiles": {centile: float(np.percentile(totals, centile)) for centile in centiles}}
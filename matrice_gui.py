@@ -0,0 +1,488 @@
+# Interface graphique (tkinter) de l'assistant matrice. Le calcul et les accès aux fichiers sont
+# dans matrice_core ; ce module n'est importé que lorsque l'interface est lancée.
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+import os
+import queue
+import threading
+import traceback
+
+from matrice_core import (
+    BUDGET_FIELDS, CHAMPS_ETUDE, PROGRESS_PHASES, RESULTS_DB_FILE, SHEET_NAME, MatrixPreview, OperationCancelled, TemplateSession, clear_matrix,
+    format_budget_solution, format_euros, format_matrix_changes, generate_matrix_logic, load_template_model, parse_study_params, profile_operation, record_run,
+    parse_budget_amount, parse_budget_params, schedule_file_for, solve_budget, study_record, update_matrix, validate_budget_params,
+    validate_study_params, write_schedule,
+)
+
+JOB_POLL_MS = 50
+PREVIEW_DELAY_MS = 300
+
+class MatriceApp:
+    def __init__(self, master, results_db=RESULTS_DB_FILE):
+        self.master = master
+        self.results_db = results_db  # None : base des résultats désactivée
+        self.master.title("Assistant Matrice Coûts v4.3 (Scrollable)")
+        self.master.geometry("600x800")
+        self.master.minsize(550, 600)
+
+        self.ICON_GENERATE_B64 = "R0lGODlhEAAQALMAAF9bWx8fH7+/vzc3N4mJiWlpaa+vrzAwMMbGxmdnZz4+Pujo6P///wAAAAAAAP///yH5BAEAAA8ALAAAAAAQABAAAARa8EnJpAKgKz5s759AAMGAgoMWcZJpCCaFAhQBHIiAYEigpEAkDE6lBIrG4/F4alEqrVI9mUqvV8uEKkCAEBgMBAICpRAJA4EgUGoNCpfd7fa8fgEAOw=="
+        self.ICON_CLEAR_B64 = "R0lGODlhEAAQALMAAF9bWx8fH7+/vzc3N4mJiWlpaa+vrzAwMMbGxmdnZz4+Pujo6P///wAAAAAAAP///yH5BAEAAA8ALAAAAAAQABAAAARe8MkJgC2goktY758BEEBAgYJgjCRpFBqFAZUAaLgCCARFo7FoPC6YDw6n0qmYdKr1esdqtVqv14sCCBAgAAiCQyAQGAqEQyAQGAqG4/F4fP7/gYIAOw=="
+        self.ICON_QUIT_B64 = "R0lGODlhEAAQALMAAF9bWx8fH7+/vzc3N4mJiWlpaa+vrzAwMMbGxmdnZz4+Pujo6P///wAAAAAAAP///yH5BAEAAA8ALAAAAAAQABAAAARa8MkJgC0gIjls758DEEAgYGCcJGkUGoUBlQBQuAIIRMWjsWg8LpgPDqfSqZh0qtV6x2q1Wq/XiwIIECAACIJDIBAYCoRDIBCICoaj8Xh8/v+BggA7"
+
+        self._setup_styles()
+        self._create_scrollable_container()
+        self._create_widgets()
+        self._layout_widgets()
+
+        # Traitement en arrière-plan : un seul à la fois, suivi par _poll_job via master.after
+        self._job_thread = None
+        self._job_queue = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._quit_requested = False
+        self.master.protocol("WM_DELETE_WINDOW", self.quit_app)
+
+        # Aperçu : recalcul différé de PREVIEW_DELAY_MS après la dernière modification d'un champ
+        self._preview = None
+        self._preview_after = None
+
+        # Modèle(s) gardé(s) ouvert(s) d'une génération à l'autre (rechargé si le fichier change)
+        self._templates = TemplateSession()
+        self._template_file = None
+        for name in CHAMPS_ETUDE:
+            getattr(self, name + "_var").trace_add("write", self._schedule_preview)
+
+    def _setup_styles(self):
+        self.style = ttk.Style(self.master)
+        self.style.theme_use('clam')
+        self.generate_icon = tk.PhotoImage(data=self.ICON_GENERATE_B64)
+        self.clear_icon = tk.PhotoImage(data=self.ICON_CLEAR_B64)
+        self.quit_icon = tk.PhotoImage(data=self.ICON_QUIT_B64)
+        try:
+            default_font = ('Segoe UI', 10)
+            self.master.option_add("*Font", default_font)
+        except tk.TclError:
+            pass
+        self.style.configure("TLabel", padding=5)
+        self.style.configure("TEntry", padding=5)
+        self.style.configure("TCombobox", padding=5)
+        self.style.configure("TCheckbutton", padding=(10, 5))
+        self.style.configure("TButton", padding=8, font=('Segoe UI', 10, 'bold'))
+        self.style.configure("TLabelframe.Label", font=('Segoe UI', 11, 'bold'), padding=(0,0,0,5))
+        self.style.configure("Accent.TButton", background="#0078D7", foreground="white")
+        self.style.map("Accent.TButton", background=[('active', '#005a9e'), ('pressed', '!disabled', '#004c8c')])
+
+    def _create_scrollable_container(self):
+        container = ttk.Frame(self.master)
+        container.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(container, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(container, orient="vertical", command=self.canvas.yview)
+        self.scrollable_frame = ttk.Frame(self.canvas, padding="20 20 20 20")
+
+        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        
+    def _create_widgets(self):
+        # Tous les widgets sont maintenant des enfants de 'self.scrollable_frame'
+        self.title_label = ttk.Label(self.scrollable_frame, text="Assistant de Remplissage de Matrice", font=('Segoe UI', 14, 'bold'), anchor="center")
+        self.intro_label = ttk.Label(self.scrollable_frame, text="Remplissez les champs ci-dessous et cliquez sur 'Générer' pour créer votre fichier.", wraplength=480, anchor="center")
+        
+        # --- Cadre des paramètres ---
+        self.params_frame = ttk.LabelFrame(self.scrollable_frame, text="Paramètres de l'étude", padding="15")
+        self.niveau_var = tk.StringVar()
+        self.niveau_combo = ttk.Combobox(self.params_frame, textvariable=self.niveau_var, values=["1", "2", "3"], state="readonly")
+        self.patients_var = tk.StringVar()
+        self.patients_entry = ttk.Entry(self.params_frame, textvariable=self.patients_var)
+        self.visites_var = tk.StringVar()
+        self.visites_entry = ttk.Entry(self.params_frame, textvariable=self.visites_var)
+        self.centre_var = tk.StringVar()
+        self.centre_combo = ttk.Combobox(self.params_frame, textvariable=self.centre_var, values=["Coordonnateur", "Associé"], state="readonly")
+        self.duree_var = tk.StringVar()
+        self.duree_entry = ttk.Entry(self.params_frame, textvariable=self.duree_var)
+        self.pages_crf_var = tk.StringVar(value="0")
+        self.pages_crf_entry = ttk.Entry(self.params_frame, textvariable=self.pages_crf_var)
+
+        # --- Cadre d'estimation infirmier ---
+        self.infirmier_frame = ttk.LabelFrame(self.scrollable_frame, text="Estimation du temps infirmier (optionnel)", padding="15")
+        self.prelevements_sang_var = tk.StringVar(value="")
+        self.prelevements_sang_entry = ttk.Entry(self.infirmier_frame, textvariable=self.prelevements_sang_var)
+        self.prelevements_urine_var = tk.StringVar(value="")
+        self.prelevements_urine_entry = ttk.Entry(self.infirmier_frame, textvariable=self.prelevements_urine_var)
+        self.signes_vitaux_var = tk.StringVar(value="")
+        self.signes_vitaux_entry = ttk.Entry(self.infirmier_frame, textvariable=self.signes_vitaux_var)
+        self.injections_var = tk.StringVar(value="")
+        self.injections_entry = ttk.Entry(self.infirmier_frame, textvariable=self.injections_var)
+        self.perfusions_var = tk.StringVar(value="")
+        self.perfusions_entry = ttk.Entry(self.infirmier_frame, textvariable=self.perfusions_var)
+        self.catheters_var = tk.StringVar(value="")
+        self.catheters_entry = ttk.Entry(self.infirmier_frame, textvariable=self.catheters_var)
+        self.pk_pd_var = tk.StringVar(value="")
+        self.pk_pd_entry = ttk.Entry(self.infirmier_frame, textvariable=self.pk_pd_var)
+        
+        # --- Cadre des options ---
+        self.options_frame = ttk.LabelFrame(self.scrollable_frame, text="Options", padding="15")
+        self.avenants_var = tk.StringVar(value="0")
+        self.avenants_entry = ttk.Entry(self.options_frame, textvariable=self.avenants_var)
+        self.monitoring_var = tk.StringVar(value="0")
+        self.monitoring_entry = ttk.Entry(self.options_frame, textvariable=self.monitoring_var)
+        self.auto_q_count_var = tk.StringVar(value="")
+        self.auto_q_count_entry = ttk.Entry(self.options_frame, textvariable=self.auto_q_count_var)
+        self.auto_q_format_var = tk.StringVar(value="électronique")
+        self.auto_q_format_combo = ttk.Combobox(self.options_frame, textvariable=self.auto_q_format_var, values=["papier", "électronique"], state="readonly")
+        self.personnel_var = tk.BooleanVar()
+        self.personnel_check = ttk.Checkbutton(self.options_frame, text="Personnel extérieur", variable=self.personnel_var)
+        self.fast_save_var = tk.BooleanVar(value=False)
+        self.fast_save_check = ttk.Checkbutton(self.options_frame, text="Enregistrement rapide (cellules modifiées uniquement)", variable=self.fast_save_var)
+        self.profile_var = tk.BooleanVar(value=False)
+        self.profile_check = ttk.Checkbutton(self.options_frame, text="Diagnostic : journal des performances", variable=self.profile_var)
+        self.record_var = tk.BooleanVar(value=self.results_db is not None)
+        self.record_check = ttk.Checkbutton(self.options_frame, text="Enregistrer les résultats dans la base (portefeuille)", variable=self.record_var,
+                                            state=tk.NORMAL if self.results_db else tk.DISABLED)
+        self.schedule_var = tk.BooleanVar(value=False)
+        self.schedule_check = ttk.Checkbutton(self.options_frame, text="Échéancier patient × visite (CSV à côté de la matrice)", variable=self.schedule_var)
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.incremental_check = ttk.Checkbutton(self.options_frame, text="Mise à jour incrémentale d'une matrice déjà générée (lignes modifiées uniquement)",
+                                                 variable=self.incremental_var)
+
+        # --- Cadre de l'aperçu ---
+        self.preview_frame = ttk.LabelFrame(self.scrollable_frame, text="Aperçu des totaux", padding="15")
+        self.preview_template_button = ttk.Button(self.preview_frame, text="Choisir le modèle…", command=self.choose_preview_template)
+        self.preview_template_var = tk.StringVar(value="Aucun modèle chargé")
+        self.preview_template_label = ttk.Label(self.preview_frame, textvariable=self.preview_template_var, anchor="w")
+        self.preview_tree = ttk.Treeview(self.preview_frame, columns=("total",), height=6)
+        self.preview_tree.heading("#0", text="Section")
+        self.preview_tree.heading("total", text="Total (€)")
+        self.preview_tree.column("#0", width=340)
+        self.preview_tree.column("total", width=120, anchor="e")
+        self.preview_total_var = tk.StringVar(value="TOTAL GÉNÉRAL : –")
+        self.preview_total_label = ttk.Label(self.preview_frame, textvariable=self.preview_total_var, font=('Segoe UI', 11, 'bold'), anchor="e")
+        self.preview_status_var = tk.StringVar(value="")
+        self.preview_status_label = ttk.Label(self.preview_frame, textvariable=self.preview_status_var, anchor="w", wraplength=480)
+        self.budget_frame = ttk.Frame(self.preview_frame)
+        self.budget_var = tk.StringVar(value="")
+        self.budget_entry = ttk.Entry(self.budget_frame, textvariable=self.budget_var, width=14)
+        self.budget_field_var = tk.StringVar(value="patients")
+        self.budget_field_combo = ttk.Combobox(self.budget_frame, textvariable=self.budget_field_var, values=list(BUDGET_FIELDS), state="readonly", width=10)
+        self.budget_button = ttk.Button(self.budget_frame, text="Résoudre", command=self.solve_budget)
+        self.budget_result_var = tk.StringVar(value="")
+        self.budget_result_label = ttk.Label(self.preview_frame, textvariable=self.budget_result_var, anchor="w", justify=tk.LEFT, wraplength=480)
+
+        # --- Cadre des boutons ---
+        self.button_frame = ttk.Frame(self.scrollable_frame)
+        self.generate_button = ttk.Button(self.button_frame, text="Générer/MàJ Matrice", command=self._generate_matrix_wrapper, style="Accent.TButton", image=self.generate_icon, compound=tk.LEFT)
+        self.clear_button = ttk.Button(self.button_frame, text="Effacer", command=self.clear_quantities, image=self.clear_icon, compound=tk.LEFT)
+        self.quit_button = ttk.Button(self.button_frame, text="Quitter", command=self.quit_app, image=self.quit_icon, compound=tk.LEFT)
+
+        # --- Cadre de progression ---
+        self.progress_frame = ttk.Frame(self.scrollable_frame)
+        self.progress_var = tk.DoubleVar(value=0.0)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, variable=self.progress_var, maximum=100, mode="determinate")
+        self.status_var = tk.StringVar(value="")
+        self.status_label = ttk.Label(self.progress_frame, textvariable=self.status_var, anchor="w")
+        self.cancel_button = ttk.Button(self.progress_frame, text="Annuler", command=self.cancel_job, state=tk.DISABLED)
+
+    def _layout_widgets(self):
+        # Configure le 'scrollable_frame' pour qu'il s'étende horizontalement
+        self.scrollable_frame.columnconfigure(0, weight=1)
+
+        self.title_label.grid(row=0, column=0, pady=(0, 5), sticky="ew")
+        self.intro_label.grid(row=1, column=0, pady=(0, 15), sticky="ew")
+
+        # Layout paramètres
+        self.params_frame.grid(row=2, column=0, pady=5, sticky="ew")
+        self.params_frame.columnconfigure(1, weight=1)
+        labels_params = ["Niveau de l'étude:", "Nombre de patients:", "Nb total visites/patient:", "Type de centre:", "Durée étude (années):", "Nombre de pages CRF:"]
+        widgets_params = [self.niveau_combo, self.patients_entry, self.visites_entry, self.centre_combo, self.duree_entry, self.pages_crf_entry]
+        for i, (label_text, widget) in enumerate(zip(labels_params, widgets_params)):
+            ttk.Label(self.params_frame, text=label_text).grid(row=i, column=0, sticky=tk.W, padx=5, pady=2)
+            widget.grid(row=i, column=1, sticky=tk.EW, padx=5, pady=2)
+
+        # Layout estimation infirmier
+        self.infirmier_frame.grid(row=3, column=0, pady=10, sticky="ew")
+        self.infirmier_frame.columnconfigure(1, weight=1)
+        labels_infirmier = ["Nb prélèvements sanguins:", "Nb prélèvements d'urine:", "Nb mesures signes vitaux:", "Nb injections traitement:", "Nb pose/retrait perfusion:", "Nb pose/retrait cathéter:", "Nb points PK/PD:"]
+        widgets_infirmier = [self.prelevements_sang_entry, self.prelevements_urine_entry, self.signes_vitaux_entry, self.injections_entry, self.perfusions_entry, self.catheters_entry, self.pk_pd_entry]
+        for i, (label_text, widget) in enumerate(zip(labels_infirmier, widgets_infirmier)):
+            ttk.Label(self.infirmier_frame, text=label_text).grid(row=i, column=0, sticky=tk.W, padx=5, pady=2)
+            widget.grid(row=i, column=1, sticky=tk.EW, padx=5, pady=2)
+
+        # Layout options
+        self.options_frame.grid(row=4, column=0, pady=5, sticky="ew")
+        self.options_frame.columnconfigure(1, weight=1)
+        labels_options = ["Nb avenants:", "Nb visites monitoring:", "Nb auto-questionnaires:", "Format auto-questionnaire:"]
+        widgets_options = [self.avenants_entry, self.monitoring_entry, self.auto_q_count_entry, self.auto_q_format_combo]
+        for i, (label_text, widget) in enumerate(zip(labels_options, widgets_options)):
+            ttk.Label(self.options_frame, text=label_text).grid(row=i, column=0, sticky=tk.W, padx=5, pady=2)
+            widget.grid(row=i, column=1, sticky=tk.EW, padx=5, pady=2)
+        self.personnel_check.grid(row=len(labels_options), column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        self.fast_save_check.grid(row=len(labels_options) + 1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=(0, 5))
+        self.profile_check.grid(row=len(labels_options) + 2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=(0, 5))
+        self.record_check.grid(row=len(labels_options) + 3, column=0, columnspan=2, sticky=tk.W, padx=5, pady=(0, 5))
+        self.schedule_check.grid(row=len(labels_options) + 4, column=0, columnspan=2, sticky=tk.W, padx=5, pady=(0, 5))
+        self.incremental_check.grid(row=len(labels_options) + 5, column=0, columnspan=2, sticky=tk.W, padx=5, pady=(0, 5))
+
+        # Layout aperçu
+        self.preview_frame.grid(row=5, column=0, pady=5, sticky="ew")
+        self.preview_frame.columnconfigure(1, weight=1)
+        self.preview_template_button.grid(row=0, column=0, padx=5, pady=2, sticky=tk.W)
+        self.preview_template_label.grid(row=0, column=1, padx=5, pady=2, sticky=tk.EW)
+        self.preview_tree.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky=tk.EW)
+        self.preview_total_label.grid(row=2, column=0, columnspan=2, padx=5, sticky=tk.EW)
+        self.preview_status_label.grid(row=3, column=0, columnspan=2, padx=5, sticky=tk.EW)
+        self.budget_frame.grid(row=4, column=0, columnspan=2, padx=5, pady=(10, 0), sticky=tk.EW)
+        ttk.Label(self.budget_frame, text="Budget cible (€):").grid(row=0, column=0, sticky=tk.W)
+        self.budget_entry.grid(row=0, column=1, padx=5)
+        ttk.Label(self.budget_frame, text="nombre max. de").grid(row=0, column=2, padx=(5, 0))
+        self.budget_field_combo.grid(row=0, column=3, padx=5)
+        self.budget_button.grid(row=0, column=4, padx=5)
+        self.budget_result_label.grid(row=5, column=0, columnspan=2, padx=5, sticky=tk.EW)
+
+        # Layout boutons
+        self.button_frame.grid(row=6, column=0, pady=(20, 0), sticky="ew")
+        self.button_frame.columnconfigure((0, 2), weight=1)
+        self.generate_button.grid(row=0, column=0, padx=5, sticky="e")
+        self.clear_button.grid(row=0, column=1, padx=5)
+        self.quit_button.grid(row=0, column=2, padx=5, sticky="w")
+
+        # Layout progression
+        self.progress_frame.grid(row=7, column=0, pady=(15, 0), sticky="ew")
+        self.progress_frame.columnconfigure(0, weight=1)
+        self.progress_bar.grid(row=0, column=0, padx=5, sticky="ew")
+        self.cancel_button.grid(row=0, column=1, padx=5)
+        self.status_label.grid(row=1, column=0, columnspan=2, padx=5, sticky="ew")
+    
+    def _raw_study_params(self):
+        return {name: getattr(self, name + "_var").get() for name in CHAMPS_ETUDE}
+
+    def validate_inputs(self):
+        errors = validate_study_params(self._raw_study_params(), form=True)
+        if errors:
+            messagebox.showerror("Erreur de saisie", "Veuillez corriger les erreurs suivantes:\n- " + "\n- ".join(errors))
+            return False
+        return True
+
+    def _generate_matrix_wrapper(self):
+        if not self.validate_inputs(): return
+        source_file = filedialog.askopenfilename(title="Sélectionner le fichier matrice Excel modèle (.xlsm)", filetypes=[("Fichiers Excel", "*.xlsm")],
+                                                 **self._template_dialog_options())
+        if not source_file: return
+        self._template_file = source_file
+        output_file = filedialog.asksaveasfilename(title="Enregistrer la matrice remplie sous (.xlsm)", defaultextension=".xlsm", filetypes=[("Fichiers Excel", "*.xlsm")], initialfile="matrice_remplie.xlsm")
+        if not output_file: return
+        self.generate_matrix_logic(source_file, output_file)
+
+    def _template_dialog_options(self):
+        # Le dernier modèle utilisé est proposé par défaut
+        if not self._template_file: return {}
+        return {"initialdir": os.path.dirname(self._template_file), "initialfile": os.path.basename(self._template_file)}
+
+    def generate_matrix_logic(self, source_file, output_file):
+        # Paramètres lus ici : les variables Tk ne doivent pas être lues depuis le thread de travail
+        params, fast_save = parse_study_params(self._raw_study_params()), self.fast_save_var.get()
+        results_db = self.results_db if self.record_var.get() else None
+        schedule_file = schedule_file_for(output_file) if self.schedule_var.get() else None
+        incremental = self.incremental_var.get()
+        def work(progress):
+            records, generated = [], {}
+            def on_results(model, results, total_general):
+                generated.update(model=model, results=results)
+                if results_db: records.append(study_record(None, output_file, params, model, results, total_general))
+            if incremental:
+                report = update_matrix(source_file, output_file, params, fast_save=fast_save, progress=progress, on_results=on_results)
+                total_general = report["total_general"]
+            else:
+                report = None
+                total_general = generate_matrix_logic(source_file, output_file, params, fast_save=fast_save, progress=progress, on_results=on_results,
+                                                     session=self._templates)
+            if records: record_run(results_db, "generation", source_file, records)
+            schedule = None
+            if schedule_file:
+                # La matrice est déjà enregistrée (et la base écrite) : une annulation ne porte plus que sur l'échéancier
+                try: schedule = write_schedule(generated["model"], params, schedule_file, generated["results"], progress)
+                except OperationCancelled: schedule = {"annule": True}
+            return total_general, schedule, report
+        def on_success(outcome):
+            _, schedule, report = outcome
+            message = f"Matrice générée avec succès et enregistrée dans {os.path.basename(output_file)}."
+            if report: message += "\n\n" + "\n".join(format_matrix_changes(report, max_lines=15))
+            if schedule and schedule.get("annule"):
+                self.status_var.set("Matrice enregistrée, échéancier annulé.")
+                messagebox.showwarning("Échéancier", f"{message}\nL'échéancier a été annulé : il n'a pas été écrit.")
+                return
+            if schedule:
+                message += f"\nÉchéancier : {os.path.basename(schedule['fichier'])} ({schedule['lignes']} lignes)."
+                if schedule["ecarts"]:
+                    messagebox.showwarning("Échéancier", f"{message}\nÉcart de rapprochement avec la matrice (lignes {', '.join(map(str, schedule['ecarts']))}) : "
+                                                          f"voir {os.path.basename(schedule['rapprochement'])}.")
+                    return
+            messagebox.showinfo("Succès", message)
+        def on_error(e):
+            if isinstance(e, KeyError): messagebox.showerror("Erreur", f"La feuille '{SHEET_NAME}' est introuvable dans le fichier sélectionné.")
+            else: messagebox.showerror("Erreur", f"Une erreur est survenue lors de la génération de la matrice :\n{type(e).__name__}: {e}")
+        self._start_job(
+            self._with_profiling("generation", work, modele=source_file, sortie=output_file, enregistrement_rapide=fast_save,
+                                incrementale=incremental),
+            on_success,
+            on_error)
+
+    def clear_quantities(self):
+        target_file = filedialog.askopenfilename(title="Sélectionner le fichier matrice Excel à effacer (.xlsm)", filetypes=[("Fichiers Excel", "*.xlsm")])
+        if not target_file: return
+        if not messagebox.askyesno("Confirmation", "Voulez-vous vraiment effacer toutes les quantités et calculs (colonnes E, F, G) et le total général de ce fichier ?\nLe fichier sera modifié directement."): return
+        fast_save = self.fast_save_var.get()
+        def on_success(count_cleared):
+            if count_cleared is not None: messagebox.showinfo("Succès", f"{count_cleared} cellule(s) ont été effacées dans {os.path.basename(target_file)}.")
+            else: messagebox.showerror("Erreur", "Impossible de localiser la plage de données.")
+        def on_error(e):
+            if isinstance(e, KeyError): messagebox.showerror("Erreur", f"La feuille '{SHEET_NAME}' est introuvable.")
+            else: messagebox.showerror("Erreur", f"Une erreur est survenue :\n{type(e).__name__}: {e}")
+        self._start_job(self._with_profiling("effacement", lambda progress: clear_matrix(target_file, fast_save=fast_save, progress=progress),
+                                             fichier=target_file, enregistrement_rapide=fast_save), on_success, on_error)
+
+    def _with_profiling(self, operation, work, **context):
+        # Case "Diagnostic" cochée : l'opération est profilée et ajoutée au journal PROFILE_LOG_FILE
+        if not self.profile_var.get(): return work
+        def profiled_work(progress):
+            with profile_operation(operation, **context) as profiler:
+                return work(profiler.progress(progress))
+        return profiled_work
+
+    def _start_job(self, work, on_success, on_error):
+        # work(progress) tourne dans un thread ; on_success / on_error sont appelés dans la boucle Tk
+        if self._job_thread is not None:
+            self.status_var.set("Un traitement est déjà en cours : attendez la fin ou annulez-le.")
+            return
+        self._cancel_event.clear()
+        self._set_busy(True)
+        def progress(phase, done, total):
+            if self._cancel_event.is_set(): raise OperationCancelled()
+            self._job_queue.put(("progress", phase, done, total))
+        def run():
+            try: self._job_queue.put(("ok", work(progress)))
+            except OperationCancelled: self._job_queue.put(("cancelled", None))
+            except Exception as e:
+                traceback.print_exc()
+                self._job_queue.put(("error", e))
+        self._job_callbacks = (on_success, on_error)
+        self._job_thread = threading.Thread(target=run, daemon=True)
+        self._job_thread.start()
+        self.master.after(JOB_POLL_MS, self._poll_job)
+
+    def _poll_job(self):
+        progress, finished = None, None
+        try:
+            while True:
+                message = self._job_queue.get_nowait()
+                if message[0] == "progress": progress = message
+                else: finished = message
+        except queue.Empty: pass
+        if progress is not None: self._show_progress(*progress[1:])
+        if finished is None:
+            self.master.after(JOB_POLL_MS, self._poll_job)
+            return
+        self._job_thread.join()
+        self._job_thread = None
+        self._set_busy(False)
+        if self._quit_requested:
+            self.master.quit()
+            return
+        status, result = finished
+        on_success, on_error = self._job_callbacks
+        if status == "ok":
+            self.progress_var.set(100)
+            self.status_var.set("Terminé.")
+            on_success(result)
+        elif status == "cancelled":
+            self.progress_var.set(0)
+            self.status_var.set("Opération annulée, aucun fichier n'a été modifié.")
+        else:
+            self.status_var.set("Échec de l'opération.")
+            on_error(result)
+
+    def _show_progress(self, phase, done, total):
+        # Chaque phase occupe une part égale de la barre, avancée ligne par ligne quand total est connu
+        phases = list(PROGRESS_PHASES)
+        fraction = done / total if total else 0.0
+        self.progress_var.set(100.0 * (phases.index(phase) + fraction) / len(phases))
+        self.status_var.set(f"{PROGRESS_PHASES[phase]}…" + (f" {done}/{total}" if total > 1 else ""))
+
+    def _set_busy(self, busy):
+        state = tk.DISABLED if busy else tk.NORMAL
+        # Tout bouton qui lance un traitement (ou lit le modèle de l'aperçu) est inactif pendant un traitement
+        for button in (self.generate_button, self.clear_button, self.preview_template_button, self.budget_button):
+            button.configure(state=state)
+        self.cancel_button.configure(state=tk.NORMAL if busy else tk.DISABLED)
+        if busy:
+            self.progress_var.set(0)
+            self.status_var.set("")
+
+    def choose_preview_template(self):
+        source_file = filedialog.askopenfilename(title="Sélectionner le fichier matrice Excel modèle (.xlsm) pour l'aperçu", filetypes=[("Fichiers Excel", "*.xlsm")],
+                                                 **self._template_dialog_options())
+        if not source_file: return
+        self._template_file = source_file
+        def on_success(model):
+            self._preview = MatrixPreview(model)
+            self.preview_template_var.set(os.path.basename(source_file))
+            self.preview_tree.delete(*self.preview_tree.get_children())
+            for i, (title, lines, _) in enumerate(self._preview.sections):
+                self.preview_tree.insert("", tk.END, iid=str(i), text=f"{title} ({len(lines)} ligne(s))", values=("–",))
+            self._update_preview()
+        def on_error(e):
+            if isinstance(e, KeyError): messagebox.showerror("Erreur", f"La feuille '{SHEET_NAME}' est introuvable dans le fichier sélectionné.")
+            else: messagebox.showerror("Erreur", f"Impossible d'analyser le modèle :\n{type(e).__name__}: {e}")
+        self._start_job(lambda progress: load_template_model(source_file), on_success, on_error)
+
+    def _schedule_preview(self, *args):
+        if self._preview is None: return
+        if self._preview_after is not None: self.master.after_cancel(self._preview_after)
+        self._preview_after = self.master.after(PREVIEW_DELAY_MS, self._update_preview)
+
+    def _update_preview(self):
+        # Aucun accès fichier : le modèle est en mémoire, seules les lignes touchées sont recalculées
+        self._preview_after = None
+        raw = self._raw_study_params()
+        errors = validate_study_params(raw, form=True)
+        if errors:
+            self.preview_status_var.set("Aperçu en attente d'une saisie complète : " + " ".join(errors))
+            return
+        count, sections = self._preview.update(parse_study_params(raw))
+        for i in sections:
+            self.preview_tree.set(str(i), "total", format_euros(self._preview.sections[i][2]))
+        self.preview_total_var.set(f"TOTAL GÉNÉRAL : {format_euros(self._preview.total_general)} €")
+        self.preview_status_var.set(f"{count} ligne(s) recalculée(s).")
+
+    def solve_budget(self):
+        # Modèle de l'aperçu, déjà en mémoire : réponse immédiate, sans accès fichier
+        if self._preview is None:
+            messagebox.showinfo("Budget cible", "Choisissez d'abord le modèle de l'aperçu des totaux.")
+            return
+        field = self.budget_field_var.get()
+        try: budget = parse_budget_amount(self.budget_var.get())
+        except ValueError as e:
+            messagebox.showerror("Erreur de saisie", str(e))
+            return
+        raw = self._raw_study_params()
+        errors = validate_budget_params(raw, field, form=True)
+        if errors:
+            messagebox.showerror("Erreur de saisie", "Veuillez corriger les erreurs suivantes:\n- " + "\n- ".join(errors))
+            return
+        solution = solve_budget(self._preview.model, parse_budget_params(raw, field), budget, field)
+        self.budget_result_var.set("\n".join(format_budget_solution(solution, max_lines=8)))
+
+    def cancel_job(self):
+        if self._job_thread is None: return
+        self._cancel_event.set()
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.status_var.set("Annulation en cours…")
+
+    def quit_app(self):
+        # Un traitement en cours est d'abord annulé pour ne pas laisser de fichier temporaire
+        if self._job_thread is None:
+            self.master.quit()
+            return
+        self._quit_requested = True
+        self.cancel_job()
@@ -0,0 +1,257 @@
+# Service local de devis (HTTP/JSON sur asyncio, bibliothèque standard uniquement). Le modèle .xlsm
+# est lu et analysé une seule fois au démarrage. Les totaux sont calculés directement dans la boucle
+# d'événements (quelques dixièmes de milliseconde par devis). Les matrices .xlsm remplies sont
+# produites par un groupe borné de processus qui gardent chacun le classeur modèle ouvert en
+# mémoire : la sérialisation openpyxl ne bloque jamais la boucle.
+#
+#   GET  /sante    -> {"statut": "ok", "modele": ..., "lignes": ...}
+#   POST /devis    -> totaux par ligne, par section et total général (JSON)
+#   POST /matrice  -> matrice remplie (.xlsm)
+#   POST /budget   -> plus grand nombre de patients (ou de visites) tenant dans un budget (JSON)
+#
+# Le corps des requêtes POST est un objet JSON avec les champs du formulaire (CHAMPS_ETUDE), par
+# exemple {"niveau": "2", "patients": 25, "visites": 8, "centre": "Associé", "duree": 3}. Pour /budget,
+# le même objet avec "budget" (montant) et "resoudre" ("patients" par défaut, ou "visites"), sans le
+# champ résolu.
+import asyncio
+import io
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from matrice_core import (
+    BUDGET_FIELDS, SHEET_NAME, MatrixPreview, apply_cell_updates, compute_matrix, load_template_model, load_workbook,
+    matrix_cell_updates, parse_budget_amount, parse_budget_params, parse_study_params, patch_xlsm_cells, restore_cells,
+    snapshot_cells, solve_budget, validate_budget_params, validate_study_params,
+)
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_QUEUE_PER_WORKER = 4  # matrices en attente admises par processus, au-delà : 503
+MAX_BODY_BYTES = 1 << 20
+MAX_HEADERS = 100
+KEEP_ALIVE_SECONDS = 30
+XLSM_CONTENT_TYPE = "application/vnd.ms-excel.sheet.macroEnabled.12"
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class ServiceError(Exception):
+    # Erreur renvoyée au client : code HTTP et message (JSON {"erreur": ..., "details": [...]})
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status, self.details = status, details
+
+
+# --- PROCESSUS DE GÉNÉRATION ---
+# Chaque processus reçoit le contenu du modèle à son démarrage et le garde ouvert : entre deux
+# matrices, seules les cellules écrites sont remises dans leur état d'origine (comme pour les
+# variantes). En enregistrement rapide, l'archive est réécrite d'un contenu en mémoire à l'autre.
+_worker_template = None
+
+def _init_worker(template_bytes, fast_save):
+    global _worker_template
+    if fast_save:
+        _worker_template = {"bytes": template_bytes}
+    else:
+        workbook = load_workbook(io.BytesIO(template_bytes), keep_vba=True)
+        _worker_template = {"workbook": workbook, "sheet": workbook[SHEET_NAME], "saved": {}}
+
+def _render_matrix(updates):
+    # Renvoie le contenu du .xlsm rempli avec les mises à jour données
+    if "bytes" in _worker_template:
+        buffer = io.BytesIO()
+        patch_xlsm_cells(io.BytesIO(_worker_template["bytes"]), buffer, updates)
+        return buffer.getvalue()
+    sheet, saved = _worker_template["sheet"], _worker_template["saved"]
+    snapshot_cells(sheet, updates, saved)
+    try:
+        apply_cell_updates(sheet, updates)
+        buffer = io.BytesIO()
+        _worker_template["workbook"].save(buffer)
+        return buffer.getvalue()
+    finally:
+        restore_cells(sheet, saved)
+
+
+# --- SERVICE ---
+class QuoteService:
+    def __init__(self, template_file, workers=None, fast_save=False):
+        self.template_file = template_file
+        with open(template_file, "rb") as f: template_bytes = f.read()
+        self.model = load_template_model(template_file)
+        preview = MatrixPreview(self.model)
+        self.section_titles = [title for title, _, _ in preview.sections]
+        self.section_index = preview.section_index
+        self.designations = {line["row"]: line["designation"] for line in self.model["lines"]}
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers * SERVICE_QUEUE_PER_WORKER
+        self.pending = 0
+        self._worker_args = (template_bytes, fast_save)
+        self._start_executor()
+
+    def _start_executor(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self._worker_args)
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def quote(self, params):
+        # Renvoie (résultats de compute_matrix, total général, document JSON du devis)
+        results, total_general = compute_matrix(self.model, params)
+        sections = [0.0] * len(self.section_titles)
+        lines = []
+        for row, quantity, total_ligne, total_centre, is_highlight_level in results:
+            sections[self.section_index[row]] += total_centre
+            lines.append({"ligne": row, "designation": self.designations[row], "quantite": quantity,
+                          "total_ligne": total_ligne, "total_centre": total_centre, "niveau": is_highlight_level})
+        return results, total_general, {
+            "total_general": total_general,
+            "sections": [{"titre": title, "total": total} for title, total in zip(self.section_titles, sections)],
+            "lignes": lines,
+        }
+
+    async def render(self, params):
+        # Matrice remplie, produite par le groupe de processus (file d'attente bornée)
+        if self.pending >= self.max_pending:
+            raise ServiceError(503, "Service occupé : trop de matrices en attente, réessayer plus tard.")
+        results, total_general, _ = self.quote(params)
+        updates = matrix_cell_updates(self.model, params, results, total_general)
+        executor = self.executor
+        self.pending += 1
+        try:
+            content = await asyncio.get_running_loop().run_in_executor(executor, _render_matrix, updates)
+        except BrokenProcessPool:
+            # Un processus s'est arrêté brutalement (mémoire, plantage) : le groupe, inutilisable, est recréé
+            # une seule fois pour les requêtes suivantes ; celles qui y étaient en cours sont refusées
+            if self.executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._start_executor()
+            raise ServiceError(503, "Processus de génération arrêté brutalement : groupe redémarré, réessayer.")
+        finally:
+            self.pending -= 1
+        return content, total_general
+
+    def solve(self, raw):
+        # Calcul direct dans la boucle : deux évaluations du modèle et une confirmation
+        field = str(raw.get("resoudre") or "patients")
+        if field not in BUDGET_FIELDS: raise ServiceError(400, f"'resoudre' invalide : {field} ({', '.join(BUDGET_FIELDS)}).")
+        try: budget = parse_budget_amount(raw.get("budget", ""))
+        except ValueError as e: raise ServiceError(400, str(e))
+        study = {name: value for name, value in raw.items() if name not in ("budget", "resoudre")}
+        errors = validate_budget_params(study, field)
+        if errors: raise ServiceError(400, "Paramètres de l'étude invalides.", errors)
+        solution = solve_budget(self.model, parse_budget_params(study, field), budget, field)
+        solution["lignes"] = [{"ligne": row, "designation": designation, "fixe": fixed, "par_unite": per_unit, "total_centre": total}
+                              for row, designation, fixed, per_unit, total in solution["lignes"]]
+        return solution
+
+    async def dispatch(self, method, path, body):
+        # Renvoie (code HTTP, type de contenu, contenu, en-têtes supplémentaires)
+        path = path.split("?", 1)[0]
+        if path == "/sante":
+            if method != "GET": raise ServiceError(405, "Méthode non autorisée (GET attendu).")
+            return _json_response(200, {"statut": "ok", "modele": os.path.basename(self.template_file), "lignes": len(self.model["lines"]),
+                                        "processus": self.workers, "matrices_en_attente": self.pending})
+        if path not in ("/devis", "/matrice", "/budget"): raise ServiceError(404, f"Chemin inconnu : {path}")
+        if method != "POST": raise ServiceError(405, "Méthode non autorisée (POST attendu).")
+        if path == "/budget":
+            return _json_response(200, self.solve(_json_body(body)))
+        params = _study_params(_json_body(body))
+        if path == "/devis":
+            return _json_response(200, self.quote(params)[2])
+        content, total_general = await self.render(params)
+        return 200, XLSM_CONTENT_TYPE, content, {"Content-Disposition": 'attachment; filename="matrice_remplie.xlsm"',
+                                                 "X-Total-General": repr(total_general)}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE_SECONDS)
+                except ServiceError as e:
+                    writer.write(_http_response(*_error_response(e), keep_alive=False))
+                    break
+                if request is None: break
+                method, path, headers, body = request
+                try:
+                    response = await self.dispatch(method, path, body)
+                except ServiceError as e:
+                    response = _error_response(e)
+                except Exception as e:
+                    traceback.print_exc()
+                    response = _error_response(ServiceError(500, f"{type(e).__name__}: {e}"))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(_http_response(*response, keep_alive=keep_alive))
+                await writer.drain()
+                if not keep_alive: break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # client parti, connexion inactive ou arrêt du service
+        finally:
+            writer.close()
+
+
+def _json_body(body):
+    try: raw = json.loads(body.decode("utf-8") or "{}")
+    except (UnicodeDecodeError, ValueError) as e: raise ServiceError(400, f"Corps JSON invalide : {e}")
+    if not isinstance(raw, dict): raise ServiceError(400, "Le corps doit être un objet JSON (champs de l'étude).")
+    return raw
+
+def _study_params(raw):
+    errors = validate_study_params(raw)
+    if errors: raise ServiceError(400, "Paramètres de l'étude invalides.", errors)
+    return parse_study_params(raw)
+
+async def _read_request(reader):
+    # Renvoie (méthode, chemin, en-têtes en minuscules, corps) ou None en fin de connexion
+    request_line = await reader.readline()
+    if not request_line.strip(): return None
+    try: method, path, _ = request_line.decode("latin-1").split()
+    except ValueError: raise ServiceError(400, "Ligne de requête invalide.")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""): break
+        if len(headers) >= MAX_HEADERS: raise ServiceError(400, "Trop d'en-têtes.")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise ServiceError(411, "Transfer-Encoding chunked non pris en charge : indiquer Content-Length.")
+    try: length = int(headers.get("content-length", "0"))
+    except ValueError: raise ServiceError(400, "Content-Length invalide.")
+    if length > MAX_BODY_BYTES: raise ServiceError(413, f"Corps trop volumineux (plus de {MAX_BODY_BYTES} octets).")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), path, headers, body
+
+def _json_response(status, document):
+    return status, "application/json; charset=utf-8", json.dumps(document, ensure_ascii=False).encode("utf-8"), {}
+
+def _error_response(error):
+    document = {"erreur": str(error)}
+    if error.details: document["details"] = error.details
+    return _json_response(error.status, document)
+
+def _http_response(status, content_type, content, extra_headers, keep_alive=True):
+    headers = {"Content-Type": content_type, "Content-Length": str(len(content)),
+               "Connection": "keep-alive" if keep_alive else "close", **extra_headers}
+    if status == 503: headers["Retry-After"] = "1"
+    head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return head.encode("latin-1") + b"\r\n" + content
+
+
+def run_service(template_file, host=SERVICE_HOST, port=SERVICE_PORT, workers=None, fast_save=False):
+    async def serve():
+        service = QuoteService(template_file, workers=workers, fast_save=fast_save)
+        try:
+            server = await service.start(host, port)
+            print(f"Service de devis : http://{host}:{server.sockets[0].getsockname()[1]} "
+                  f"(modèle {os.path.basename(template_file)}, {len(service.model['lines'])} lignes, {service.workers} processus)")
+            async with server: await server.serve_forever()
+        finally:
+            service.close()
+    try: asyncio.run(serve())
+    except KeyboardInterrupt: pass